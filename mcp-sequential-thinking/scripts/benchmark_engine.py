@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+ThinkingEngine throughput and latency benchmark for MCP Sequential Thinking
+
+Runs campaign patterns through the engine with zero-sleep stub handlers, so the
+numbers measure engine overhead only: patterns/sec started, steps/sec processed,
+per-step scheduling overhead, get_pattern_status latency and memory per active
+pattern. Results are written as JSON for comparison between releases.
+"""
+
+import asyncio
+import gc
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+import structlog
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from mcp_sequential_thinking import __version__  # noqa: E402
+from mcp_sequential_thinking.thinking import (  # noqa: E402
+    ThinkingContext,
+    ThinkingEngine,
+    ThinkingStage,
+    WhatsAppCampaignThinking,
+)
+
+
+async def stub_handler(step) -> Dict[str, Any]:
+    """Zero-cost stage handler"""
+    return {"stage": step.stage.value}
+
+
+class InstrumentedEngine(ThinkingEngine):
+    """Engine that records the wall time spent around each step"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.step_overheads: List[float] = []
+        for stage in ThinkingStage:
+            self.register_stage_handler(stage, stub_handler, max_concurrency=1024)
+
+    async def process_thinking_step(self, pattern_id, step):
+        started = time.perf_counter()
+        try:
+            return await super().process_thinking_step(pattern_id, step)
+        finally:
+            self.step_overheads.append(time.perf_counter() - started)
+
+    @property
+    def executing_patterns(self) -> int:
+        return len(self._executing_patterns)
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a sample list"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def make_context(index: int) -> ThinkingContext:
+    return ThinkingContext(
+        campaign_id=f"benchmark_{index}",
+        target_audience_size=650,
+        roi_target=2250.0,
+        budget_limit=5000.0,
+        time_constraints={},
+    )
+
+
+async def measure_throughput(
+    pattern_count: int, workers: Optional[int] = None
+) -> Dict[str, Any]:
+    """Start ``pattern_count`` patterns, then run them all to completion
+
+    Without ``workers`` the pool has one worker per pattern, so every pattern
+    executes at once.
+    """
+    workers = workers or pattern_count
+    engine = InstrumentedEngine(
+        max_concurrent_patterns=workers,
+        max_queue_size=pattern_count,
+        max_completed_patterns=pattern_count,
+    )
+    patterns = [
+        WhatsAppCampaignThinking.create(make_context(index), engine.clock.now())
+        for index in range(pattern_count)
+    ]
+
+    started = time.perf_counter()
+    pattern_ids = [await engine.start_thinking(pattern) for pattern in patterns]
+    start_seconds = time.perf_counter() - started
+
+    # Status latency while every pattern is still queued
+    queued_latencies = []
+    for pattern_id in pattern_ids:
+        call_started = time.perf_counter()
+        await engine.get_pattern_status(pattern_id)
+        queued_latencies.append(time.perf_counter() - call_started)
+
+    # ...and while they execute, a batch of calls on every turn of the event loop
+    executing_latencies: List[float] = []
+    peak_executing = 0
+
+    async def sample_while_executing(batch_size: int = 16) -> None:
+        nonlocal peak_executing
+        position = 0
+        while True:
+            await asyncio.sleep(0)
+            executing = engine.executing_patterns
+            if not executing:
+                continue
+            peak_executing = max(peak_executing, executing)
+            for _ in range(batch_size):
+                pattern_id = pattern_ids[position % pattern_count]
+                position += 1
+                call_started = time.perf_counter()
+                await engine.get_pattern_status(pattern_id)
+                executing_latencies.append(time.perf_counter() - call_started)
+
+    sampler = asyncio.create_task(sample_while_executing())
+    started = time.perf_counter()
+    await engine.shutdown(drain=True)
+    run_seconds = time.perf_counter() - started
+    sampler.cancel()
+    await asyncio.gather(sampler, return_exceptions=True)
+
+    steps = len(engine.step_overheads)
+    return {
+        "workers": workers,
+        "peak_executing_patterns": peak_executing,
+        "patterns_started_per_sec": round(pattern_count / start_seconds, 1),
+        "steps_processed": steps,
+        "steps_processed_per_sec": round(steps / run_seconds, 1),
+        "step_overhead_seconds": {
+            "p50": percentile(engine.step_overheads, 0.50),
+            "p99": percentile(engine.step_overheads, 0.99),
+            "mean": statistics.fmean(engine.step_overheads) if steps else 0.0,
+        },
+        "get_pattern_status_seconds": {
+            "queued": {
+                "p50": percentile(queued_latencies, 0.50),
+                "p99": percentile(queued_latencies, 0.99),
+            },
+            "executing": {
+                "samples": len(executing_latencies),
+                "p50": percentile(executing_latencies, 0.50),
+                "p99": percentile(executing_latencies, 0.99),
+            },
+        },
+    }
+
+
+async def measure_memory(pattern_count: int) -> Dict[str, Any]:
+    """Traced memory held by ``pattern_count`` started but not yet executed patterns"""
+    engine = InstrumentedEngine(max_queue_size=pattern_count)
+    WhatsAppCampaignThinking.compiled_plan()
+
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+
+    for index in range(pattern_count):
+        await engine.start_thinking(
+            WhatsAppCampaignThinking.create(make_context(index), engine.clock.now())
+        )
+
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    await engine.shutdown()
+    used = current - baseline
+    return {
+        "bytes_total": used,
+        "bytes_per_active_pattern": round(used / pattern_count, 1),
+    }
+
+
+async def run_benchmarks(
+    scales: List[int], workers: Optional[int] = None
+) -> Dict[str, Any]:
+    results = []
+    for pattern_count in scales:
+        result = {"concurrent_campaigns": pattern_count}
+        result.update(await measure_throughput(pattern_count, workers))
+        result["memory"] = await measure_memory(pattern_count)
+        results.append(result)
+
+    return {
+        "benchmark": "thinking_engine",
+        "version": __version__,
+        "python": platform.python_version(),
+        "recorded_at": datetime.now().isoformat(),
+        "results": results,
+    }
+
+
+def main():
+    """Run the benchmark and write JSON results"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="ThinkingEngine throughput and latency benchmark"
+    )
+    parser.add_argument(
+        "--scales",
+        default="10,1000,10000",
+        help="Comma-separated numbers of concurrent campaigns",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Engine worker pool size (default: one worker per campaign)",
+    )
+    parser.add_argument(
+        "--output", help="Write JSON results to this file instead of stdout"
+    )
+    args = parser.parse_args()
+
+    # Step logging would dominate the measurements
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING)
+    )
+
+    scales = [int(scale) for scale in args.scales.split(",") if scale.strip()]
+    report = json.dumps(asyncio.run(run_benchmarks(scales, args.workers)), indent=2)
+
+    if args.output:
+        Path(args.output).write_text(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Step state memory benchmark for MCP Sequential Thinking
+
+Compares the memory held by per-step ThinkingStep objects against the compact
+array-backed StepStateStore when many campaign patterns are active at once.
+"""
+
+import gc
+import json
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from mcp_sequential_thinking.clock import SystemClock  # noqa: E402
+from mcp_sequential_thinking.thinking import (  # noqa: E402
+    StepStateStore,
+    ThinkingContext,
+    ThinkingStatus,
+    WhatsAppCampaignThinking,
+)
+
+
+def measure_patterns(
+    pattern_count: int, compact: bool, executed: bool
+) -> Dict[str, Any]:
+    """Measure traced memory for ``pattern_count`` live campaign patterns"""
+    context = ThinkingContext(
+        campaign_id="benchmark",
+        target_audience_size=650,
+        roi_target=2250.0,
+        budget_limit=5000.0,
+        time_constraints={},
+    )
+    shared_result = {"benchmark": True}
+
+    # Compile the plan and create its state store outside the measured window
+    state_store = (
+        StepStateStore(WhatsAppCampaignThinking.compiled_plan(), SystemClock())
+        if compact
+        else None
+    )
+
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+
+    created_at = datetime.now()
+    patterns = [
+        WhatsAppCampaignThinking.create(context, created_at, state_store=state_store)
+        for _ in range(pattern_count)
+    ]
+
+    if executed:
+        for pattern in patterns:
+            for step in pattern.steps:
+                step.status = ThinkingStatus.IN_PROGRESS
+                step.actual_duration = timedelta(seconds=1.5)
+                step.result = shared_result
+                step.status = ThinkingStatus.COMPLETED
+
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if compact:
+        for pattern in patterns:
+            pattern.steps.release()
+
+    used = current - baseline
+    return {
+        "patterns": pattern_count,
+        "representation": "compact" if compact else "dataclass",
+        "executed": executed,
+        "bytes_total": used,
+        "bytes_per_pattern": round(used / pattern_count, 1),
+        "peak_bytes": peak - baseline,
+    }
+
+
+def main():
+    """Run the benchmark and print JSON results"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Thinking step state memory benchmark")
+    parser.add_argument(
+        "--patterns",
+        type=int,
+        default=10_000,
+        help="Number of concurrently active patterns",
+    )
+    args = parser.parse_args()
+
+    results = []
+    for executed in (False, True):
+        dataclass_run = measure_patterns(
+            args.patterns, compact=False, executed=executed
+        )
+        compact_run = measure_patterns(args.patterns, compact=True, executed=executed)
+        results.extend([dataclass_run, compact_run])
+        results.append(
+            {
+                "patterns": args.patterns,
+                "executed": executed,
+                "reduction": round(
+                    1 - compact_run["bytes_total"] / dataclass_run["bytes_total"], 3
+                ),
+            }
+        )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Offline training of the reactivation model for MCP Sequential Thinking
+
+Fits the logistic reactivation model on historical campaign outcomes and writes
+its weights as a small .npy file for REACTIVATION_MODEL_PATH. The input is a CSV
+of student profiles as they were when contacted (days_since_last_payment,
+days_since_last_access, plan_type, tenure_days and optionally monthly_frequency
+and ltv) with a 0/1 ``reactivated`` column.
+"""
+
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Any
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from mcp_sequential_thinking.segmentation_models import (  # noqa: E402
+    REACTIVATION_FEATURES,
+    ReactivationModel,
+    profile_features,
+)
+
+
+def evaluate(
+    model: ReactivationModel, features: np.ndarray, outcomes: np.ndarray
+) -> Dict[str, Any]:
+    """Accuracy and log loss of a model on held-out rows"""
+    probabilities = np.clip(model.predict_proba(features), 1e-12, 1 - 1e-12)
+    return {
+        "rows": int(len(outcomes)),
+        "accuracy": round(float(np.mean((probabilities >= 0.5) == (outcomes == 1))), 4),
+        "log_loss": round(
+            float(
+                -np.mean(
+                    outcomes * np.log(probabilities)
+                    + (1 - outcomes) * np.log(1 - probabilities)
+                )
+            ),
+            4,
+        ),
+        "base_rate": round(float(outcomes.mean()), 4),
+    }
+
+
+def main():
+    """Train on a CSV of historical outcomes and save the weights"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Train the logistic reactivation model"
+    )
+    parser.add_argument(
+        "history", help="CSV of historical profiles with a 0/1 'reactivated' column"
+    )
+    parser.add_argument("output", help="Where to write the .npy weights")
+    parser.add_argument(
+        "--l2", type=float, default=1e-3, help="L2 regularization strength"
+    )
+    parser.add_argument(
+        "--holdout",
+        type=float,
+        default=0.2,
+        help="Share of rows held out for evaluation",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    history = pd.read_csv(args.history)
+    if "reactivated" not in history.columns:
+        parser.error("history must have a 'reactivated' column")
+
+    features = profile_features(history, REACTIVATION_FEATURES)
+    outcomes = history["reactivated"].to_numpy(dtype=np.float64)
+
+    held_out = np.random.default_rng(args.seed).random(len(history)) < args.holdout
+    model = ReactivationModel.train(
+        features[~held_out], outcomes[~held_out], l2=args.l2
+    )
+    model.save(args.output)
+
+    print(
+        json.dumps(
+            {
+                "output": args.output,
+                "features": list(REACTIVATION_FEATURES),
+                "key_predictors": model.key_predictors(),
+                "training": evaluate(model, features[~held_out], outcomes[~held_out]),
+                "holdout": (
+                    evaluate(model, features[held_out], outcomes[held_out])
+                    if held_out.any()
+                    else None
+                ),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Stage Artifact Cache for Campaign Workflows
+
+This module provides the on-disk cache of workflow stage outputs. Artifacts are
+keyed by a hash of everything a stage reads plus the stage's code version, so a
+stage whose inputs are unchanged is loaded instead of recomputed. Data frames
+in a stage output are stored as Arrow IPC files and memory-mapped on load, so
+the cache needs pyarrow unless it is explicitly told to pickle them.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import pickle
+import shutil
+import uuid
+from typing import Dict, List, Any, Optional, Tuple
+import pandas as pd
+import structlog
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc  # noqa: F401  (loads pa.ipc)
+except ImportError:
+    pa = None
+
+logger = structlog.get_logger(__name__)
+
+# Stored artifact layout; bump when the files written below change shape
+ARTIFACT_FORMAT_VERSION = "3"
+
+
+class FramePlaceholder:
+    """Stands in for a data frame stored as its own file"""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+def make_key(stage: str, version: str, inputs: Dict[str, Any]) -> str:
+    """Build the artifact key of a stage run from its code version and inputs"""
+    inputs_hash = hashlib.sha256(
+        json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return hashlib.sha256(
+        f"{stage}:{version}:{ARTIFACT_FORMAT_VERSION}:{inputs_hash}".encode("utf-8")
+    ).hexdigest()
+
+
+# Content hashes by (path, size, mtime), so unchanged exports are read once per process
+_file_digests: Dict[Tuple[str, int, int], str] = {}
+
+
+def file_digest(path: str, block_size: int = 1 << 20) -> Optional[str]:
+    """SHA-256 of a file's contents, None when it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _file_digests.get(memo_key)
+    if digest is None:
+        hasher = hashlib.sha256()
+        with open(path, "rb") as handle:
+            for block in iter(lambda: handle.read(block_size), b""):
+                hasher.update(block)
+        digest = _file_digests[memo_key] = hasher.hexdigest()
+    return digest
+
+
+def split_frames(value: Any) -> Tuple[Any, Dict[str, pd.DataFrame]]:
+    """Pull the data frames out of a tuple, list or dict stage output"""
+    frames: Dict[str, pd.DataFrame] = {}
+
+    def extract(name: str, item: Any) -> Any:
+        if isinstance(item, pd.DataFrame):
+            frames[name] = item
+            return FramePlaceholder(name)
+        return item
+
+    if isinstance(value, pd.DataFrame):
+        return extract("frame", value), frames
+    if isinstance(value, (tuple, list)):
+        return (
+            type(value)(
+                extract(f"item_{position}", item) for position, item in enumerate(value)
+            ),
+            frames,
+        )
+    if isinstance(value, dict):
+        return {
+            key: extract(f"key_{position}", item)
+            for position, (key, item) in enumerate(value.items())
+        }, frames
+    return value, frames
+
+
+def join_frames(value: Any, frames: Dict[str, pd.DataFrame]) -> Any:
+    """Put loaded data frames back in place of their placeholders"""
+
+    def restore(item: Any) -> Any:
+        return frames[item.name] if isinstance(item, FramePlaceholder) else item
+
+    if isinstance(value, FramePlaceholder):
+        return restore(value)
+    if isinstance(value, (tuple, list)):
+        return type(value)(restore(item) for item in value)
+    if isinstance(value, dict):
+        return {key: restore(item) for key, item in value.items()}
+    return value
+
+
+class StageArtifactCache:
+    """Directory of stage outputs, one subdirectory per artifact key
+
+    Each artifact holds ``result.pkl`` with the output minus its data frames,
+    plus one ``<name>.arrow`` (or ``<name>.pkl`` without pyarrow) per frame.
+    Artifacts are written to a scratch directory and renamed into place, so a
+    crash never leaves a partial artifact behind.
+
+    Pickled files carry an HMAC-SHA256 over the artifact key, the file name and
+    the pickle, and are only unpickled once the signature checks out. Without an
+    explicit ``signing_key`` a random one is kept in the storage directory,
+    readable by its owner only.
+    """
+
+    SIGNING_KEY_FILE = ".signing-key"
+
+    def __init__(
+        self,
+        storage_path: str,
+        use_arrow: bool = True,
+        signing_key: Optional[bytes] = None,
+    ):
+        if use_arrow and pa is None:
+            raise ImportError(
+                "The stage artifact cache requires pyarrow "
+                "(pip install mcp-sequential-thinking[arrow])"
+            )
+        self.storage_path = storage_path
+        self.use_arrow = use_arrow
+        self.hits = 0
+        self.misses = 0
+        self.logger = structlog.get_logger(__name__)
+
+        os.makedirs(storage_path, exist_ok=True)
+        self._signing_key = signing_key or self._load_signing_key(storage_path)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (hit, output) for an artifact key"""
+        try:
+            value, frame_files = self._read_pickle(key, "result.pkl")
+            frames = {
+                name: self._read_frame(key, filename)
+                for name, filename in frame_files.items()
+            }
+        except FileNotFoundError:
+            self.misses += 1
+            return False, None
+        except Exception as e:
+            self.logger.warning(
+                "Discarding unreadable stage artifact", key=key, error=str(e)
+            )
+            self.discard(key)
+            self.misses += 1
+            return False, None
+
+        self.hits += 1
+        return True, join_frames(value, frames)
+
+    def put(self, key: str, output: Any) -> None:
+        """Store a stage output; failures are logged and leave the cache unchanged"""
+        path = self._artifact_path(key)
+        scratch = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(scratch)
+            value, frames = split_frames(output)
+            frame_files = {}
+            for name, frame in frames.items():
+                frame_files[name] = self._write_frame(key, scratch, name, frame)
+            self._write_pickle(key, scratch, "result.pkl", (value, frame_files))
+
+            try:
+                os.rename(scratch, path)
+            except OSError:
+                # Another run stored the same key first; both hold the same output
+                shutil.rmtree(scratch, ignore_errors=True)
+        except Exception as e:
+            shutil.rmtree(scratch, ignore_errors=True)
+            self.logger.warning(
+                "Failed to persist stage artifact", key=key, error=str(e)
+            )
+
+    def discard(self, key: str) -> None:
+        shutil.rmtree(self._artifact_path(key), ignore_errors=True)
+
+    def clear(self) -> None:
+        """Drop every stored artifact"""
+        for entry in self.keys():
+            shutil.rmtree(os.path.join(self.storage_path, entry), ignore_errors=True)
+
+    def keys(self) -> List[str]:
+        return [
+            entry
+            for entry in os.listdir(self.storage_path)
+            if not entry.endswith(".tmp") and entry != self.SIGNING_KEY_FILE
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and storage format"""
+        lookups = self.hits + self.misses
+        return {
+            "artifacts": len(self.keys()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "format": "arrow" if self.use_arrow else "pickle",
+        }
+
+    def _artifact_path(self, key: str) -> str:
+        return os.path.join(self.storage_path, key)
+
+    @classmethod
+    def _load_signing_key(cls, storage_path: str) -> bytes:
+        """Read the directory's signing key, creating an owner-only one if missing"""
+        path = os.path.join(storage_path, cls.SIGNING_KEY_FILE)
+        try:
+            descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(path, "rb") as handle:
+                return handle.read()
+
+        signing_key = os.urandom(32)
+        with os.fdopen(descriptor, "wb") as handle:
+            handle.write(signing_key)
+        return signing_key
+
+    def _signature(self, key: str, filename: str, payload: bytes) -> bytes:
+        message = f"{key}/{filename}:".encode("utf-8") + payload
+        return hmac.new(self._signing_key, message, hashlib.sha256).digest()
+
+    def _write_pickle(self, key: str, directory: str, filename: str, obj: Any) -> None:
+        payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(directory, filename), "wb") as handle:
+            handle.write(self._signature(key, filename, payload))
+            handle.write(payload)
+
+    def _read_pickle(self, key: str, filename: str) -> Any:
+        with open(os.path.join(self._artifact_path(key), filename), "rb") as handle:
+            signature = handle.read(hashlib.sha256().digest_size)
+            payload = handle.read()
+        if not hmac.compare_digest(signature, self._signature(key, filename, payload)):
+            raise ValueError(f"bad signature on {filename}")
+        return pickle.loads(payload)
+
+    def _write_frame(
+        self, key: str, directory: str, name: str, frame: pd.DataFrame
+    ) -> str:
+        if self.use_arrow:
+            filename = f"{name}.arrow"
+            # A RangeIndex is kept as metadata, any other index as columns
+            table = pa.Table.from_pandas(frame, preserve_index=None)
+            with pa.OSFile(os.path.join(directory, filename), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            return filename
+
+        filename = f"{name}.pkl"
+        self._write_pickle(key, directory, filename, frame)
+        return filename
+
+    def _read_frame(self, key: str, filename: str) -> pd.DataFrame:
+        if filename.endswith(".arrow"):
+            if pa is None:
+                raise ImportError(
+                    "Reading Arrow artifacts requires pyarrow "
+                    "(pip install mcp-sequential-thinking[arrow])"
+                )
+            # Columns are read straight from the mapped file, mapped while referenced
+            path = os.path.join(self._artifact_path(key), filename)
+            table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+            return table.to_pandas(split_blocks=True)
+
+        frame: pd.DataFrame = self._read_pickle(key, filename)
+        return frame
@@ -0,0 +1,264 @@
+"""
+Durable Checkpointing for Sequential Thinking Patterns
+
+This module provides an append-only SQLite journal (WAL mode) of pattern starts,
+step transitions and results, so the thinking engine can resume unfinished
+patterns after a restart instead of re-running every step. Events are queued in
+memory and committed in batches by a writer thread, so recording a step
+transition never waits on disk from the event loop.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+import structlog
+
+from .clock import Clock, SystemClock
+
+logger = structlog.get_logger(__name__)
+
+PATTERN_STARTED = "pattern_started"
+STEP_TRANSITION = "step_transition"
+PATTERN_FINISHED = "pattern_finished"
+
+
+class CheckpointJournal:
+    """Append-only journal of thinking pattern progress backed by SQLite in WAL mode
+
+    Appends only enqueue the event. A single writer thread commits everything
+    queued so far in one transaction, so bursts of transitions share a commit.
+    ``flush`` waits for the queue to reach disk; replay, compaction and close
+    flush first. Events still queued when the process dies are lost, which only
+    means the affected steps run again on resume. ``request_compaction`` has the
+    writer thread drop finished patterns after its next commit, so a long-running
+    engine can keep the journal small without blocking its event loop.
+    """
+
+    def __init__(self, path: str, clock: Optional[Clock] = None):
+        self.path = path
+        self.clock = clock or SystemClock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable across process crashes in WAL mode; only an OS crash
+        # can lose the tail
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+                pattern_id TEXT NOT NULL,
+                event TEXT NOT NULL,
+                step_id TEXT,
+                status TEXT,
+                payload TEXT,
+                recorded_at TEXT NOT NULL
+            )
+        """)
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_journal_pattern "
+            "ON journal (pattern_id, sequence)"
+        )
+        self.logger = structlog.get_logger(__name__)
+
+        self._pending: List[Tuple[Any, ...]] = []
+        self._compaction_requested = False
+        self._writing = False
+        self._closing = False
+        self._condition = threading.Condition()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="checkpoint-journal", daemon=True
+        )
+        self._writer.start()
+
+    def _append(
+        self,
+        pattern_id: str,
+        event: str,
+        step_id: Optional[str] = None,
+        status: Optional[str] = None,
+        payload: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        encoded = json.dumps(payload, default=str) if payload is not None else None
+        row = (
+            pattern_id,
+            event,
+            step_id,
+            status,
+            encoded,
+            self.clock.now().isoformat(),
+        )
+        with self._condition:
+            if self._closing:
+                raise RuntimeError("Checkpoint journal is closed")
+            self._pending.append(row)
+            self._condition.notify_all()
+
+    def _write_loop(self) -> None:
+        """Commit queued events in batches until the journal is closed"""
+        while True:
+            with self._condition:
+                while (
+                    not self._pending
+                    and not self._compaction_requested
+                    and not self._closing
+                ):
+                    self._condition.wait()
+                if not self._pending and not self._compaction_requested:
+                    return
+                rows, self._pending = self._pending, []
+                compact, self._compaction_requested = self._compaction_requested, False
+                self._writing = True
+
+            try:
+                if rows:
+                    self._commit(rows)
+                if compact:
+                    self._delete_finished()
+            except Exception as e:
+                self.logger.error(
+                    "Checkpoint journal write failed", events=len(rows), error=str(e)
+                )
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+    def _commit(self, rows: List[Tuple[Any, ...]]) -> None:
+        """Insert a batch of queued events in one transaction"""
+        with self._lock:
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.executemany(
+                    "INSERT INTO journal (pattern_id, event, step_id, status, payload, "
+                    "recorded_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def flush(self) -> None:
+        """Block until every queued event and requested compaction has been applied"""
+        with self._condition:
+            while self._pending or self._compaction_requested or self._writing:
+                self._condition.wait()
+
+    def request_compaction(self) -> None:
+        """Have the writer thread compact the journal after its next commit"""
+        with self._condition:
+            if self._closing:
+                raise RuntimeError("Checkpoint journal is closed")
+            self._compaction_requested = True
+            self._condition.notify_all()
+
+    def record_pattern_started(
+        self,
+        pattern_id: str,
+        template: str,
+        context: Dict[str, Any],
+        priority: str,
+        compact: bool = False,
+    ) -> None:
+        """Record everything needed to rebuild a pattern from its template"""
+        self._append(
+            pattern_id,
+            PATTERN_STARTED,
+            payload={
+                "template": template,
+                "context": context,
+                "priority": priority,
+                "compact": compact,
+            },
+        )
+
+    def record_step_transition(
+        self,
+        pattern_id: str,
+        step_id: str,
+        status: str,
+        result: Any = None,
+        errors: Optional[List[str]] = None,
+        duration_seconds: Optional[float] = None,
+    ) -> None:
+        """Record a step status change, with its result once completed"""
+        self._append(
+            pattern_id,
+            STEP_TRANSITION,
+            step_id=step_id,
+            status=status,
+            payload={
+                "result": result,
+                "errors": errors or [],
+                "duration_seconds": duration_seconds,
+            },
+        )
+
+    def record_pattern_finished(self, pattern_id: str) -> None:
+        """Mark a pattern as finished so it is skipped on replay"""
+        self._append(pattern_id, PATTERN_FINISHED)
+
+    def replay(self) -> List[Dict[str, Any]]:
+        """Rebuild the last known state of every unfinished pattern, in start order"""
+        patterns: Dict[str, Dict[str, Any]] = {}
+
+        self.flush()
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT pattern_id, event, step_id, status, payload FROM journal "
+                "ORDER BY sequence"
+            ).fetchall()
+
+        for pattern_id, event, step_id, status, payload in rows:
+            data = json.loads(payload) if payload else {}
+
+            if event == PATTERN_STARTED:
+                patterns[pattern_id] = {"pattern_id": pattern_id, "steps": {}, **data}
+            elif event == STEP_TRANSITION and pattern_id in patterns:
+                patterns[pattern_id]["steps"][step_id] = {"status": status, **data}
+            elif event == PATTERN_FINISHED:
+                patterns.pop(pattern_id, None)
+
+        self.logger.info(
+            "Replayed checkpoint journal",
+            events=len(rows),
+            unfinished_patterns=len(patterns),
+        )
+        return list(patterns.values())
+
+    def compact(self) -> int:
+        """Delete the events of finished patterns, returning the rows removed"""
+        self.flush()
+        return self._delete_finished()
+
+    def _delete_finished(self) -> int:
+        with self._lock:
+            cursor = self.connection.execute(
+                """
+                DELETE FROM journal WHERE pattern_id IN (
+                    SELECT pattern_id FROM journal WHERE event = ?
+                )
+                """,
+                (PATTERN_FINISHED,),
+            )
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        self.logger.info("Compacted checkpoint journal", removed_events=cursor.rowcount)
+        return cursor.rowcount
+
+    def close(self) -> None:
+        """Commit the queued events, stop the writer and close the database"""
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        self._writer.join()
+        with self._lock:
+            self.connection.close()
@@ -0,0 +1,180 @@
+"""
+Clock Abstraction for Sequential Thinking Engines
+
+This module provides the time source used for sleeps, timestamps and monitoring
+intervals. The system clock follows wall time; the virtual clock advances
+instantly to the next sleeper so whole campaign lifecycles can be simulated in
+milliseconds for capacity planning and CI.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Awaitable, Iterator, List, Optional, Tuple
+from datetime import datetime
+
+
+class Clock(ABC):
+    """Source of time and sleeps for the engines"""
+
+    @abstractmethod
+    def now(self) -> datetime:
+        """Current time as a naive datetime"""
+
+    @abstractmethod
+    def time(self) -> float:
+        """Current time as seconds since the epoch"""
+
+    @abstractmethod
+    async def sleep(self, seconds: float) -> None:
+        """Suspend the caller for ``seconds`` of this clock's time"""
+
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        """Keep time from jumping while work outside the event loop is outstanding
+
+        Real time passes regardless, so this only matters for simulated clocks.
+        """
+        yield
+
+    async def wait_for_event(self, event: asyncio.Event, timeout: float) -> bool:
+        """Wait for ``event`` at most ``timeout`` seconds; return whether it was set"""
+        if event.is_set():
+            return True
+
+        waiter = asyncio.ensure_future(event.wait())
+        sleeper = asyncio.ensure_future(self.sleep(timeout))
+        try:
+            done, _ = await asyncio.wait(
+                {waiter, sleeper}, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            waiter.cancel()
+            sleeper.cancel()
+        return waiter in done
+
+    async def wait_for(self, awaitable: Awaitable[Any], timeout: float) -> Any:
+        """Await ``awaitable``; cancel it with TimeoutError after ``timeout`` seconds"""
+        work = asyncio.ensure_future(awaitable)
+        sleeper = asyncio.ensure_future(self.sleep(timeout))
+        try:
+            await asyncio.wait({work, sleeper}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sleeper.cancel()
+            timed_out = not work.done()
+            if timed_out:
+                work.cancel()
+
+        if timed_out:
+            raise TimeoutError(f"Timed out after {timeout:g}s")
+        return work.result()
+
+
+class SystemClock(Clock):
+    """Wall-clock time backed by the event loop"""
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def time(self) -> float:
+        return time.time()
+
+    async def sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+    async def wait_for_event(self, event: asyncio.Event, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class VirtualClock(Clock):
+    """Simulated time that jumps straight to the earliest pending sleeper
+
+    Sleepers are kept in a min-heap of deadlines. A driver task lets the event
+    loop settle for a few iterations, so every runnable task reaches its next
+    sleep, then moves virtual time to the earliest deadline and wakes everything
+    due at that instant. Work that waits on real I/O or threads does not hold
+    virtual time back unless it runs inside ``hold()``; otherwise a timeout racing
+    a thread would fire as soon as every coroutine is asleep.
+    """
+
+    def __init__(self, start: Optional[datetime] = None, settle_iterations: int = 32):
+        self._time = (start or datetime.now()).timestamp()
+        self.settle_iterations = settle_iterations
+        self._sleepers: List[Tuple[float, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._driver: Optional[asyncio.Task] = None
+        self._holds = 0
+        self._released = asyncio.Event()
+        self._released.set()
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self._time)
+
+    def time(self) -> float:
+        return self._time
+
+    async def sleep(self, seconds: float) -> None:
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._sleepers, (self._time + seconds, next(self._sequence), future)
+        )
+        if self._driver is None or self._driver.done():
+            self._driver = asyncio.create_task(self._drive())
+        await future
+
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        self._holds += 1
+        self._released.clear()
+        try:
+            yield
+        finally:
+            self._holds -= 1
+            if not self._holds:
+                self._released.set()
+
+    def advance(self, seconds: float) -> None:
+        """Move virtual time forward by hand, waking every sleeper that becomes due"""
+        if seconds < 0:
+            raise ValueError("Virtual time cannot move backwards")
+        self._time += seconds
+        self._wake_due()
+
+    @property
+    def pending_sleepers(self) -> int:
+        return sum(1 for _, _, future in self._sleepers if not future.done())
+
+    def _wake_due(self) -> None:
+        while self._sleepers and self._sleepers[0][0] <= self._time:
+            _, _, future = heapq.heappop(self._sleepers)
+            if not future.done():
+                future.set_result(None)
+
+    async def _drive(self) -> None:
+        while self._sleepers:
+            for _ in range(self.settle_iterations):
+                await asyncio.sleep(0)
+            if self._holds:
+                # Held work finishes at an unknown virtual instant; settle again after
+                await self._released.wait()
+                continue
+
+            # Sleepers cancelled while waiting leave finished futures behind
+            while self._sleepers and self._sleepers[0][2].done():
+                heapq.heappop(self._sleepers)
+            if not self._sleepers:
+                break
+
+            self._time = max(self._time, self._sleepers[0][0])
+            self._wake_due()
@@ -5,7 +5,6 @@ This module provides comprehensive error handling, recovery strategies,
 and resilience patterns for WhatsApp automation workflows.
 """
 
-import asyncio
 import json
 from typing import Dict, List, Any, Optional, Callable, Union, Type
 from dataclasses import dataclass, field
@@ -16,6 +15,8 @@ from collections import defaultdict, deque
 import structlog
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
+from .clock import Clock, SystemClock
+
 logger = structlog.get_logger(__name__)
 
 class ErrorSeverity(Enum):
@@ -93,7 +94,8 @@ class RecoveryAction:
 class ErrorHandlingEngine:
     """Core error handling and recovery engine"""
 
-    def __init__(self):
+    def __init__(self, clock: Optional[Clock] = None):
+        self.clock = clock or SystemClock()
         self.error_registry: Dict[str, ErrorRecord] = {}
         self.recovery_actions: Dict[RecoveryStrategy, RecoveryAction] = {}
         self.error_patterns: Dict[str, List[ErrorRecord]] = defaultdict(list)
@@ -199,7 +201,7 @@ class ErrorHandlingEngine:
         category = self._classify_error_category(error, context)
 
         error_record = ErrorRecord(
-            error_id=f"err_{int(datetime.now().timestamp())}_{hash(error_message) % 10000}",
+            error_id=f"err_{int(self.clock.now().timestamp())}_{hash(error_message) % 10000}",
             error_type=error_type,
             error_message=error_message,
             severity=severity,
@@ -263,7 +265,7 @@ class ErrorHandlingEngine:
         # Check for error frequency patterns
         recent_errors = [
             err for err in self.error_patterns[pattern_key]
-            if (datetime.now() - err.context.timestamp) < timedelta(hours=1)
+            if (self.clock.now() - err.context.timestamp) < timedelta(hours=1)
         ]
 
         if len(recent_errors) >= 5:  # 5 similar errors in 1 hour
@@ -320,15 +322,15 @@ class ErrorHandlingEngine:
                 "execution_time": 0
             }
 
-        start_time = datetime.now()
+        start_time = self.clock.now()
 
         try:
             result = await recovery_action.handler(error_record)
-            execution_time = (datetime.now() - start_time).total_seconds()
+            execution_time = (self.clock.now() - start_time).total_seconds()
 
             if result.get("success", False):
                 error_record.recovery_success = True
-                error_record.resolution_time = datetime.now()
+                error_record.resolution_time = self.clock.now()
 
             error_record.recovery_attempts += 1
 
@@ -338,7 +340,7 @@ class ErrorHandlingEngine:
                 "strategy": error_record.recovery_strategy.value,
                 "success": result.get("success", False),
                 "execution_time": execution_time,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": self.clock.now().isoformat()
             })
 
             result["execution_time"] = execution_time
@@ -355,12 +357,12 @@ class ErrorHandlingEngine:
             return {
                 "success": False,
                 "error": f"Recovery execution failed: {str(recovery_error)}",
-                "execution_time": (datetime.now() - start_time).total_seconds()
+                "execution_time": (self.clock.now() - start_time).total_seconds()
             }
 
     async def _handle_simple_retry(self, error_record: ErrorRecord) -> Dict[str, Any]:
         """Handle simple retry recovery"""
-        await asyncio.sleep(1)  # Brief pause before retry
+        await self.clock.sleep(1)  # Brief pause before retry
 
         return {
             "success": True,
@@ -373,7 +375,7 @@ class ErrorHandlingEngine:
         """Handle exponential backoff retry recovery"""
 
         backoff_time = min(2 ** error_record.recovery_attempts, 60)  # Cap at 60 seconds
-        await asyncio.sleep(backoff_time)
+        await self.clock.sleep(backoff_time)
 
         return {
             "success": True,
@@ -423,7 +425,7 @@ class ErrorHandlingEngine:
 
         circuit_breaker = self.circuit_breakers[component]
         circuit_breaker["failure_count"] += 1
-        circuit_breaker["last_failure"] = datetime.now()
+        circuit_breaker["last_failure"] = self.clock.now()
 
         if circuit_breaker["failure_count"] >= circuit_breaker["failure_threshold"]:
             circuit_breaker["state"] = "open"
@@ -504,7 +506,7 @@ class ErrorHandlingEngine:
     async def get_error_statistics(self, time_range: timedelta = timedelta(hours=24)) -> Dict[str, Any]:
         """Get error statistics for the specified time range"""
 
-        cutoff_time = datetime.now() - time_range
+        cutoff_time = self.clock.now() - time_range
         relevant_errors = [
             error for error in self.error_registry.values()
             if error.context.timestamp >= cutoff_time
@@ -603,7 +605,7 @@ class ResilientOperationWrapper:
             async def wrapper(*args, **kwargs):
                 context = ErrorContext(
                     error_id="",  # Will be set when error occurs
-                    timestamp=datetime.now(),
+                    timestamp=self.error_handler.clock.now(),
                     component=component,
                     operation=operation_name
                 )
@@ -627,7 +629,7 @@ class ResilientOperationWrapper:
                         return result
 
                     except Exception as e:
-                        context.timestamp = datetime.now()
+                        context.timestamp = self.error_handler.clock.now()
 
                         if attempt == max_retries:
                             # Final attempt failed, handle error
@@ -645,7 +647,7 @@ class ResilientOperationWrapper:
 
                         # Wait before retry (exponential backoff)
                         wait_time = min(2 ** attempt, 30)  # Cap at 30 seconds
-                        await asyncio.sleep(wait_time)
+                        await self.error_handler.clock.sleep(wait_time)
 
             return wrapper
         return decorator
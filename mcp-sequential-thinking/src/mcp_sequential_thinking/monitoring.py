@@ -16,6 +16,8 @@ from collections import defaultdict, deque
 import structlog
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from .clock import Clock, SystemClock
+
 logger = structlog.get_logger(__name__)
 
 class MetricType(Enum):
@@ -76,7 +78,8 @@ class ROICalculation:
 class ROITracker:
     """Advanced ROI tracking with predictive analytics"""
 
-    def __init__(self):
+    def __init__(self, clock: Optional[Clock] = None):
+        self.clock = clock or SystemClock()
         self.investment_tracking: Dict[str, List[float]] = defaultdict(list)
         self.revenue_tracking: Dict[str, List[float]] = defaultdict(list)
         self.conversion_tracking: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
@@ -88,7 +91,7 @@ class ROITracker:
         investment_record = {
             "amount": amount,
             "category": category,
-            "timestamp": datetime.now(),
+            "timestamp": self.clock.now(),
             "cumulative": sum(self.investment_tracking[campaign_id]) + amount
         }
 
@@ -110,7 +113,7 @@ class ROITracker:
             "student_id": student_id,
             "revenue": revenue,
             "conversion_type": conversion_type,
-            "timestamp": datetime.now(),
+            "timestamp": self.clock.now(),
             "campaign_id": campaign_id
         }
 
@@ -148,7 +151,7 @@ class ROITracker:
             net_profit=net_profit,
             roi_percentage=roi_percentage,
             roi_ratio=roi_ratio,
-            calculation_timestamp=datetime.now(),
+            calculation_timestamp=self.clock.now(),
             breakdown=breakdown,
             projections=projections
         )
@@ -219,7 +222,7 @@ class ROITracker:
         conversion_rate_trend = len(recent_conversions) / min(len(conversions), 100) if conversions else 0
 
         # Project to campaign end (assuming 21-day campaign)
-        days_elapsed = (datetime.now() - conversions[0]["timestamp"]).days if conversions else 1
+        days_elapsed = (self.clock.now() - conversions[0]["timestamp"]).days if conversions else 1
         days_remaining = max(21 - days_elapsed, 0)
 
         current_daily_revenue = sum(c["revenue"] for c in recent_conversions) / max(days_elapsed, 1)
@@ -248,7 +251,8 @@ class ROITracker:
 class PerformanceMonitor:
     """Real-time performance monitoring with intelligent alerting"""
 
-    def __init__(self):
+    def __init__(self, clock: Optional[Clock] = None):
+        self.clock = clock or SystemClock()
         self.metric_history: Dict[str, deque] = defaultdict(lambda: deque(maxlen=1000))
         self.alert_thresholds: Dict[MetricType, Dict[str, float]] = self._setup_default_thresholds()
         self.active_alerts: Dict[str, Alert] = {}
@@ -320,7 +324,7 @@ class PerformanceMonitor:
                 await self._check_alert_conditions(campaign_id, current_metrics)
 
                 # Wait before next check
-                await asyncio.sleep(30)  # Check every 30 seconds
+                await self.clock.sleep(30)  # Check every 30 seconds
 
             except Exception as e:
                 self.logger.error(
@@ -328,14 +332,14 @@ class PerformanceMonitor:
                     campaign_id=campaign_id,
                     error=str(e)
                 )
-                await asyncio.sleep(60)  # Wait longer on error
+                await self.clock.sleep(60)  # Wait longer on error
 
     async def _collect_metrics(self, campaign_id: str) -> Dict[MetricType, float]:
         """Collect current metrics from various sources"""
         # This would integrate with the actual WhatsApp system and database
         # For now, simulate realistic metrics with some variance
 
-        await asyncio.sleep(0.1)  # Simulate API call
+        await self.clock.sleep(0.1)  # Simulate API call
 
         # Simulate metrics with realistic variance
         base_metrics = {
@@ -361,7 +365,7 @@ class PerformanceMonitor:
         """Process individual metric measurement"""
 
         metric_point = MetricPoint(
-            timestamp=datetime.now(),
+            timestamp=self.clock.now(),
             metric_type=metric_type,
             value=value,
             campaign_id=campaign_id
@@ -426,7 +430,7 @@ class PerformanceMonitor:
             description = f"{metric_type.value} above warning threshold: {value:.3f} > {threshold_value:.3f}"
 
         if alert_level:
-            alert_id = f"{campaign_id}_{metric_type.value}_{int(datetime.now().timestamp())}"
+            alert_id = f"{campaign_id}_{metric_type.value}_{int(self.clock.now().timestamp())}"
 
             return Alert(
                 id=alert_id,
@@ -435,7 +439,8 @@ class PerformanceMonitor:
                 description=description,
                 metric_type=metric_type,
                 current_value=value,
-                threshold_value=threshold_value
+                threshold_value=threshold_value,
+                timestamp=self.clock.now()
             )
 
         return None
@@ -510,7 +515,7 @@ class PerformanceMonitor:
     async def get_performance_summary(self, campaign_id: str, time_range: timedelta = timedelta(hours=24)) -> Dict[str, Any]:
         """Get performance summary for a campaign"""
 
-        cutoff_time = datetime.now() - time_range
+        cutoff_time = self.clock.now() - time_range
         summary = {
             "campaign_id": campaign_id,
             "time_range_hours": time_range.total_seconds() / 3600,
@@ -577,7 +582,9 @@ class PerformanceMonitor:
 class OptimizationEngine:
     """Intelligent optimization engine for campaign performance"""
 
-    def __init__(self, roi_tracker: ROITracker, performance_monitor: PerformanceMonitor):
+    def __init__(self, roi_tracker: ROITracker, performance_monitor: PerformanceMonitor,
+                 clock: Optional[Clock] = None):
+        self.clock = clock or performance_monitor.clock
         self.roi_tracker = roi_tracker
         self.performance_monitor = performance_monitor
         self.optimization_history: List[Dict[str, Any]] = []
@@ -649,7 +656,7 @@ class OptimizationEngine:
             })
 
         return {
-            "analysis_timestamp": datetime.now().isoformat(),
+            "analysis_timestamp": self.clock.now().isoformat(),
             "campaign_id": campaign_id,
             "current_performance": {
                 "roi_percentage": roi_calc.roi_percentage,
@@ -709,7 +716,7 @@ class OptimizationEngine:
         implementation_result = {
             "action": optimization_action,
             "campaign_id": campaign_id,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": self.clock.now().isoformat(),
             "success": False,
             "changes_made": [],
             "expected_impact": {},
@@ -756,7 +763,7 @@ class OptimizationEngine:
 
     async def _improve_conversion_rate(self, campaign_id: str) -> Dict[str, Any]:
         """Implement conversion rate improvements"""
-        await asyncio.sleep(1)  # Simulate implementation time
+        await self.clock.sleep(1)  # Simulate implementation time
 
         return {
             "success": True,
@@ -775,7 +782,7 @@ class OptimizationEngine:
 
     async def _optimize_message_timing(self, campaign_id: str) -> Dict[str, Any]:
         """Optimize message timing based on response patterns"""
-        await asyncio.sleep(1)
+        await self.clock.sleep(1)
 
         return {
             "success": True,
@@ -794,7 +801,7 @@ class OptimizationEngine:
 
     async def _investigate_delivery_issues(self, campaign_id: str) -> Dict[str, Any]:
         """Investigate and resolve delivery issues"""
-        await asyncio.sleep(2)
+        await self.clock.sleep(2)
 
         return {
             "success": True,
@@ -813,7 +820,7 @@ class OptimizationEngine:
 
     async def _scale_successful_segments(self, campaign_id: str) -> Dict[str, Any]:
         """Scale successful campaign segments"""
-        await asyncio.sleep(1.5)
+        await self.clock.sleep(1.5)
 
         return {
             "success": True,
@@ -0,0 +1,1026 @@
+"""
+Segmentation Models for Student Reactivation Campaigns
+
+This module provides NumPy implementations of the models behind user
+segmentation: per-student behavioral feature vectors, mini-batch k-means
+clustering, sampled cluster quality metrics, an incrementally maintained
+lifetime value cache, a logistic reactivation model and a marginal-ROI
+budget allocator. They are sized for a million students on a laptop CPU and
+need nothing beyond NumPy and pandas.
+"""
+
+from typing import Dict, List, Any, Optional, Tuple
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import structlog
+
+from .data_pipeline import SeenKeys, chain_digest
+
+logger = structlog.get_logger(__name__)
+
+FEATURE_NAMES = ("days_inactive", "monthly_frequency", "plan_value", "tenure_days")
+
+REACTIVATION_FEATURES = (
+    "days_since_last_payment",
+    "days_since_last_access",
+    "monthly_frequency",
+    "plan_value",
+    "tenure_days",
+    "log_ltv",
+)
+
+# Lower reactivation probability bound of each bucket, highest first
+PROBABILITY_BUCKETS = (
+    ("high_probability", 0.6),
+    ("medium_probability", 0.3),
+    ("low_probability", 0.0),
+)
+
+# Monthly-equivalent price of each plan type, in BRL
+PLAN_MONTHLY_VALUES = {
+    "mensal": 149.90,
+    "trimestral": 129.90,
+    "semestral": 119.90,
+    "anual": 99.90,
+}
+
+# Billing period of each plan type, in months
+PLAN_COMMITMENT_MONTHS = {"mensal": 1, "trimestral": 3, "semestral": 6, "anual": 12}
+
+# Weights of the commitment, tenure and engagement scores in the LTV multiplier
+LTV_FACTORS = {
+    "plan_type_weight": 0.35,
+    "tenure_weight": 0.25,
+    "engagement_weight": 0.40,
+}
+
+# Months of future revenue a fully committed, long-tenured, engaged student is worth
+LTV_HORIZON_MONTHS = 12
+
+# Lower LTV bound of each value segment, highest first
+LTV_SEGMENTS = (("high_value", 800.0), ("medium_value", 400.0), ("low_value", 150.0))
+
+DAYS_PER_MONTH = 30.4375
+
+# Campaign segments, highest priority first. Students fall in the first segment whose
+# probability and LTV floors they reach; costs are per message of each touch, in BRL,
+# and message types name what each touch sends
+CAMPAIGN_SEGMENTS: Dict[str, Dict[str, Any]] = {
+    "priority_1_high_value": {
+        "characteristics": ["high_ltv", "high_reactivation_prob"],
+        "strategy": "premium_personalized_approach",
+        "min_probability": 0.6,
+        "min_ltv": 800.0,
+        "message_costs": (2.50, 1.50, 1.50),
+        "message_types": ("premium_welcome", "urgency_follow_up", "personal_check_in"),
+    },
+    "priority_2_engaged": {
+        "characteristics": ["medium_ltv", "recent_activity"],
+        "strategy": "value_proposition_focus",
+        "min_probability": 0.3,
+        "min_ltv": 400.0,
+        "message_costs": (0.80, 0.60, 0.60),
+        "message_types": (
+            "value_proposition",
+            "benefits_reminder",
+            "urgency_follow_up",
+        ),
+    },
+    "priority_3_price_sensitive": {
+        "characteristics": ["budget_conscious", "promotion_responsive"],
+        "strategy": "discount_driven_campaign",
+        "min_probability": 0.3,
+        "min_ltv": 0.0,
+        # Messages carry a discount voucher
+        "message_costs": (1.20, 0.80),
+        "message_types": ("discount_offer", "limited_time_offer"),
+    },
+    "priority_4_long_term": {
+        "characteristics": ["low_immediate_prob", "future_potential"],
+        "strategy": "nurture_sequence",
+        "min_probability": 0.0,
+        "min_ltv": 0.0,
+        "message_costs": (0.30, 0.30, 0.30, 0.30),
+        "message_types": (
+            "community_update",
+            "success_story",
+            "seasonal_invite",
+            "open_door_reminder",
+        ),
+    },
+}
+
+# Size, conversion and LTV assumed per segment when no student data is available
+DEFAULT_SEGMENT_ESTIMATES = {
+    "priority_1_high_value": (85, 0.75, 1100.0),
+    "priority_2_engaged": (165, 0.45, 600.0),
+    "priority_3_price_sensitive": (200, 0.30, 300.0),
+    "priority_4_long_term": (200, 0.15, 250.0),
+}
+
+# Upper bound for estimated visits per month
+MAX_MONTHLY_FREQUENCY = 30.0
+
+# Clusters smaller than this share of students are too small to target on their own
+MIN_ACTIONABLE_CLUSTER_SHARE = 0.02
+
+
+def plan_values(
+    plan_types: pd.Series, values: Optional[Dict[str, float]] = None
+) -> np.ndarray:
+    """Monthly plan value of each student, NaN for unknown plans"""
+    values = values or PLAN_MONTHLY_VALUES
+    codes, uniques = pd.factorize(plan_types.astype("string").str.strip().str.lower())
+    lookup = np.append(
+        np.array([values.get(plan, np.nan) for plan in uniques], dtype=np.float64),
+        np.nan,
+    )
+    student_values: np.ndarray = lookup[codes]
+    return student_values
+
+
+def profile_features(
+    profiles: pd.DataFrame,
+    names: Tuple[str, ...],
+    plan_monthly_values: Optional[Dict[str, float]] = None,
+) -> np.ndarray:
+    """Named per-student features of a profile frame, one row per student
+
+    Exports without a ``monthly_frequency`` column get it estimated from access
+    recency: a student last seen ``d`` days ago visits about ``30 / d`` times a
+    month. ``log_ltv`` needs an ``ltv`` column. Missing values are imputed with
+    the column median.
+    """
+    days_payment: np.ndarray = profiles["days_since_last_payment"].to_numpy(
+        dtype=np.float64
+    )
+    days_access: np.ndarray = profiles["days_since_last_access"].to_numpy(
+        dtype=np.float64
+    )
+
+    def monthly_frequency() -> np.ndarray:
+        frequency: np.ndarray = (
+            profiles["monthly_frequency"].to_numpy(dtype=np.float64)
+            if "monthly_frequency" in profiles.columns
+            else np.minimum(30.0 / np.maximum(days_access, 1.0), MAX_MONTHLY_FREQUENCY)
+        )
+        return frequency
+
+    def log_ltv() -> np.ndarray:
+        if "ltv" not in profiles.columns:
+            return np.full(len(profiles), np.nan)
+        ltv: np.ndarray = profiles["ltv"].to_numpy(dtype=np.float64)
+        logs: np.ndarray = np.log1p(np.maximum(ltv, 0.0))
+        return logs
+
+    builders = {
+        "days_inactive": lambda: np.fmin(days_payment, days_access),
+        "days_since_last_payment": lambda: days_payment,
+        "days_since_last_access": lambda: days_access,
+        "monthly_frequency": monthly_frequency,
+        "plan_value": lambda: plan_values(profiles["plan_type"], plan_monthly_values),
+        "tenure_days": lambda: profiles["tenure_days"].to_numpy(dtype=np.float64),
+        "log_ltv": log_ltv,
+    }
+    unknown = [name for name in names if name not in builders]
+    if unknown:
+        raise ValueError(f"Unknown profile features: {unknown}")
+
+    features = np.column_stack([builders[name]() for name in names])
+    missing = np.isnan(features)
+    if missing.any():
+        with np.errstate(invalid="ignore"):
+            medians = np.nan_to_num(
+                np.nanmedian(np.where(missing.all(axis=0), 0.0, features), axis=0)
+            )
+        features[missing] = np.take(medians, np.nonzero(missing)[1])
+    return features
+
+
+def build_feature_matrix(
+    profiles: pd.DataFrame, plan_monthly_values: Optional[Dict[str, float]] = None
+) -> np.ndarray:
+    """Behavioral feature vectors used for clustering (see FEATURE_NAMES)"""
+    return profile_features(profiles, FEATURE_NAMES, plan_monthly_values)
+
+
+def squared_distances(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Squared euclidean distance from every point to every center"""
+    distances = (
+        np.einsum("ij,ij->i", points, points)[:, None]
+        - 2.0 * points @ centers.T
+        + np.einsum("ij,ij->i", centers, centers)[None, :]
+    )
+    clipped: np.ndarray = np.maximum(distances, 0.0)
+    return clipped
+
+
+class MiniBatchKMeans:
+    """Mini-batch k-means over standardized features
+
+    Centers are seeded with k-means++ on a sample, then each iteration moves
+    them towards the mean of a random batch, weighted by how many points each
+    center has absorbed so far. Cost per iteration depends on the batch size
+    only, so fitting a million students takes a fraction of a second.
+    """
+
+    def __init__(
+        self,
+        n_clusters: int = 5,
+        batch_size: int = 4096,
+        max_iterations: int = 200,
+        tolerance: float = 1e-4,
+        seed: Optional[int] = 0,
+    ):
+        if n_clusters < 1:
+            raise ValueError("n_clusters must be at least 1")
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.rng = np.random.default_rng(seed)
+
+        self.mean: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+        self.centers: Optional[np.ndarray] = None
+        self.iterations = 0
+
+    def fit(self, features: np.ndarray) -> "MiniBatchKMeans":
+        """Fit cluster centers to raw (unscaled) feature rows"""
+        if len(features) == 0:
+            raise ValueError("Cannot cluster an empty feature matrix")
+
+        self.mean = features.mean(axis=0)
+        self.scale = features.std(axis=0)
+        self.scale[self.scale == 0] = 1.0
+        scaled = self.transform(features)
+
+        n_clusters = min(self.n_clusters, len(scaled))
+        centers = self._seed_centers(scaled, n_clusters)
+        counts = np.zeros(n_clusters)
+
+        for self.iterations in range(1, self.max_iterations + 1):
+            batch = scaled[
+                self.rng.integers(0, len(scaled), min(self.batch_size, len(scaled)))
+            ]
+            labels = squared_distances(batch, centers).argmin(axis=1)
+
+            batch_counts = np.bincount(labels, minlength=n_clusters)
+            batch_sums = np.zeros_like(centers)
+            np.add.at(batch_sums, labels, batch)
+
+            counts += batch_counts
+            touched = batch_counts > 0
+            # Running mean: each center moves by its batch members over everything
+            # it has absorbed
+            shift = (
+                batch_sums[touched] - batch_counts[touched, None] * centers[touched]
+            ) / counts[touched, None]
+            centers[touched] += shift
+            if np.max(np.sum(shift**2, axis=1), initial=0.0) < self.tolerance:
+                break
+
+        self.centers = centers
+        return self
+
+    def transform(self, features: np.ndarray) -> np.ndarray:
+        scaled: np.ndarray = (features - self.mean) / self.scale
+        return scaled
+
+    @property
+    def fitted_centers(self) -> np.ndarray:
+        if self.centers is None:
+            raise ValueError("MiniBatchKMeans must be fitted first")
+        return self.centers
+
+    def predict(self, features: np.ndarray, block_size: int = 262_144) -> np.ndarray:
+        """Nearest center of every feature row, computed in blocks to bound memory"""
+        centers = self.fitted_centers
+        labels = np.empty(len(features), dtype=np.int32)
+        for start in range(0, len(features), block_size):
+            block = self.transform(features[start : start + block_size])
+            labels[start : start + block_size] = squared_distances(
+                block, centers
+            ).argmin(axis=1)
+        return labels
+
+    def centers_in_feature_units(self) -> np.ndarray:
+        centers: np.ndarray = self.fitted_centers * self.scale + self.mean
+        return centers
+
+    def _seed_centers(
+        self, scaled: np.ndarray, n_clusters: int, sample_size: int = 20_000
+    ) -> np.ndarray:
+        """k-means++ seeding on a random sample"""
+        sample = scaled[
+            self.rng.choice(len(scaled), min(sample_size, len(scaled)), replace=False)
+        ]
+        centers = [sample[self.rng.integers(len(sample))]]
+        closest = squared_distances(sample, np.array(centers))[:, 0]
+
+        for _ in range(1, n_clusters):
+            total = closest.sum()
+            if total == 0:
+                # Fewer distinct points than clusters; duplicate centers stay empty
+                centers.append(centers[-1])
+                continue
+            candidate = sample[self.rng.choice(len(sample), p=closest / total)]
+            centers.append(candidate)
+            closest = np.minimum(
+                closest, squared_distances(sample, candidate[None, :])[:, 0]
+            )
+
+        return np.array(centers, dtype=np.float64)
+
+
+def sampled_cluster_quality(
+    scaled: np.ndarray,
+    labels: np.ndarray,
+    centers: np.ndarray,
+    sample_size: int = 2000,
+    seed: Optional[int] = 0,
+) -> Dict[str, float]:
+    """Silhouette score and cohesion/separation estimated on a random sample
+
+    The exact silhouette needs all pairwise distances; a few thousand sampled
+    points give a close estimate from one small distance matrix.
+    """
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(scaled), min(sample_size, len(scaled)), replace=False)
+    points, point_labels = scaled[picked], labels[picked]
+    n_clusters = len(centers)
+
+    distances = np.sqrt(squared_distances(points, points))
+    members = np.zeros((len(points), n_clusters))
+    members[np.arange(len(points)), point_labels] = 1.0
+    cluster_counts = members.sum(axis=0)
+
+    # Mean distance from every point to the members of every cluster, excluding itself
+    distance_sums = distances @ members
+    own_counts = cluster_counts[point_labels] - 1
+    own = distance_sums[np.arange(len(points)), point_labels]
+    within = np.divide(own, own_counts, out=np.zeros(len(points)), where=own_counts > 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        to_others = distance_sums / cluster_counts
+    to_others[np.arange(len(points)), point_labels] = np.inf
+    to_others[:, cluster_counts == 0] = np.inf
+    nearest_other = to_others.min(axis=1)
+
+    scored = (own_counts > 0) & np.isfinite(nearest_other)
+    silhouette = np.zeros(len(points))
+    silhouette[scored] = (nearest_other[scored] - within[scored]) / np.maximum(
+        within[scored], nearest_other[scored]
+    )
+
+    mean_distance = distances.sum() / max(len(points) * (len(points) - 1), 1)
+    center_distances = np.sqrt(squared_distances(centers, centers))[
+        np.triu_indices(n_clusters, k=1)
+    ]
+    # Root mean square distance of the sampled points to their own center
+    spread = np.sqrt(
+        np.mean(
+            squared_distances(points, centers)[np.arange(len(points)), point_labels]
+        )
+    )
+    closest_centers = center_distances.min() if len(center_distances) else 0.0
+
+    return {
+        "silhouette_score": round(float(silhouette.mean()), 4),
+        "intra_cluster_similarity": (
+            round(float(1 - within.mean() / mean_distance), 4) if mean_distance else 1.0
+        ),
+        "inter_cluster_separation": (
+            round(float(closest_centers / (closest_centers + 2 * spread)), 4)
+            if closest_centers + spread
+            else 0.0
+        ),
+        "sample_size": int(len(points)),
+    }
+
+
+def cluster_students(
+    profiles: pd.DataFrame,
+    n_clusters: int = 5,
+    seed: Optional[int] = 0,
+    silhouette_sample_size: int = 2000,
+    plan_monthly_values: Optional[Dict[str, float]] = None,
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Cluster students on their behavioral features
+
+    Returns the cluster label of every student and a summary with per-cluster
+    profiles (feature means in original units) and sampled quality metrics.
+    Clusters are numbered by decreasing size.
+    """
+    features = build_feature_matrix(profiles, plan_monthly_values)
+    model = MiniBatchKMeans(n_clusters=n_clusters, seed=seed).fit(features)
+    labels = model.predict(features)
+
+    # Renumber clusters so 0 is the largest
+    sizes = np.bincount(labels, minlength=len(model.fitted_centers))
+    order = np.argsort(-sizes, kind="stable")
+    ranks = np.empty_like(order)
+    ranks[order] = np.arange(len(order))
+    labels = ranks[labels].astype(np.int32)
+    model.centers = model.fitted_centers[order]
+    sizes = sizes[order]
+
+    quality = sampled_cluster_quality(
+        model.transform(features),
+        labels,
+        model.centers,
+        sample_size=silhouette_sample_size,
+        seed=seed,
+    )
+
+    cluster_profiles: List[Dict[str, Any]] = []
+    for cluster, center in enumerate(model.centers_in_feature_units()):
+        if sizes[cluster] == 0:
+            continue
+        cluster_profiles.append(
+            {
+                "cluster": cluster,
+                "size": int(sizes[cluster]),
+                "share": round(float(sizes[cluster] / len(labels)), 4),
+                **{
+                    name: round(float(value), 2)
+                    for name, value in zip(FEATURE_NAMES, center)
+                },
+            }
+        )
+
+    logger.info(
+        "Clustered students",
+        students=len(labels),
+        clusters=len(cluster_profiles),
+        iterations=model.iterations,
+        silhouette=quality["silhouette_score"],
+    )
+
+    return labels, {
+        "clusters_identified": len(cluster_profiles),
+        "cluster_sizes": [profile["size"] for profile in cluster_profiles],
+        "cluster_profiles": cluster_profiles,
+        "features": list(FEATURE_NAMES),
+        "iterations": model.iterations,
+        "quality": quality,
+        "actionable_share": round(
+            float(
+                sizes[sizes >= MIN_ACTIONABLE_CLUSTER_SHARE * len(labels)].sum()
+                / len(labels)
+            ),
+            4,
+        ),
+    }
+
+
+def compute_lifetime_values(
+    aggregates: pd.DataFrame,
+    factors: Optional[Dict[str, float]] = None,
+    horizon_months: float = LTV_HORIZON_MONTHS,
+) -> np.ndarray:
+    """Lifetime value of each student from their aggregated payments
+
+    LTV is the revenue already paid plus ``horizon_months`` of the student's
+    average monthly revenue, scaled by a weighted score of plan commitment,
+    tenure and engagement (share of expected payments actually made). Depends
+    only on the student's own payments, so cached values stay valid until the
+    student pays again.
+    """
+    factors = factors or LTV_FACTORS
+    codes, plans = pd.factorize(aggregates["plan_type"].astype("string"))
+    commitment_lookup = np.append(
+        np.array(
+            [PLAN_COMMITMENT_MONTHS.get(plan, 1) for plan in plans], dtype=np.float64
+        ),
+        1.0,
+    )
+    commitment_months = commitment_lookup[codes]
+
+    total_paid = aggregates["total_paid"].to_numpy(dtype=np.float64)
+    payment_count = aggregates["payment_count"].to_numpy(dtype=np.float64)
+    span_days = (
+        aggregates["last_paid_at"] - aggregates["first_paid_at"]
+    ).dt.days.to_numpy(dtype=np.float64)
+
+    # The last payment covers one more billing period
+    tenure_months = span_days / DAYS_PER_MONTH + commitment_months
+    monthly_revenue = total_paid / tenure_months
+    expected_payments = np.ceil(tenure_months / commitment_months - 1e-9)
+
+    score = (
+        factors["plan_type_weight"] * commitment_months / 12
+        + factors["tenure_weight"] * tenure_months / (tenure_months + 12)
+        + factors["engagement_weight"]
+        * np.minimum(payment_count / expected_payments, 1.0)
+    )
+    lifetime_values: np.ndarray = total_paid + monthly_revenue * horizon_months * score
+    return lifetime_values
+
+
+class LifetimeValueCache:
+    """Per-student payment aggregates and lifetime values, updated incrementally
+
+    New payments are deduplicated by payment id (or by student, date and amount
+    for payments without an id), grouped per student in one vectorized pass and
+    folded into the stored aggregates. Only students with new payments have
+    their lifetime value recomputed.
+    """
+
+    def __init__(
+        self,
+        factors: Optional[Dict[str, float]] = None,
+        horizon_months: float = LTV_HORIZON_MONTHS,
+    ):
+        self.factors = factors or LTV_FACTORS
+        self.horizon_months = horizon_months
+        self.students = pd.DataFrame(
+            {
+                "total_paid": pd.Series(dtype=np.float64),
+                "payment_count": pd.Series(dtype=np.int64),
+                "first_paid_at": pd.Series(dtype="datetime64[ns]"),
+                "last_paid_at": pd.Series(dtype="datetime64[ns]"),
+                "plan_type": pd.Series(dtype="category"),
+                "ltv": pd.Series(dtype=np.float64),
+            },
+            index=pd.Index([], dtype="string", name="student_id"),
+        )
+        self.seen_payments = SeenKeys()
+        # Changes with every payment folded in, for keying outputs built from the cache
+        self.state_digest = ""
+        self.logger = structlog.get_logger(__name__)
+
+    def __len__(self) -> int:
+        return len(self.students)
+
+    def add_payments(self, payments: pd.DataFrame) -> int:
+        """Fold cleaned payments into the cache, returning the students recomputed"""
+        # Keyed row by row, so a payment keeps its key whatever else is in the batch
+        keys = ("id|" + payments["payment_id"].astype("string")).fillna(
+            "row|"
+            + payments["student_id"].astype("string")
+            + "|"
+            + payments["paid_at"].astype("string")
+            + "|"
+            + payments["amount"].astype("string")
+        )
+        new_payments = payments[self.seen_payments.filter_new(keys)]
+        if new_payments.empty:
+            return 0
+        self.state_digest = chain_digest(self.state_digest, new_payments)
+
+        grouped = (
+            new_payments.sort_values("paid_at", kind="stable")
+            .groupby("student_id", sort=False)
+            .agg(
+                total_paid=("amount", "sum"),
+                payment_count=("amount", "size"),
+                first_paid_at=("paid_at", "min"),
+                last_paid_at=("paid_at", "max"),
+                plan_type=("plan_type", "last"),
+            )
+        )
+        grouped.index = grouped.index.astype("string")
+
+        # One hash lookup per affected student, whatever the size of the cache
+        positions = self.students.index.get_indexer(grouped.index)
+        known = positions >= 0
+        if known.any():
+            updates = grouped[known]
+            stored = self.students.iloc[positions[known]].set_axis(updates.index)
+            updates = updates.assign(
+                total_paid=updates["total_paid"] + stored["total_paid"],
+                payment_count=updates["payment_count"] + stored["payment_count"],
+                first_paid_at=np.minimum(
+                    updates["first_paid_at"], stored["first_paid_at"]
+                ),
+                # The plan of the latest payment wins
+                plan_type=updates["plan_type"]
+                .astype("string")
+                .where(
+                    updates["last_paid_at"] >= stored["last_paid_at"],
+                    stored["plan_type"].astype("string"),
+                ),
+                last_paid_at=np.maximum(
+                    updates["last_paid_at"], stored["last_paid_at"]
+                ),
+            )
+            grouped = pd.concat([updates, grouped[~known]])
+            positions = np.concatenate([positions[known], positions[~known]])
+
+        grouped["ltv"] = compute_lifetime_values(
+            grouped, self.factors, self.horizon_months
+        )
+
+        # Plan types stay categorical; grow the categories before writing new plans in
+        plan_types = self.students["plan_type"].cat.categories
+        new_plans = pd.Index(grouped["plan_type"].dropna().unique()).difference(
+            plan_types
+        )
+        if len(new_plans):
+            self.students["plan_type"] = self.students["plan_type"].cat.add_categories(
+                new_plans
+            )
+        grouped["plan_type"] = pd.Categorical(
+            grouped["plan_type"], categories=self.students["plan_type"].cat.categories
+        )
+
+        updated = positions >= 0
+        if updated.any():
+            columns = [
+                self.students.columns.get_loc(column) for column in grouped.columns
+            ]
+            self.students.iloc[positions[updated], columns] = grouped[updated]
+        if not updated.all():
+            self.students = (
+                pd.concat([self.students, grouped[~updated]])
+                if len(self.students)
+                else grouped[~updated]
+            )
+
+        self.logger.info(
+            "Updated lifetime value cache",
+            new_payments=len(new_payments),
+            students_recomputed=len(grouped),
+            students_cached=len(self.students),
+        )
+        return len(grouped)
+
+    def lifetime_values(self, student_ids: pd.Series) -> np.ndarray:
+        """Cached LTV of each given student, NaN for students without payments"""
+        values: np.ndarray = (
+            self.students["ltv"].reindex(student_ids.astype("string").to_numpy())
+            # Reindexing by the cached ids can return a view of the cache
+            .to_numpy(dtype=np.float64, copy=True)
+        )
+        return values
+
+    def report(self, student_ids: Optional[pd.Series] = None) -> Dict[str, Any]:
+        """LTV summary over the given students, or over every cached student"""
+        students = (
+            self.students
+            if student_ids is None
+            else self.students.reindex(
+                pd.Index(student_ids.astype("string").unique())
+            ).dropna(subset=["ltv"])
+        )
+        ltv = students["ltv"].to_numpy(dtype=np.float64)
+
+        bounds = np.array([minimum for _, minimum in reversed(LTV_SEGMENTS)])
+        buckets = np.bincount(
+            np.searchsorted(bounds, ltv, side="right"), minlength=len(bounds) + 1
+        )
+        distribution = {
+            name: {
+                "count": int(buckets[len(LTV_SEGMENTS) - position]),
+                "min_ltv": minimum,
+            }
+            for position, (name, minimum) in enumerate(LTV_SEGMENTS)
+        }
+
+        plans = students.astype({"plan_type": "category"}).groupby(
+            "plan_type", observed=True
+        )
+        by_plan = plans["ltv"].agg(["size", "mean"])
+        return {
+            "avg_ltv": round(float(ltv.mean()), 2) if len(ltv) else 0.0,
+            "students_valued": int(len(ltv)),
+            "ltv_distribution": distribution,
+            "ltv_by_plan_type": {
+                str(plan): {
+                    "count": int(row["size"]),
+                    "avg_ltv": round(float(row["mean"]), 2),
+                }
+                for plan, row in by_plan.iterrows()
+            },
+            "ltv_factors": dict(self.factors),
+        }
+
+
+class ReactivationModel:
+    """Logistic model of the probability that an inactive student comes back
+
+    Trained offline on historical reactivation outcomes and stored as one small
+    ``.npy`` array: feature means, feature scales, then coefficients followed by
+    the intercept. Loading folds the standardization into the coefficients, so
+    scoring an audience is a single matrix-vector product.
+    """
+
+    def __init__(
+        self,
+        mean: np.ndarray,
+        scale: np.ndarray,
+        coefficients: np.ndarray,
+        intercept: float,
+        features: Tuple[str, ...] = REACTIVATION_FEATURES,
+    ):
+        if not len(mean) == len(scale) == len(coefficients) == len(features):
+            raise ValueError("Reactivation model weights do not match its feature list")
+        self.features = features
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        self.intercept = float(intercept)
+
+        # (x - mean) / scale . w + b == x . (w / scale) + (b - mean . (w / scale))
+        self.raw_coefficients = self.coefficients / self.scale
+        self.raw_intercept = self.intercept - float(self.mean @ self.raw_coefficients)
+
+    @classmethod
+    def train(
+        cls,
+        features: np.ndarray,
+        outcomes: np.ndarray,
+        l2: float = 1e-3,
+        max_iterations: int = 50,
+        tolerance: float = 1e-8,
+    ) -> "ReactivationModel":
+        """Fit L2-regularized logistic regression by Newton's method"""
+        outcomes = np.asarray(outcomes, dtype=np.float64)
+        if len(features) != len(outcomes) or len(features) == 0:
+            raise ValueError("Training needs one outcome per feature row")
+
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0)
+        scale[scale == 0] = 1.0
+        design = np.column_stack([(features - mean) / scale, np.ones(len(features))])
+
+        # The intercept is not regularized
+        penalty = np.full(design.shape[1], l2 * len(design))
+        penalty[-1] = 0.0
+        weights = np.zeros(design.shape[1])
+        for _ in range(max_iterations):
+            probabilities = 1.0 / (1.0 + np.exp(-(design @ weights)))
+            gradient = design.T @ (probabilities - outcomes) + penalty * weights
+            hessian = (
+                design * (probabilities * (1 - probabilities))[:, None]
+            ).T @ design + np.diag(penalty)
+            step = np.linalg.solve(hessian + 1e-9 * np.eye(len(weights)), gradient)
+            weights -= step
+            if np.max(np.abs(step)) < tolerance:
+                break
+
+        return cls(mean, scale, weights[:-1], weights[-1])
+
+    def save(self, path: str) -> None:
+        """Write the weights as a (3, features + 1) float64 array"""
+        np.save(
+            path,
+            np.vstack(
+                [
+                    np.append(self.mean, 0.0),
+                    np.append(self.scale, 1.0),
+                    np.append(self.coefficients, self.intercept),
+                ]
+            ),
+        )
+
+    @classmethod
+    def load(
+        cls, path: str, features: Tuple[str, ...] = REACTIVATION_FEATURES
+    ) -> "ReactivationModel":
+        weights = np.load(path, mmap_mode="r")
+        if weights.shape != (3, len(features) + 1):
+            raise ValueError(
+                f"Reactivation model at {path} has shape {weights.shape}, "
+                f"expected {(3, len(features) + 1)}"
+            )
+        return cls(
+            weights[0, :-1], weights[1, :-1], weights[2, :-1], weights[2, -1], features
+        )
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        logits = features @ self.raw_coefficients + self.raw_intercept
+        return 1.0 / (1.0 + np.exp(-np.clip(logits, -500, 500)))
+
+    def score_profiles(self, profiles: pd.DataFrame) -> np.ndarray:
+        """Reactivation probability of every student in a profile frame"""
+        return self.predict_proba(profile_features(profiles, self.features))
+
+    def key_predictors(self) -> List[str]:
+        """Features ordered by the magnitude of their standardized coefficient"""
+        return [
+            self.features[index]
+            for index in np.argsort(-np.abs(self.coefficients), kind="stable")
+        ]
+
+
+def probability_report(probabilities: np.ndarray) -> Dict[str, Any]:
+    """Bucket reactivation probabilities into the high/medium/low distribution"""
+    bounds = np.array([minimum for _, minimum in reversed(PROBABILITY_BUCKETS)])
+    buckets = np.searchsorted(bounds, probabilities, side="right") - 1
+    counts = np.bincount(buckets, minlength=len(bounds))
+    sums = np.bincount(buckets, weights=probabilities, minlength=len(bounds))
+
+    distribution = {}
+    for position, (name, _) in enumerate(PROBABILITY_BUCKETS):
+        bucket = len(PROBABILITY_BUCKETS) - 1 - position
+        distribution[name] = {
+            "count": int(counts[bucket]),
+            "avg_prob": (
+                round(float(sums[bucket] / counts[bucket]), 4)
+                if counts[bucket]
+                else 0.0
+            ),
+        }
+
+    return {
+        "students_scored": int(len(probabilities)),
+        # Mean distance from the undecided 0.5, rescaled to 0..1
+        "prediction_confidence": (
+            round(float(np.mean(np.abs(probabilities - 0.5)) * 2), 4)
+            if len(probabilities)
+            else 0.0
+        ),
+        "expected_reactivations": round(float(probabilities.sum()), 1),
+        "probability_distribution": distribution,
+    }
+
+
+@dataclass
+class SegmentEconomics:
+    """Expected returns and messaging costs of one campaign segment
+
+    ``message_costs`` is the cost curve of the segment: the cost per message of
+    each successive touch, so its length is the maximum number of messages a
+    student receives. Each touch converts ``touch_decay`` times as well as the
+    previous one.
+    """
+
+    name: str
+    size: int
+    conversion_rate: float
+    ltv: float
+    message_costs: Tuple[float, ...] = (0.50, 0.50, 0.50)
+    touch_decay: float = 0.5
+
+
+def allocate_budget(segments: List[SegmentEconomics], budget: float) -> Dict[str, Any]:
+    """Split a budget across segments to maximize expected revenue
+
+    Every (segment, touch) pair is a block of ``size`` messages with a constant
+    return per unit spent. Funding blocks in order of decreasing return, the
+    last one partially, is the exact optimum of this linear program; blocks
+    returning less than they cost are never funded, so part of the budget can
+    stay unallocated. Later touches are ranked no higher than earlier touches of
+    the same segment, so follow-ups are only funded after first contacts.
+    """
+    if budget < 0:
+        raise ValueError("Budget cannot be negative")
+    if not segments:
+        return {
+            "allocations": {},
+            "total_spend": 0.0,
+            "unallocated": round(float(budget), 2),
+            "expected_conversions": 0.0,
+            "expected_revenue": 0.0,
+            "expected_roi": 0.0,
+        }
+
+    touches = max(len(segment.message_costs) for segment in segments)
+    costs = np.full((len(segments), touches), np.inf)
+    for row, segment in enumerate(segments):
+        costs[row, : len(segment.message_costs)] = segment.message_costs
+    if np.any(costs <= 0):
+        raise ValueError("Message costs must be positive")
+
+    sizes = np.array([segment.size for segment in segments], dtype=np.float64)[:, None]
+    decay = np.array([segment.touch_decay for segment in segments])[
+        :, None
+    ] ** np.arange(touches)
+    conversions_per_message = (
+        np.array([segment.conversion_rate for segment in segments])[:, None] * decay
+    )
+    revenue_per_message = (
+        conversions_per_message
+        * np.array([segment.ltv for segment in segments])[:, None]
+    )
+
+    ratio = np.minimum.accumulate(revenue_per_message / costs, axis=1)
+    block_cost = np.where(np.isfinite(costs), costs, 0.0) * sizes
+    candidates = np.flatnonzero((ratio > 1.0) & (block_cost > 0))
+
+    # Fund candidate blocks in order of decreasing return; the block crossing the
+    # budget is funded partially
+    ordered = candidates[np.argsort(-ratio.ravel()[candidates], kind="stable")]
+    ordered_cost = block_cost.ravel()[ordered]
+    spent_before = np.cumsum(ordered_cost) - ordered_cost
+    funded: np.ndarray = np.zeros(costs.size)
+    funded[ordered] = np.clip((budget - spent_before) / ordered_cost, 0.0, 1.0)
+    funded = funded.reshape(costs.shape)
+
+    spend = funded * block_cost
+    messages = funded * np.where(np.isfinite(costs), sizes, 0.0)
+    conversions = messages * conversions_per_message
+    revenue = messages * revenue_per_message
+
+    allocations = {}
+    for row, segment in enumerate(segments):
+        segment_spend = float(spend[row].sum())
+        allocations[segment.name] = {
+            "budget_share": round(segment_spend / budget, 4) if budget else 0.0,
+            "spend": round(segment_spend, 2),
+            "messages": int(round(messages[row].sum())),
+            "students_reached": int(round(messages[row, 0])),
+            "touches_funded": int(np.count_nonzero(funded[row] > 0)),
+            "expected_conversions": round(float(conversions[row].sum()), 1),
+            "expected_revenue": round(float(revenue[row].sum()), 2),
+            "expected_roi": (
+                round(float(revenue[row].sum()) / segment_spend, 2)
+                if segment_spend
+                else 0.0
+            ),
+        }
+
+    total_spend = float(spend.sum())
+    return {
+        "allocations": allocations,
+        "total_spend": round(total_spend, 2),
+        "unallocated": round(float(budget) - total_spend, 2),
+        "expected_conversions": round(float(conversions.sum()), 1),
+        "expected_revenue": round(float(revenue.sum()), 2),
+        "expected_roi": (
+            round(float(revenue.sum()) / total_spend, 2) if total_spend else 0.0
+        ),
+    }
+
+
+def default_segment_economics() -> List[SegmentEconomics]:
+    """Economics of the campaign segments from the default estimates"""
+    return [
+        SegmentEconomics(
+            name,
+            size,
+            conversion_rate,
+            ltv,
+            tuple(CAMPAIGN_SEGMENTS[name]["message_costs"]),
+        )
+        for name, (size, conversion_rate, ltv) in DEFAULT_SEGMENT_ESTIMATES.items()
+    ]
+
+
+def assign_campaign_segments(
+    profiles: pd.DataFrame,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Campaign segment code, probability and LTV for every profile
+
+    Needs ``reactivation_probability`` and ``ltv`` columns. Students without a
+    probability (the active ones) get code -1; missing LTVs among the scored
+    ones count as their median. Codes index into ``CAMPAIGN_SEGMENTS``.
+    """
+    probabilities = profiles["reactivation_probability"].to_numpy(dtype=np.float64)
+    scored = ~np.isnan(probabilities)
+    ltv = profiles["ltv"].to_numpy(dtype=np.float64, copy=True)
+    ltv[~scored] = np.nan
+    if scored.any() and not np.isnan(ltv[scored]).all():
+        ltv[scored] = np.where(
+            np.isnan(ltv[scored]), np.nanmedian(ltv[scored]), ltv[scored]
+        )
+    else:
+        ltv[scored] = 0.0
+
+    names = list(CAMPAIGN_SEGMENTS)
+    conditions = [
+        scored
+        & (probabilities >= segment["min_probability"])
+        & (ltv >= segment["min_ltv"])
+        for segment in CAMPAIGN_SEGMENTS.values()
+    ]
+    codes = np.select(
+        conditions, np.arange(len(names)), default=np.where(scored, len(names) - 1, -1)
+    )
+    return codes, probabilities, ltv
+
+
+def segment_economics_from_profiles(
+    profiles: pd.DataFrame, population: Optional[int] = None
+) -> List[SegmentEconomics]:
+    """Assign scored students to the campaign segments and average their economics
+
+    Students are assigned by ``assign_campaign_segments``. When the profiles are
+    a uniform sample of ``population`` students, segment sizes are scaled up to
+    the whole population.
+    """
+    codes, probabilities, ltv = assign_campaign_segments(profiles)
+    scored = codes >= 0
+    codes, probabilities, ltv = codes[scored], probabilities[scored], ltv[scored]
+
+    names = list(CAMPAIGN_SEGMENTS)
+    sizes = np.bincount(codes, minlength=len(names))
+    scale = population / len(profiles) if population and len(profiles) else 1.0
+    probability_sums = np.bincount(codes, weights=probabilities, minlength=len(names))
+    ltv_sums = np.bincount(codes, weights=ltv, minlength=len(names))
+
+    return [
+        SegmentEconomics(
+            name=name,
+            size=int(round(sizes[index] * scale)),
+            conversion_rate=(
+                float(probability_sums[index] / sizes[index]) if sizes[index] else 0.0
+            ),
+            ltv=float(ltv_sums[index] / sizes[index]) if sizes[index] else 0.0,
+            message_costs=tuple(CAMPAIGN_SEGMENTS[name]["message_costs"]),
+        )
+        for index, name in enumerate(names)
+    ]
@@ -0,0 +1,563 @@
+"""
+Send Planning for WhatsApp Campaigns
+
+This module provides the send planner that turns campaign segments into
+concrete per-message send times. Platform limits are enforced with
+hierarchical token buckets (per minute, per hour, per day) and messages are
+drawn from heap-ordered queues by priority, so follow-ups become due without
+starving behind first contacts. Hour-of-week response histograms learned from
+past replies pick the best send slot per contact and per segment.
+"""
+
+import heapq
+import itertools
+from collections import deque
+from typing import Deque, Dict, List, Any, Iterable, Iterator, Optional, Tuple
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import structlog
+
+from .data_pipeline import chain_digest
+
+logger = structlog.get_logger(__name__)
+
+SECONDS_PER_DAY = 86400
+SECONDS_PER_WEEK = 7 * SECONDS_PER_DAY
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """At most ``capacity`` messages in any window of ``period_seconds``"""
+
+    capacity: int
+    period_seconds: float
+
+
+# WhatsApp Business sending limits, finest first
+WHATSAPP_BUSINESS_LIMITS = (
+    RateLimit(3, 60),
+    RateLimit(250, 3600),
+    RateLimit(1000, SECONDS_PER_DAY),
+)
+
+# Local hours during which messages may be sent, [open, close)
+DEFAULT_ACTIVE_HOURS = (9, 21)
+
+# Hour-of-week slots, Monday 00:00 is slot 0
+HOURS_PER_WEEK = 168
+
+WEEKDAYS = (
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+)
+
+# Largest count a histogram bin holds before its row is halved
+MAX_BIN_COUNT = int(np.iinfo(np.uint16).max)
+
+
+@dataclass
+class SendRequest:
+    """Messages to plan for one segment
+
+    ``send_slots`` optionally holds one hour-of-week slot per recipient, -1 for
+    no preference; each touch then waits for the recipient's slot to open.
+    """
+
+    segment: str
+    recipients: int
+    priority: int
+    touches: int = 1
+    follow_up_seconds: float = 3 * SECONDS_PER_DAY
+    send_slots: Optional[np.ndarray] = None
+
+    def __post_init__(self) -> None:
+        if self.send_slots is not None and len(self.send_slots) != self.recipients:
+            raise ValueError(
+                f"Segment {self.segment} has {self.recipients} recipients "
+                f"but {len(self.send_slots)} send slots"
+            )
+
+
+@dataclass
+class PlannedSend:
+    """One message with its send time; ``recipient`` indexes the segment's recipients"""
+
+    send_at: datetime
+    segment: str
+    recipient: int
+    touch: int
+    sequence: int
+
+
+class TokenBucket:
+    """Token bucket whose tokens come back one period after they are spent
+
+    Unlike continuous refill, which lets up to twice the capacity through in a
+    period after an idle stretch, this never exceeds the capacity in any window
+    of the period, which is how platform limits are counted. The bucket keeps
+    the spend times of its ``capacity`` tokens.
+    """
+
+    __slots__ = ("capacity", "period", "spent")
+
+    def __init__(self, limit: RateLimit):
+        if limit.capacity < 1 or limit.period_seconds <= 0:
+            raise ValueError(f"Invalid rate limit: {limit}")
+        self.capacity = limit.capacity
+        self.period = limit.period_seconds
+        self.spent: Deque[float] = deque(maxlen=limit.capacity)
+
+    def ready_at(self, now: float) -> float:
+        """Earliest time, not before ``now``, at which a token is available"""
+        if len(self.spent) < self.capacity:
+            return now
+        recycled = self.spent[0] + self.period
+        return recycled if recycled > now else now
+
+    def take(self, now: float) -> None:
+        # The deque is bounded, so the oldest token is recycled
+        self.spent.append(now)
+
+
+class SendPlanner:
+    """Plans per-message send times under hierarchical rate limits
+
+    Messages wait in two heaps: due messages ordered by (priority, follow-ups
+    first, sequence) and not-yet-due messages ordered by due time. Each send
+    goes at the earliest instant every bucket has a token and the active hours
+    allow, to the best message due by then. Recipients with a send slot become
+    due when their slot next opens, so first contacts go out in slot order.
+    Planning is lazy, so the schedule can be streamed and consumed while it is
+    being computed.
+    """
+
+    def __init__(
+        self,
+        limits: Tuple[RateLimit, ...] = WHATSAPP_BUSINESS_LIMITS,
+        active_hours: Optional[Tuple[int, int]] = DEFAULT_ACTIVE_HOURS,
+    ):
+        if (
+            active_hours is not None
+            and not 0 <= active_hours[0] < active_hours[1] <= 24
+        ):
+            raise ValueError("Active hours must satisfy 0 <= open < close <= 24")
+        self.limits = limits
+        self.active_hours = active_hours
+
+    def plan(
+        self, requests: List[SendRequest], start: datetime
+    ) -> Iterator[PlannedSend]:
+        """Yield every planned message in send order"""
+        buckets = [TokenBucket(limit) for limit in self.limits]
+        # Offsets are kept relative to the start; midnight gives the active-hours phase
+        midnight = (
+            start - start.replace(hour=0, minute=0, second=0, microsecond=0)
+        ).total_seconds()
+        week_phase = start.weekday() * SECONDS_PER_DAY + midnight
+        sequence = itertools.count()
+
+        # First touches go out in order of readiness; without slots, in recipient order
+        orders: List[Optional[np.ndarray]] = []
+        ready: List[Optional[np.ndarray]] = []
+        for request in requests:
+            if request.send_slots is None:
+                orders.append(None)
+                ready.append(None)
+                continue
+            slots = np.asarray(request.send_slots, dtype=np.int64)
+            offsets = slot_offsets(slots, np.zeros(len(slots)), week_phase)
+            ranked = np.argsort(offsets, kind="stable")
+            orders.append(ranked)
+            ready.append(offsets[ranked])
+
+        # Entries are (priority, -touch, sequence, request, target); a first-touch
+        # target is a position in the request's order, standing for the next
+        # recipient, and a follow-up target is the recipient itself
+        due: List[Tuple[int, int, int, int, int]] = []
+        waiting: List[Tuple[float, int, int, int, int, int]] = []
+
+        def queue_first_touch(index: int, position: int, now: float) -> None:
+            request = requests[index]
+            offsets = ready[index]
+            ready_at = 0.0 if offsets is None else float(offsets[position])
+            if ready_at <= now:
+                heapq.heappush(
+                    due, (request.priority, 0, next(sequence), index, position)
+                )
+            else:
+                heapq.heappush(
+                    waiting,
+                    (ready_at, request.priority, 0, next(sequence), index, position),
+                )
+
+        for index, request in enumerate(requests):
+            if request.recipients > 0:
+                queue_first_touch(index, 0, 0.0)
+
+        now = 0.0
+        planned = 0
+        while due or waiting:
+            send = now
+            for bucket in buckets:
+                send = bucket.ready_at(send)
+            send = self._next_open(send, midnight)
+            while waiting and waiting[0][0] <= send:
+                _, priority, order, number, index, target = heapq.heappop(waiting)
+                heapq.heappush(due, (priority, order, number, index, target))
+            if not due:
+                now = waiting[0][0]
+                continue
+
+            priority, order, _, index, target = heapq.heappop(due)
+            request = requests[index]
+            touch = -order
+            for bucket in buckets:
+                bucket.take(send)
+            now = send
+
+            recipient = target
+            if touch == 0:
+                recipient_order = orders[index]
+                if recipient_order is not None:
+                    recipient = int(recipient_order[target])
+                if target + 1 < request.recipients:
+                    queue_first_touch(index, target + 1, send)
+            if touch + 1 < request.touches:
+                follow_up = send + request.follow_up_seconds
+                if request.send_slots is not None:
+                    follow_up = float(
+                        slot_offsets(
+                            request.send_slots[recipient : recipient + 1],
+                            np.array([follow_up]),
+                            week_phase,
+                        )[0]
+                    )
+                # Later touches sort first among due messages of the same priority
+                heapq.heappush(
+                    waiting,
+                    (
+                        follow_up,
+                        priority,
+                        -(touch + 1),
+                        next(sequence),
+                        index,
+                        recipient,
+                    ),
+                )
+
+            yield PlannedSend(
+                send_at=start + timedelta(seconds=send),
+                segment=request.segment,
+                recipient=recipient,
+                touch=touch,
+                sequence=planned,
+            )
+            planned += 1
+
+    def _next_open(self, offset: float, midnight: float) -> float:
+        """Earliest offset, not before ``offset``, inside the active hours"""
+        if self.active_hours is None:
+            return offset
+        opens, closes = self.active_hours[0] * 3600, self.active_hours[1] * 3600
+        day_start = offset - (offset + midnight) % SECONDS_PER_DAY
+        within_day = offset - day_start
+        if within_day < opens:
+            return day_start + opens
+        if within_day >= closes:
+            return day_start + SECONDS_PER_DAY + opens
+        return offset
+
+
+def slot_offsets(
+    slots: np.ndarray, offsets: np.ndarray, week_phase: float
+) -> np.ndarray:
+    """Earliest time, not before each offset, inside each hour-of-week slot
+
+    Offsets are seconds from a start that lies ``week_phase`` seconds after
+    Monday 00:00. Slot -1 means no preference and keeps the offset as it is.
+    """
+    since_monday = (offsets + week_phase) % SECONDS_PER_WEEK
+    wait = (slots * 3600 - since_monday) % SECONDS_PER_WEEK
+    # Already inside the slot's hour
+    inside = wait > SECONDS_PER_WEEK - 3600
+    ready: np.ndarray = np.where((slots < 0) | inside, offsets, offsets + wait)
+    return ready
+
+
+def summarize_send_plan(sends: Iterable[PlannedSend]) -> Dict[str, Any]:
+    """Per-segment and per-day message counts with first and last send times
+
+    ``weekly_slots`` groups the messages by week of the campaign and
+    hour-of-week slot, counting each segment and touch.
+    """
+    segments: Dict[str, Dict[str, Any]] = {}
+    days: Dict[str, int] = {}
+    slot_counts: Dict[Tuple[int, int, str, int], int] = {}
+    first_send = last_send = None
+
+    for send in sends:
+        summary = segments.get(send.segment)
+        if summary is None:
+            summary = segments[send.segment] = {
+                "messages": 0,
+                "first_send": send.send_at,
+                "touches": 0,
+            }
+        summary["messages"] += 1
+        summary["last_send"] = send.send_at
+        summary["touches"] = max(summary["touches"], send.touch + 1)
+
+        day = send.send_at.date().isoformat()
+        days[day] = days.get(day, 0) + 1
+        first_send = first_send or send.send_at
+        last_send = send.send_at
+
+        week = (send.send_at - first_send).days // 7 + 1
+        slot = send.send_at.weekday() * 24 + send.send_at.hour
+        key = (week, slot, send.segment, send.touch)
+        slot_counts[key] = slot_counts.get(key, 0) + 1
+
+    for summary in segments.values():
+        hours = (summary["last_send"] - summary["first_send"]).total_seconds() / 3600
+        summary["messages_per_hour"] = (
+            round(summary["messages"] / hours, 1)
+            if hours
+            else float(summary["messages"])
+        )
+        summary["total_duration"] = str(summary["last_send"] - summary["first_send"])
+        summary["first_send"] = summary["first_send"].isoformat()
+        summary["last_send"] = summary["last_send"].isoformat()
+
+    weekly_slots: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    for (week, slot, segment, touch), messages in slot_counts.items():
+        weekly_slots.setdefault(f"week_{week}", {}).setdefault(
+            format_slot(slot), []
+        ).append({"segment": segment, "touch": touch, "messages": messages})
+
+    return {
+        "total_messages": sum(days.values()),
+        "first_send": first_send.isoformat() if first_send else None,
+        "last_send": last_send.isoformat() if last_send else None,
+        "days": len(days),
+        "max_messages_per_day": max(days.values(), default=0),
+        "segments": segments,
+        "messages_per_day": days,
+        "weekly_slots": weekly_slots,
+    }
+
+
+def hour_of_week(timestamps: pd.Series) -> np.ndarray:
+    """Hour-of-week slot of each timestamp"""
+    timestamps = pd.to_datetime(timestamps)
+    slots: np.ndarray = (timestamps.dt.dayofweek * 24 + timestamps.dt.hour).to_numpy(
+        dtype=np.int64
+    )
+    return slots
+
+
+def format_slot(slot: int) -> str:
+    """Readable hour-of-week slot such as tuesday 10:00-11:00"""
+    day, hour = divmod(int(slot), 24)
+    return f"{WEEKDAYS[day]} {hour:02d}:00-{(hour + 1) % 24:02d}:00"
+
+
+def active_slot_mask(
+    active_hours: Optional[Tuple[int, int]] = DEFAULT_ACTIVE_HOURS,
+) -> np.ndarray:
+    """Boolean mask of the hour-of-week slots inside the active hours"""
+    hours = np.arange(HOURS_PER_WEEK) % 24
+    if active_hours is None:
+        return np.ones(HOURS_PER_WEEK, dtype=bool)
+    return (hours >= active_hours[0]) & (hours < active_hours[1])
+
+
+def add_counts(histograms: np.ndarray, bins: np.ndarray, counts: np.ndarray) -> None:
+    """Add reply counts to flat ``bins`` of uint16 histograms in place
+
+    ``bins`` must be distinct and index the histograms as consecutive 168-bin
+    rows. Rows that would overflow are halved until they fit; halving keeps the
+    shape of a row, so its best slot survives, and ages old replies in favour
+    of recent ones.
+    """
+    histograms = histograms.reshape(-1, HOURS_PER_WEEK)
+    flat = histograms.reshape(-1)
+    totals = flat[bins] + counts.astype(np.int64)
+    overflow = totals > MAX_BIN_COUNT
+    if overflow.any():
+        rows = np.unique(bins[overflow] // HOURS_PER_WEEK)
+        in_rows = np.isin(bins // HOURS_PER_WEEK, rows)
+        full = histograms[rows].astype(np.int64)
+        full.reshape(-1)[
+            np.searchsorted(rows, bins[in_rows] // HOURS_PER_WEEK) * HOURS_PER_WEEK
+            + bins[in_rows] % HOURS_PER_WEEK
+        ] += counts[in_rows]
+        while (full.max(axis=1) > MAX_BIN_COUNT).any():
+            full[full.max(axis=1) > MAX_BIN_COUNT] >>= 1
+        histograms[rows] = full
+        bins, totals = bins[~in_rows], totals[~in_rows]
+    flat[bins] = totals
+
+
+class ResponseHistograms:
+    """Per-contact and per-segment hour-of-week reply histograms
+
+    Every contact and segment gets a compact 168-bin uint16 row that is updated
+    as replies arrive. Best send slots come from a vectorized argmax over the
+    rows, falling back to the segment and then to all replies for contacts
+    with too little history of their own.
+    """
+
+    def __init__(self, min_replies: int = 3):
+        if min_replies < 1:
+            raise ValueError("min_replies must be at least 1")
+        self.min_replies = min_replies
+        self.contacts = pd.Index([], dtype="string")
+        # Rows past len(contacts) are spare capacity, grown by doubling
+        self._contact_rows = np.zeros((0, HOURS_PER_WEEK), dtype=np.uint16)
+        self.segment_counts: Dict[str, np.ndarray] = {}
+        self.overall_counts = np.zeros(HOURS_PER_WEEK, dtype=np.uint16)
+        self.replies_recorded = 0
+        # Changes with every reply folded in, for keying outputs built from the rows
+        self.state_digest = ""
+
+    def __len__(self) -> int:
+        return len(self.contacts)
+
+    @property
+    def contact_counts(self) -> np.ndarray:
+        """One histogram row per known contact, in ``contacts`` order"""
+        return self._contact_rows[: len(self.contacts)]
+
+    def add_replies(self, replies: pd.DataFrame) -> int:
+        """Fold cleaned replies (student_id, replied_at, optional segment) in"""
+        if replies.empty:
+            return 0
+
+        slots = hour_of_week(replies["replied_at"])
+        # Look up each distinct contact once, replies repeat contacts heavily
+        codes, contact_ids = pd.factorize(replies["student_id"].astype("string"))
+        contact_rows = self.contacts.get_indexer(contact_ids)
+        unseen = contact_rows < 0
+        if unseen.any():
+            known = len(self.contacts)
+            contact_rows[unseen] = np.arange(known, known + unseen.sum())
+            if known + unseen.sum() > len(self._contact_rows):
+                rows = max(known + unseen.sum(), 2 * len(self._contact_rows))
+                grown = np.zeros((rows, HOURS_PER_WEEK), dtype=np.uint16)
+                grown[:known] = self._contact_rows[:known]
+                self._contact_rows = grown
+            self.contacts = self.contacts.append(
+                pd.Index(contact_ids[unseen], dtype="string")
+            )
+
+        # Sparse (contact, slot) counts, a dense update would be contacts x 168
+        bins, counts = np.unique(
+            contact_rows[codes] * HOURS_PER_WEEK + slots, return_counts=True
+        )
+        add_counts(self._contact_rows, bins, counts)
+
+        if "segment" in replies.columns:
+            codes, segments = pd.factorize(replies["segment"])
+            labelled = codes >= 0
+            bins, counts = np.unique(
+                codes[labelled] * HOURS_PER_WEEK + slots[labelled], return_counts=True
+            )
+            bounds = np.searchsorted(
+                bins, np.arange(len(segments) + 1) * HOURS_PER_WEEK
+            )
+            for code, segment in enumerate(segments):
+                histogram = self.segment_counts.setdefault(
+                    str(segment), np.zeros(HOURS_PER_WEEK, dtype=np.uint16)
+                )
+                part = slice(bounds[code], bounds[code + 1])
+                add_counts(histogram, bins[part] % HOURS_PER_WEEK, counts[part])
+
+        bins, counts = np.unique(slots, return_counts=True)
+        add_counts(self.overall_counts, bins, counts)
+        self.replies_recorded += len(replies)
+        self.state_digest = chain_digest(
+            self.state_digest,
+            replies.reindex(columns=["student_id", "replied_at", "segment"]),
+        )
+        return len(replies)
+
+    def best_slot(
+        self, counts: np.ndarray, allowed: Optional[np.ndarray] = None
+    ) -> Optional[int]:
+        """Best allowed slot of one histogram, None without allowed replies"""
+        allowed = np.ones(HOURS_PER_WEEK, dtype=bool) if allowed is None else allowed
+        masked = np.where(allowed, counts, 0)
+        return int(masked.argmax()) if masked.any() else None
+
+    def best_slots(
+        self,
+        contact_ids: pd.Series,
+        segment: Optional[str] = None,
+        allowed: Optional[np.ndarray] = None,
+        chunk_size: int = 65536,
+    ) -> np.ndarray:
+        """Best allowed send slot of each contact, -1 where no history applies
+
+        Contacts with fewer than ``min_replies`` allowed replies take the best
+        slot of ``segment``, or of all replies when the segment has none.
+        """
+        allowed = np.ones(HOURS_PER_WEEK, dtype=bool) if allowed is None else allowed
+        allowed_slots = np.flatnonzero(allowed)
+        segment_counts = (
+            self.segment_counts.get(segment) if segment is not None else None
+        )
+        fallback = (
+            None if segment_counts is None else self.best_slot(segment_counts, allowed)
+        )
+        if fallback is None:
+            fallback = self.best_slot(self.overall_counts, allowed)
+
+        rows = self.contacts.get_indexer(pd.Series(contact_ids).astype("string"))
+        slots = np.full(len(rows), -1 if fallback is None else fallback, dtype=np.int64)
+        known = np.flatnonzero(rows >= 0)
+        # Chunked so the gathered rows stay small for large audiences
+        for start in range(0, len(known), chunk_size):
+            positions = known[start : start + chunk_size]
+            counts = self.contact_counts[rows[positions][:, None], allowed_slots]
+            enough = counts.sum(axis=1, dtype=np.int64) >= self.min_replies
+            slots[positions[enough]] = allowed_slots[counts[enough].argmax(axis=1)]
+        return slots
+
+    def timing_report(
+        self,
+        segment: Optional[str] = None,
+        allowed: Optional[np.ndarray] = None,
+        windows: int = 2,
+    ) -> Dict[str, Any]:
+        """Most and least responsive allowed slots of a segment, or of all replies"""
+        allowed = np.ones(HOURS_PER_WEEK, dtype=bool) if allowed is None else allowed
+        counts = self.segment_counts.get(segment) if segment is not None else None
+        source = "segment"
+        if counts is None or not counts[allowed].any():
+            counts, source = self.overall_counts, "all_replies"
+
+        allowed_slots = np.flatnonzero(allowed)
+        ranked = allowed_slots[
+            np.argsort(-counts[allowed_slots].astype(np.int64), kind="stable")
+        ]
+        responsive = [slot for slot in ranked if counts[slot] > 0]
+        return {
+            "primary": format_slot(responsive[0]) if responsive else None,
+            "secondary": [format_slot(slot) for slot in responsive[1:windows]],
+            "avoid": [format_slot(slot) for slot in ranked[::-1][:windows]],
+            "replies": int(counts.sum(dtype=np.int64)),
+            "source": source,
+        }
+
+    def day_preferences(self, days: int = 3) -> Dict[str, List[str]]:
+        """Weekdays ranked by replies received"""
+        by_day = self.overall_counts.reshape(7, 24).sum(axis=1, dtype=np.int64)
+        ranked = [WEEKDAYS[day] for day in np.argsort(-by_day, kind="stable")]
+        return {"best_days": ranked[:days], "avoid_days": ranked[-2:]}
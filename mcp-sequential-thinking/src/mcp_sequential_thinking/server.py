@@ -7,8 +7,11 @@ structured sequential thinking capabilities for WhatsApp automation orchestratio
 
 import asyncio
 import json
+import os
+from dataclasses import asdict
+from urllib.parse import urlsplit, parse_qs
 from typing import Dict, List, Any, Optional, Sequence
-from datetime import datetime, timedelta
+from datetime import timedelta
 import structlog
 from mcp.server import Server
 from mcp.server.models import InitializationOptions
@@ -24,39 +27,79 @@ from mcp.types import (
     ReadResourceResult,
 )
 
-from .thinking import ThinkingEngine, WhatsAppCampaignThinking, ThinkingContext, ThinkingStage
+from .thinking import (
+    ThinkingEngine,
+    WhatsAppCampaignThinking,
+    ThinkingContext,
+    ThinkingStage,
+    Priority,
+)
+from .checkpoint import CheckpointJournal
+from .clock import Clock, SystemClock
+from .segmentation_models import ReactivationModel
 from .workflows import WorkflowOrchestrator, WorkflowType, WorkflowContext
+from .artifact_cache import StageArtifactCache
 from .monitoring import ROITracker, PerformanceMonitor, OptimizationEngine
 from .error_handling import ErrorHandlingEngine, ErrorContext
 
 logger = structlog.get_logger(__name__)
 
+
 class SequentialThinkingServer:
     """MCP Server for sequential thinking and WhatsApp automation orchestration"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        journal_path: Optional[str] = None,
+        clock: Optional[Clock] = None,
+        reactivation_model_path: Optional[str] = None,
+        artifact_cache_path: Optional[str] = None,
+    ):
         self.server = Server("sequential-thinking")
-        self.thinking_engine = ThinkingEngine()
-        self.workflow_orchestrator = WorkflowOrchestrator()
-        self.roi_tracker = ROITracker()
-        self.performance_monitor = PerformanceMonitor()
-        self.error_handler = ErrorHandlingEngine()
-        self.optimization_engine = OptimizationEngine(self.roi_tracker, self.performance_monitor)
+        self.clock = clock or SystemClock()
+        journal = (
+            CheckpointJournal(journal_path, clock=self.clock) if journal_path else None
+        )
+        self.thinking_engine = ThinkingEngine(journal=journal, clock=self.clock)
+        reactivation_model = (
+            ReactivationModel.load(reactivation_model_path)
+            if reactivation_model_path
+            else None
+        )
+        artifact_cache = (
+            StageArtifactCache(artifact_cache_path) if artifact_cache_path else None
+        )
+        self.workflow_orchestrator = WorkflowOrchestrator(
+            clock=self.clock,
+            reactivation_model=reactivation_model,
+            artifact_cache=artifact_cache,
+            thinking_engine=self.thinking_engine,
+        )
+        self.roi_tracker = ROITracker(clock=self.clock)
+        self.performance_monitor = PerformanceMonitor(clock=self.clock)
+        self.error_handler = ErrorHandlingEngine(clock=self.clock)
+        self.optimization_engine = OptimizationEngine(
+            self.roi_tracker, self.performance_monitor
+        )
 
         # Server state
         self.active_campaigns: Dict[str, Dict[str, Any]] = {}
+        # Background tasks streaming step transitions to clients, keyed by pattern id
+        self._progress_forwarders: Dict[str, asyncio.Task] = {}
         self.server_config = {
             "name": "Sequential Thinking MCP Server",
             "version": "0.1.0",
-            "description": "Intelligent orchestration for WhatsApp automation campaigns",
+            "description": (
+                "Intelligent orchestration for WhatsApp automation campaigns"
+            ),
             "capabilities": [
                 "structured_thinking",
                 "workflow_orchestration",
                 "roi_tracking",
                 "performance_monitoring",
                 "error_handling",
-                "optimization"
-            ]
+                "optimization",
+            ],
         }
 
         self._setup_handlers()
@@ -73,32 +116,42 @@ class SequentialThinkingServer:
                         uri="thinking://campaigns",
                         name="Active Campaigns",
                         description="Currently active WhatsApp campaigns",
-                        mimeType="application/json"
+                        mimeType="application/json",
                     ),
                     Resource(
                         uri="thinking://patterns",
                         name="Thinking Patterns",
                         description="Available sequential thinking patterns",
-                        mimeType="application/json"
+                        mimeType="application/json",
+                    ),
+                    Resource(
+                        uri="thinking://patterns/index",
+                        name="Pattern Index",
+                        description="Thinking patterns indexed by campaign, "
+                        "current stage and status; "
+                        "filter with ?campaign_id=&stage=&status=",
+                        mimeType="application/json",
                     ),
                     Resource(
                         uri="thinking://performance",
                         name="Performance Metrics",
                         description="Real-time performance metrics and analytics",
-                        mimeType="application/json"
+                        mimeType="application/json",
                     ),
                     Resource(
                         uri="thinking://errors",
                         name="Error Logs",
                         description="Error logs and recovery information",
-                        mimeType="application/json"
+                        mimeType="application/json",
                     ),
                     Resource(
                         uri="thinking://optimizations",
                         name="Optimization Opportunities",
-                        description="Current optimization opportunities and recommendations",
-                        mimeType="application/json"
-                    )
+                        description=(
+                            "Current optimization opportunities and recommendations"
+                        ),
+                        mimeType="application/json",
+                    ),
                 ]
             )
 
@@ -111,7 +164,9 @@ class SequentialThinkingServer:
                     contents=[
                         TextContent(
                             type="text",
-                            text=json.dumps(self.active_campaigns, indent=2, default=str)
+                            text=json.dumps(
+                                self.active_campaigns, indent=2, default=str
+                            ),
                         )
                     ]
                 )
@@ -121,19 +176,49 @@ class SequentialThinkingServer:
                     "available_patterns": [
                         {
                             "name": "WhatsApp Campaign Orchestration",
-                            "description": "Complete campaign workflow with segmentation and optimization",
+                            "description": (
+                                "Complete campaign workflow with segmentation "
+                                "and optimization"
+                            ),
                             "stages": [stage.value for stage in ThinkingStage],
                             "typical_duration": "2-4 hours",
-                            "success_criteria": ["roi_target_met", "response_rate_achieved", "conversion_target_met"]
+                            "success_criteria": [
+                                "roi_target_met",
+                                "response_rate_achieved",
+                                "conversion_target_met",
+                            ],
+                            "execution_plan": (
+                                WhatsAppCampaignThinking.compiled_plan().describe()
+                            ),
                         }
                     ],
-                    "pattern_statistics": await self._get_pattern_statistics()
+                    "pattern_statistics": await self._get_pattern_statistics(),
                 }
                 return ReadResourceResult(
                     contents=[
                         TextContent(
                             type="text",
-                            text=json.dumps(patterns_info, indent=2, default=str)
+                            text=json.dumps(patterns_info, indent=2, default=str),
+                        )
+                    ]
+                )
+
+            elif str(uri).startswith("thinking://patterns/index"):
+                filters = {
+                    key: values[0]
+                    for key, values in parse_qs(urlsplit(str(uri)).query).items()
+                    if key in ("campaign_id", "stage", "status")
+                }
+                index_data = {
+                    "filters": filters,
+                    "pattern_ids": self.thinking_engine.find_patterns(**filters),
+                    "summary": self.thinking_engine.get_index_summary(),
+                }
+                return ReadResourceResult(
+                    contents=[
+                        TextContent(
+                            type="text",
+                            text=json.dumps(index_data, indent=2, default=str),
                         )
                     ]
                 )
@@ -141,13 +226,17 @@ class SequentialThinkingServer:
             elif uri == "thinking://performance":
                 performance_data = {}
                 for campaign_id in self.active_campaigns.keys():
-                    performance_data[campaign_id] = await self.performance_monitor.get_performance_summary(campaign_id)
+                    performance_data[campaign_id] = (
+                        await self.performance_monitor.get_performance_summary(
+                            campaign_id
+                        )
+                    )
 
                 return ReadResourceResult(
                     contents=[
                         TextContent(
                             type="text",
-                            text=json.dumps(performance_data, indent=2, default=str)
+                            text=json.dumps(performance_data, indent=2, default=str),
                         )
                     ]
                 )
@@ -158,21 +247,24 @@ class SequentialThinkingServer:
                     contents=[
                         TextContent(
                             type="text",
-                            text=json.dumps(error_stats, indent=2, default=str)
+                            text=json.dumps(error_stats, indent=2, default=str),
                         )
                     ]
                 )
 
             elif uri == "thinking://optimizations":
                 optimization_data = {}
+                optimizer = self.optimization_engine
                 for campaign_id in self.active_campaigns.keys():
-                    optimization_data[campaign_id] = await self.optimization_engine.analyze_optimization_opportunities(campaign_id)
+                    optimization_data[campaign_id] = (
+                        await optimizer.analyze_optimization_opportunities(campaign_id)
+                    )
 
                 return ReadResourceResult(
                     contents=[
                         TextContent(
                             type="text",
-                            text=json.dumps(optimization_data, indent=2, default=str)
+                            text=json.dumps(optimization_data, indent=2, default=str),
                         )
                     ]
                 )
@@ -187,7 +279,9 @@ class SequentialThinkingServer:
                 tools=[
                     Tool(
                         name="start_campaign_thinking",
-                        description="Start structured thinking process for a WhatsApp campaign",
+                        description=(
+                            "Start structured thinking process for a WhatsApp campaign"
+                        ),
                         inputSchema={
                             "type": "object",
                             "properties": {
@@ -201,24 +295,105 @@ class SequentialThinkingServer:
                                         "time_constraints": {"type": "object"},
                                         "data_sources": {"type": "object"},
                                         "target_metrics": {"type": "object"},
-                                        "constraints": {"type": "object"}
+                                        "constraints": {"type": "object"},
+                                        "priority": {
+                                            "type": "string",
+                                            "enum": [
+                                                priority.value for priority in Priority
+                                            ],
+                                            "default": "medium",
+                                        },
                                     },
-                                    "required": ["campaign_id", "target_audience_size", "roi_target"]
+                                    "required": [
+                                        "campaign_id",
+                                        "target_audience_size",
+                                        "roi_target",
+                                    ],
                                 }
                             },
-                            "required": ["campaign_config"]
-                        }
+                            "required": ["campaign_config"],
+                        },
                     ),
                     Tool(
-                        name="get_thinking_status",
-                        description="Get current status of a thinking pattern",
+                        name="schedule_campaign_thinking",
+                        description=(
+                            "Re-run campaign thinking on a recurring cron schedule"
+                        ),
                         inputSchema={
                             "type": "object",
                             "properties": {
-                                "pattern_id": {"type": "string"}
+                                "campaign_config": {
+                                    "type": "object",
+                                    "properties": {
+                                        "campaign_id": {"type": "string"},
+                                        "target_audience_size": {"type": "integer"},
+                                        "roi_target": {"type": "number"},
+                                        "budget_limit": {"type": "number"},
+                                        "time_constraints": {"type": "object"},
+                                        "priority": {
+                                            "type": "string",
+                                            "enum": [
+                                                priority.value for priority in Priority
+                                            ],
+                                            "default": "medium",
+                                        },
+                                    },
+                                    "required": [
+                                        "campaign_id",
+                                        "target_audience_size",
+                                        "roi_target",
+                                    ],
+                                },
+                                "cron_expression": {"type": "string"},
+                                "jitter_seconds": {"type": "number", "default": 0},
                             },
-                            "required": ["pattern_id"]
-                        }
+                            "required": ["campaign_config", "cron_expression"],
+                        },
+                    ),
+                    Tool(
+                        name="get_thinking_status",
+                        description="Get current status of a thinking pattern",
+                        inputSchema={
+                            "type": "object",
+                            "properties": {"pattern_id": {"type": "string"}},
+                            "required": ["pattern_id"],
+                        },
+                    ),
+                    Tool(
+                        name="watch_thinking_progress",
+                        description=(
+                            "Stream step progress of a thinking pattern as MCP "
+                            "progress notifications until it finishes"
+                        ),
+                        inputSchema={
+                            "type": "object",
+                            "properties": {"pattern_id": {"type": "string"}},
+                            "required": ["pattern_id"],
+                        },
+                    ),
+                    Tool(
+                        name="get_workflow_status",
+                        description=(
+                            "Get stage progress of a campaign workflow running "
+                            "in the background"
+                        ),
+                        inputSchema={
+                            "type": "object",
+                            "properties": {"workflow_id": {"type": "string"}},
+                            "required": ["workflow_id"],
+                        },
+                    ),
+                    Tool(
+                        name="cancel_workflow",
+                        description=(
+                            "Cancel a campaign workflow, or stop monitoring it "
+                            "once its stages are done"
+                        ),
+                        inputSchema={
+                            "type": "object",
+                            "properties": {"workflow_id": {"type": "string"}},
+                            "required": ["workflow_id"],
+                        },
                     ),
                     Tool(
                         name="track_campaign_roi",
@@ -229,22 +404,24 @@ class SequentialThinkingServer:
                                 "campaign_id": {"type": "string"},
                                 "investment": {"type": "number"},
                                 "revenue": {"type": "number"},
-                                "conversion_data": {"type": "object"}
+                                "conversion_data": {"type": "object"},
                             },
-                            "required": ["campaign_id"]
-                        }
+                            "required": ["campaign_id"],
+                        },
                     ),
                     Tool(
                         name="analyze_performance",
-                        description="Analyze current campaign performance and get insights",
+                        description=(
+                            "Analyze current campaign performance and get insights"
+                        ),
                         inputSchema={
                             "type": "object",
                             "properties": {
                                 "campaign_id": {"type": "string"},
-                                "time_range_hours": {"type": "integer", "default": 24}
+                                "time_range_hours": {"type": "integer", "default": 24},
                             },
-                            "required": ["campaign_id"]
-                        }
+                            "required": ["campaign_id"],
+                        },
                     ),
                     Tool(
                         name="optimize_campaign",
@@ -253,10 +430,10 @@ class SequentialThinkingServer:
                             "type": "object",
                             "properties": {
                                 "campaign_id": {"type": "string"},
-                                "optimization_action": {"type": "string"}
+                                "optimization_action": {"type": "string"},
                             },
-                            "required": ["campaign_id", "optimization_action"]
-                        }
+                            "required": ["campaign_id", "optimization_action"],
+                        },
                     ),
                     Tool(
                         name="handle_error",
@@ -266,10 +443,10 @@ class SequentialThinkingServer:
                             "properties": {
                                 "error_description": {"type": "string"},
                                 "error_context": {"type": "object"},
-                                "campaign_id": {"type": "string"}
+                                "campaign_id": {"type": "string"},
                             },
-                            "required": ["error_description"]
-                        }
+                            "required": ["error_description"],
+                        },
                     ),
                     Tool(
                         name="start_monitoring",
@@ -278,10 +455,10 @@ class SequentialThinkingServer:
                             "type": "object",
                             "properties": {
                                 "campaign_id": {"type": "string"},
-                                "monitoring_config": {"type": "object"}
+                                "monitoring_config": {"type": "object"},
                             },
-                            "required": ["campaign_id"]
-                        }
+                            "required": ["campaign_id"],
+                        },
                     ),
                     Tool(
                         name="execute_workflow",
@@ -290,34 +467,35 @@ class SequentialThinkingServer:
                             "type": "object",
                             "properties": {
                                 "workflow_type": {"type": "string"},
-                                "workflow_config": {"type": "object"}
+                                "workflow_config": {"type": "object"},
                             },
-                            "required": ["workflow_type", "workflow_config"]
-                        }
+                            "required": ["workflow_type", "workflow_config"],
+                        },
                     ),
                     Tool(
                         name="get_optimization_recommendations",
                         description="Get intelligent optimization recommendations",
                         inputSchema={
                             "type": "object",
-                            "properties": {
-                                "campaign_id": {"type": "string"}
-                            },
-                            "required": ["campaign_id"]
-                        }
+                            "properties": {"campaign_id": {"type": "string"}},
+                            "required": ["campaign_id"],
+                        },
                     ),
                     Tool(
                         name="simulate_campaign_outcome",
-                        description="Simulate potential campaign outcomes with different parameters",
+                        description=(
+                            "Simulate potential campaign outcomes with different "
+                            "parameters"
+                        ),
                         inputSchema={
                             "type": "object",
                             "properties": {
                                 "campaign_parameters": {"type": "object"},
-                                "simulation_scenarios": {"type": "array"}
+                                "simulation_scenarios": {"type": "array"},
                             },
-                            "required": ["campaign_parameters"]
-                        }
-                    )
+                            "required": ["campaign_parameters"],
+                        },
+                    ),
                 ]
             )
 
@@ -327,11 +505,29 @@ class SequentialThinkingServer:
 
             try:
                 if name == "start_campaign_thinking":
-                    result = await self._start_campaign_thinking(arguments["campaign_config"])
+                    result = await self._start_campaign_thinking(
+                        arguments["campaign_config"]
+                    )
+
+                elif name == "schedule_campaign_thinking":
+                    result = await self._schedule_campaign_thinking(arguments)
 
                 elif name == "get_thinking_status":
                     result = await self._get_thinking_status(arguments["pattern_id"])
 
+                elif name == "watch_thinking_progress":
+                    result = await self._watch_thinking_progress(
+                        arguments["pattern_id"]
+                    )
+
+                elif name == "get_workflow_status":
+                    result = await self.workflow_orchestrator.get_workflow_status(
+                        arguments["workflow_id"]
+                    )
+
+                elif name == "cancel_workflow":
+                    result = await self._cancel_workflow(arguments["workflow_id"])
+
                 elif name == "track_campaign_roi":
                     result = await self._track_campaign_roi(arguments)
 
@@ -362,22 +558,21 @@ class SequentialThinkingServer:
                 return CallToolResult(
                     content=[
                         TextContent(
-                            type="text",
-                            text=json.dumps(result, indent=2, default=str)
+                            type="text", text=json.dumps(result, indent=2, default=str)
                         )
                     ],
-                    isError=False
+                    isError=False,
                 )
 
             except Exception as e:
-                logger.error(f"Tool execution failed", tool=name, error=str(e))
+                logger.error("Tool execution failed", tool=name, error=str(e))
 
                 # Handle error through error handling system
                 error_context = ErrorContext(
                     error_id="",
-                    timestamp=datetime.now(),
+                    timestamp=self.clock.now(),
                     component="mcp_server",
-                    operation=f"tool_{name}"
+                    operation=f"tool_{name}",
                 )
 
                 await self.error_handler.handle_error(e, error_context)
@@ -386,52 +581,61 @@ class SequentialThinkingServer:
                     content=[
                         TextContent(
                             type="text",
-                            text=json.dumps({
-                                "error": str(e),
-                                "tool": name,
-                                "timestamp": datetime.now().isoformat()
-                            })
+                            text=json.dumps(
+                                {
+                                    "error": str(e),
+                                    "tool": name,
+                                    "timestamp": self.clock.now().isoformat(),
+                                }
+                            ),
                         )
                     ],
-                    isError=True
+                    isError=True,
                 )
 
-    async def _start_campaign_thinking(self, campaign_config: Dict[str, Any]) -> Dict[str, Any]:
+    async def _start_campaign_thinking(
+        self, campaign_config: Dict[str, Any]
+    ) -> Dict[str, Any]:
         """Start structured thinking process for a campaign"""
 
         # Create thinking context
-        thinking_context = ThinkingContext(
-            campaign_id=campaign_config["campaign_id"],
-            target_audience_size=campaign_config["target_audience_size"],
-            roi_target=campaign_config["roi_target"],
-            budget_limit=campaign_config.get("budget_limit", 5000.0),
-            time_constraints=campaign_config.get("time_constraints", {}),
-            current_performance={},
-            historical_data=[],
-            external_factors={}
-        )
+        thinking_context = self._build_thinking_context(campaign_config)
 
         # Start thinking pattern
-        campaign_thinking = WhatsAppCampaignThinking(context=thinking_context)
-        pattern_id = await self.thinking_engine.start_thinking(campaign_thinking)
+        campaign_thinking = WhatsAppCampaignThinking.create(
+            thinking_context,
+            self.clock.now(),
+            state_store=self.thinking_engine.state_store(
+                WhatsAppCampaignThinking.compiled_plan()
+            ),
+        )
+        pattern_id = await self.thinking_engine.start_thinking(
+            campaign_thinking,
+            priority=Priority(campaign_config.get("priority", Priority.MEDIUM.value)),
+        )
 
-        # Start workflow orchestration
-        workflow_id = await self.workflow_orchestrator.start_campaign_workflow(campaign_config)
+        self._forward_step_events(pattern_id)
+
+        # Start workflow orchestration on the same pattern; stages run in the background
+        workflow_job = await self.workflow_orchestrator.start_campaign_workflow(
+            campaign_config, pattern_id=pattern_id
+        )
+        workflow_id = workflow_job.workflow_id
 
         # Store campaign information
         self.active_campaigns[campaign_config["campaign_id"]] = {
             "pattern_id": pattern_id,
             "workflow_id": workflow_id,
             "config": campaign_config,
-            "start_time": datetime.now(),
-            "status": "active"
+            "start_time": self.clock.now(),
+            "status": "active",
         }
 
         logger.info(
             "Campaign thinking started",
             campaign_id=campaign_config["campaign_id"],
             pattern_id=pattern_id,
-            workflow_id=workflow_id
+            workflow_id=workflow_id,
         )
 
         return {
@@ -439,32 +643,139 @@ class SequentialThinkingServer:
             "campaign_id": campaign_config["campaign_id"],
             "pattern_id": pattern_id,
             "workflow_id": workflow_id,
+            "workflow_status": workflow_job.status.value,
             "message": "Campaign thinking process started successfully",
             "next_steps": [
-                "Monitor thinking progress with get_thinking_status",
+                "Step transitions are sent as thinking.progress log notifications; "
+                "poll get_thinking_status or block on watch_thinking_progress",
+                "Follow the workflow stages with get_workflow_status",
                 "Track performance with analyze_performance",
-                "Optimize based on recommendations"
-            ]
+                "Optimize based on recommendations",
+            ],
+        }
+
+    def _build_thinking_context(
+        self, campaign_config: Dict[str, Any]
+    ) -> ThinkingContext:
+        """Build the thinking context for a campaign configuration"""
+        return ThinkingContext(
+            campaign_id=campaign_config["campaign_id"],
+            target_audience_size=campaign_config["target_audience_size"],
+            roi_target=campaign_config["roi_target"],
+            budget_limit=campaign_config.get("budget_limit", 5000.0),
+            time_constraints=campaign_config.get("time_constraints", {}),
+            current_performance={},
+            historical_data=[],
+            external_factors={},
+        )
+
+    async def _schedule_campaign_thinking(
+        self, arguments: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Register a recurring thinking schedule for a campaign"""
+        campaign_config = arguments["campaign_config"]
+
+        schedule_id = await self.thinking_engine.schedule_pattern(
+            WhatsAppCampaignThinking.PATTERN_NAME,
+            self._build_thinking_context(campaign_config),
+            arguments["cron_expression"],
+            priority=Priority(campaign_config.get("priority", Priority.MEDIUM.value)),
+            jitter=timedelta(seconds=arguments.get("jitter_seconds", 0)),
+        )
+        schedule = self.thinking_engine.schedules[schedule_id]
+
+        return {
+            "success": True,
+            "schedule_id": schedule_id,
+            "campaign_id": campaign_config["campaign_id"],
+            "cron_expression": schedule.cron_expression,
+            "next_fire_at": (
+                schedule.next_fire_at.isoformat() if schedule.next_fire_at else None
+            ),
         }
 
+    def _forward_step_events(self, pattern_id: str) -> None:
+        """Stream a pattern's step transitions to the requesting client
+
+        The tool call returns right away, so the events go out as log notifications
+        from a background task rather than as progress of the finished request.
+        """
+        try:
+            session = self.server.request_context.session
+        except LookupError:
+            return  # Not called from a client request
+
+        async def forward() -> None:
+            try:
+                async for event in self.thinking_engine.subscribe(pattern_id):
+                    await session.send_log_message(
+                        level="info",
+                        data={
+                            **asdict(event),
+                            "timestamp": event.timestamp.isoformat(),
+                        },
+                        logger="thinking.progress",
+                    )
+            except Exception as e:
+                logger.warning(
+                    "Stopped forwarding thinking progress",
+                    pattern_id=pattern_id,
+                    error=str(e),
+                )
+            finally:
+                self._progress_forwarders.pop(pattern_id, None)
+
+        self._progress_forwarders[pattern_id] = asyncio.create_task(forward())
+
+    async def _watch_thinking_progress(self, pattern_id: str) -> Dict[str, Any]:
+        """Forward step transitions of a pattern as progress notifications"""
+
+        request_context = self.server.request_context
+        progress_token = (
+            request_context.meta.progressToken if request_context.meta else None
+        )
+
+        events_sent = 0
+        async for event in self.thinking_engine.subscribe(pattern_id):
+            if progress_token is not None:
+                await request_context.session.send_progress_notification(
+                    progress_token,
+                    event.completed_steps + event.failed_steps,
+                    event.total_steps,
+                )
+                events_sent += 1
+
+        status = await self.thinking_engine.get_pattern_status(pattern_id)
+        status["progress_notifications_sent"] = events_sent
+        return status
+
     async def _get_thinking_status(self, pattern_id: str) -> Dict[str, Any]:
         """Get current status of thinking pattern"""
 
         status = await self.thinking_engine.get_pattern_status(pattern_id)
 
-        # Find associated campaign
-        campaign_id = None
-        for cid, campaign_data in self.active_campaigns.items():
-            if campaign_data.get("pattern_id") == pattern_id:
-                campaign_id = cid
-                break
+        # Find associated campaign through the pattern's own context
+        pattern = self.thinking_engine.get_pattern(pattern_id)
+        campaign_id = pattern.context.campaign_id if pattern else None
+        campaign_data = self.active_campaigns.get(campaign_id) if campaign_id else None
 
-        if campaign_id:
+        if (
+            campaign_id is not None
+            and campaign_data
+            and campaign_data.get("pattern_id") == pattern_id
+        ):
             # Add campaign-specific information
-            campaign_data = self.active_campaigns[campaign_id]
             status["campaign_id"] = campaign_id
             status["campaign_start_time"] = campaign_data["start_time"].isoformat()
-            status["workflow_id"] = campaign_data.get("workflow_id")
+            workflow_id = campaign_data.get("workflow_id")
+            status["workflow_id"] = workflow_id
+            workflow_job = (
+                self.workflow_orchestrator.jobs.get(workflow_id)
+                if workflow_id
+                else None
+            )
+            if workflow_job is not None:
+                status["workflow_progress"] = workflow_job.progress()
 
             # Get current performance if available
             try:
@@ -472,7 +783,7 @@ class SequentialThinkingServer:
                 status["current_roi"] = {
                     "roi_percentage": roi_calc.roi_percentage,
                     "total_revenue": roi_calc.total_revenue,
-                    "net_profit": roi_calc.net_profit
+                    "net_profit": roi_calc.net_profit,
                 }
             except:
                 status["current_roi"] = {"message": "ROI data not yet available"}
@@ -489,7 +800,7 @@ class SequentialThinkingServer:
             await self.roi_tracker.track_investment(
                 campaign_id,
                 arguments["investment"],
-                arguments.get("investment_category", "operational")
+                arguments.get("investment_category", "operational"),
             )
 
         # Track revenue/conversion if provided
@@ -499,7 +810,7 @@ class SequentialThinkingServer:
                 campaign_id,
                 conversion_data.get("student_id", "unknown"),
                 arguments["revenue"],
-                conversion_data.get("conversion_type", "reactivation")
+                conversion_data.get("conversion_type", "reactivation"),
             )
 
         # Calculate current ROI
@@ -515,9 +826,9 @@ class SequentialThinkingServer:
                 "total_revenue": roi_calc.total_revenue,
                 "net_profit": roi_calc.net_profit,
                 "breakdown": roi_calc.breakdown,
-                "projections": roi_calc.projections
+                "projections": roi_calc.projections,
             },
-            "calculation_timestamp": roi_calc.calculation_timestamp.isoformat()
+            "calculation_timestamp": roi_calc.calculation_timestamp.isoformat(),
         }
 
     async def _analyze_performance(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
@@ -535,21 +846,36 @@ class SequentialThinkingServer:
         roi_calc = await self.roi_tracker.calculate_real_time_roi(campaign_id)
 
         # Get optimization opportunities
-        optimization_analysis = await self.optimization_engine.analyze_optimization_opportunities(campaign_id)
+        optimization_analysis = (
+            await self.optimization_engine.analyze_optimization_opportunities(
+                campaign_id
+            )
+        )
 
         return {
             "success": True,
             "campaign_id": campaign_id,
-            "analysis_timestamp": datetime.now().isoformat(),
+            "analysis_timestamp": self.clock.now().isoformat(),
             "performance_summary": performance_summary,
             "roi_analysis": {
                 "current_roi": roi_calc.roi_percentage,
-                "target_roi": self.active_campaigns.get(campaign_id, {}).get("config", {}).get("roi_target", 0),
-                "progress_to_target": roi_calc.roi_percentage / self.active_campaigns.get(campaign_id, {}).get("config", {}).get("roi_target", 1) if self.active_campaigns.get(campaign_id, {}).get("config", {}).get("roi_target") else 0,
-                "projections": roi_calc.projections
+                "target_roi": self.active_campaigns.get(campaign_id, {})
+                .get("config", {})
+                .get("roi_target", 0),
+                "progress_to_target": (
+                    roi_calc.roi_percentage
+                    / self.active_campaigns.get(campaign_id, {})
+                    .get("config", {})
+                    .get("roi_target", 1)
+                    if self.active_campaigns.get(campaign_id, {})
+                    .get("config", {})
+                    .get("roi_target")
+                    else 0
+                ),
+                "projections": roi_calc.projections,
             },
             "optimization_opportunities": optimization_analysis["opportunities"],
-            "recommendations": optimization_analysis["recommended_next_steps"]
+            "recommendations": optimization_analysis["recommended_next_steps"],
         }
 
     async def _optimize_campaign(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
@@ -566,7 +892,7 @@ class SequentialThinkingServer:
             "success": True,
             "campaign_id": campaign_id,
             "optimization_result": result,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": self.clock.now().isoformat(),
         }
 
     async def _handle_error(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
@@ -579,11 +905,11 @@ class SequentialThinkingServer:
         # Create error context
         error_context = ErrorContext(
             error_id="",
-            timestamp=datetime.now(),
+            timestamp=self.clock.now(),
             campaign_id=campaign_id,
             component=error_context_data.get("component", "unknown"),
             operation=error_context_data.get("operation", "unknown"),
-            user_data=error_context_data
+            user_data=error_context_data,
         )
 
         # Create a dummy exception from the description
@@ -598,7 +924,25 @@ class SequentialThinkingServer:
         return {
             "success": True,
             "error_handling_result": result,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": self.clock.now().isoformat(),
+        }
+
+    async def _cancel_workflow(self, workflow_id: str) -> Dict[str, Any]:
+        """Cancel a campaign workflow"""
+
+        stopped = await self.workflow_orchestrator.stop_workflow(workflow_id)
+        workflow_job = self.workflow_orchestrator.jobs.get(workflow_id)
+
+        return {
+            "success": stopped,
+            "workflow_id": workflow_id,
+            "status": workflow_job.status.value if workflow_job is not None else None,
+            "message": (
+                "Workflow cancelled"
+                if stopped
+                else "Workflow not found or already finished"
+            ),
+            "timestamp": self.clock.now().isoformat(),
         }
 
     async def _start_monitoring(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
@@ -619,7 +963,7 @@ class SequentialThinkingServer:
             "campaign_id": campaign_id,
             "monitoring_started": True,
             "message": "Real-time monitoring started for campaign",
-            "timestamp": datetime.now().isoformat()
+            "timestamp": self.clock.now().isoformat(),
         }
 
     async def _execute_workflow(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
@@ -633,17 +977,22 @@ class SequentialThinkingServer:
 
         # Create workflow context
         workflow_context = WorkflowContext(
-            workflow_id=f"workflow_{int(datetime.now().timestamp())}",
+            workflow_id=f"workflow_{int(self.clock.now().timestamp())}",
             workflow_type=workflow_type_enum,
             campaign_id=workflow_config.get("campaign_id", "unknown"),
             data_sources=workflow_config.get("data_sources", {}),
             target_metrics=workflow_config.get("target_metrics", {}),
-            constraints=workflow_config.get("constraints", {})
+            constraints=workflow_config.get("constraints", {}),
+            created_at=self.clock.now(),
         )
 
         # Execute based on workflow type
         if workflow_type_enum == WorkflowType.GOOGLE_SHEETS_PROCESSING:
-            result = await self.workflow_orchestrator.sheets_processor.process_sheets_data(workflow_context)
+            result = (
+                await self.workflow_orchestrator.sheets_processor.process_sheets_data(
+                    workflow_context
+                )
+            )
         else:
             result = {"error": f"Workflow type {workflow_type} not yet implemented"}
 
@@ -652,15 +1001,19 @@ class SequentialThinkingServer:
             "workflow_id": workflow_context.workflow_id,
             "workflow_type": workflow_type,
             "execution_result": result,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": self.clock.now().isoformat(),
         }
 
-    async def _get_optimization_recommendations(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    async def _get_optimization_recommendations(
+        self, arguments: Dict[str, Any]
+    ) -> Dict[str, Any]:
         """Get optimization recommendations"""
 
         campaign_id = arguments["campaign_id"]
 
-        analysis = await self.optimization_engine.analyze_optimization_opportunities(campaign_id)
+        analysis = await self.optimization_engine.analyze_optimization_opportunities(
+            campaign_id
+        )
 
         # Get optimization history
         history = await self.optimization_engine.get_optimization_history(campaign_id)
@@ -670,14 +1023,18 @@ class SequentialThinkingServer:
             "campaign_id": campaign_id,
             "analysis": analysis,
             "optimization_history": history,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": self.clock.now().isoformat(),
         }
 
-    async def _simulate_campaign_outcome(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    async def _simulate_campaign_outcome(
+        self, arguments: Dict[str, Any]
+    ) -> Dict[str, Any]:
         """Simulate campaign outcomes"""
 
         campaign_parameters = arguments["campaign_parameters"]
-        scenarios = arguments.get("simulation_scenarios", ["optimistic", "realistic", "pessimistic"])
+        scenarios = arguments.get(
+            "simulation_scenarios", ["optimistic", "realistic", "pessimistic"]
+        )
 
         simulations = {}
 
@@ -692,14 +1049,19 @@ class SequentialThinkingServer:
 
             base_roi = campaign_parameters.get("expected_roi", 2250.0)
             base_response_rate = campaign_parameters.get("expected_response_rate", 0.22)
-            base_conversion_rate = campaign_parameters.get("expected_conversion_rate", 0.144)
+            base_conversion_rate = campaign_parameters.get(
+                "expected_conversion_rate", 0.144
+            )
 
             simulations[scenario] = {
                 "projected_roi": base_roi * multiplier,
                 "projected_response_rate": min(base_response_rate * multiplier, 1.0),
-                "projected_conversion_rate": min(base_conversion_rate * multiplier, 1.0),
-                "projected_revenue": campaign_parameters.get("budget", 5000) * (base_roi * multiplier / 100),
-                "confidence_level": 0.8 if scenario == "realistic" else 0.6
+                "projected_conversion_rate": min(
+                    base_conversion_rate * multiplier, 1.0
+                ),
+                "projected_revenue": campaign_parameters.get("budget", 5000)
+                * (base_roi * multiplier / 100),
+                "confidence_level": 0.8 if scenario == "realistic" else 0.6,
             }
 
         return {
@@ -707,7 +1069,7 @@ class SequentialThinkingServer:
             "campaign_parameters": campaign_parameters,
             "simulations": simulations,
             "recommendation": self._get_simulation_recommendation(simulations),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": self.clock.now().isoformat(),
         }
 
     def _get_simulation_recommendation(self, simulations: Dict[str, Any]) -> str:
@@ -728,15 +1090,30 @@ class SequentialThinkingServer:
 
         return {
             "total_patterns_executed": len(self.active_campaigns),
+            "step_cache": self.thinking_engine.get_cache_stats(),
+            "learned_step_durations": self.thinking_engine.get_duration_statistics(),
+            "recurring_schedules": self.thinking_engine.list_schedules(),
             "average_completion_time": "2.5 hours",
             "success_rate": 0.89,
             "most_common_optimizations": [
                 "message_timing_adjustment",
                 "segment_targeting_refinement",
-                "content_personalization"
-            ]
+                "content_personalization",
+            ],
         }
 
+    async def shutdown(self) -> None:
+        """Stop background workflows and the engine, committing the journal"""
+        forwarders = list(self._progress_forwarders.values())
+        for forwarder in forwarders:
+            forwarder.cancel()
+        await asyncio.gather(*forwarders, return_exceptions=True)
+
+        await self.workflow_orchestrator.shutdown()
+        # Interrupted patterns stay unfinished in the journal and resume on restart
+        await self.thinking_engine.shutdown()
+
+
 async def main():
     """Main entry point for the MCP server"""
 
@@ -750,7 +1127,7 @@ async def main():
             structlog.processors.TimeStamper(fmt="iso"),
             structlog.processors.StackInfoRenderer(),
             structlog.processors.format_exc_info,
-            structlog.processors.JSONRenderer()
+            structlog.processors.JSONRenderer(),
         ],
         context_class=dict,
         logger_factory=structlog.stdlib.LoggerFactory(),
@@ -759,20 +1136,33 @@ async def main():
     )
 
     # Create and run server
-    thinking_server = SequentialThinkingServer()
-
-    logger.info("Starting Sequential Thinking MCP Server")
-
-    async with stdio_server() as (read_stream, write_stream):
-        await thinking_server.server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="sequential-thinking",
-                server_version="0.1.0",
-                capabilities=thinking_server.server_config["capabilities"]
+    thinking_server = SequentialThinkingServer(
+        journal_path=os.environ.get("THINKING_JOURNAL_PATH"),
+        reactivation_model_path=os.environ.get("REACTIVATION_MODEL_PATH"),
+        artifact_cache_path=os.environ.get("ARTIFACT_CACHE_PATH"),
+    )
+
+    # Resume patterns interrupted by a previous shutdown or crash
+    resumed = await thinking_server.thinking_engine.recover()
+
+    logger.info(
+        "Starting Sequential Thinking MCP Server", resumed_patterns=len(resumed)
+    )
+
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await thinking_server.server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="sequential-thinking",
+                    server_version="0.1.0",
+                    capabilities=thinking_server.server_config["capabilities"],
+                ),
             )
-        )
+    finally:
+        await thinking_server.shutdown()
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -5,22 +5,57 @@ This module provides structured thinking patterns for complex automation workflo
 breaking down complex decisions into sequential, traceable steps.
 """
 
-from typing import Dict, List, Any, Optional, Union, TypeVar, Generic
+from typing import (
+    Dict,
+    List,
+    Any,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+    TypeVar,
+    Callable,
+    ClassVar,
+    ContextManager,
+    AsyncIterator,
+    Iterator,
+)
 from enum import Enum
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, asdict
 from datetime import datetime, timedelta
 import asyncio
+import copy
+import hashlib
+import hmac
+import itertools
 import json
+import os
+import pickle
+import math
+import heapq
+import random
+from array import array
+from collections import OrderedDict
+from contextlib import nullcontext
+from types import MappingProxyType
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 import structlog
-from pydantic import BaseModel, Field
+from pydantic import BaseModel
 from croniter import croniter
 
+from .checkpoint import CheckpointJournal
+from .clock import Clock, SystemClock
+
 logger = structlog.get_logger(__name__)
 
-T = TypeVar('T')
+T = TypeVar("T")
+
 
 class ThinkingStage(Enum):
     """Sequential thinking stages for automation workflows"""
+
     ANALYSIS = "analysis"
     PLANNING = "planning"
     SEGMENTATION = "segmentation"
@@ -30,15 +65,27 @@ class ThinkingStage(Enum):
     EVALUATION = "evaluation"
     ADAPTATION = "adaptation"
 
+
 class Priority(Enum):
     """Priority levels for thinking tasks"""
+
     CRITICAL = "critical"
     HIGH = "high"
     MEDIUM = "medium"
     LOW = "low"
 
+
+PRIORITY_RANK = {
+    Priority.CRITICAL: 0,
+    Priority.HIGH: 1,
+    Priority.MEDIUM: 2,
+    Priority.LOW: 3,
+}
+
+
 class ThinkingStatus(Enum):
     """Status of thinking processes"""
+
     PENDING = "pending"
     IN_PROGRESS = "in_progress"
     COMPLETED = "completed"
@@ -46,9 +93,11 @@ class ThinkingStatus(Enum):
     OPTIMIZING = "optimizing"
     ADAPTING = "adapting"
 
+
 @dataclass
 class ThinkingContext:
     """Context information for thinking processes"""
+
     campaign_id: str
     target_audience_size: int
     roi_target: float
@@ -58,9 +107,11 @@ class ThinkingContext:
     historical_data: List[Dict[str, Any]] = field(default_factory=list)
     external_factors: Dict[str, Any] = field(default_factory=dict)
 
+
 @dataclass
 class ThinkingStep:
     """Individual step in a thinking sequence"""
+
     id: str
     stage: ThinkingStage
     description: str
@@ -76,8 +127,787 @@ class ThinkingStep:
     metadata: Dict[str, Any] = field(default_factory=dict)
     timestamp: datetime = field(default_factory=datetime.now)
 
+
+@dataclass
+class StageExecutor:
+    """Handler registered for a thinking stage, with its execution limits"""
+
+    stage: ThinkingStage
+    handler: Callable[[ThinkingStep], Any]
+    max_concurrency: int = 4
+    timeout: Optional[timedelta] = None
+    offload: Optional[str] = None  # None (event loop), "thread" or "process"
+    version: str = "1"
+    cacheable: bool = (
+        True  # False for stages with side effects or time-dependent results
+    )
+    semaphore: asyncio.Semaphore = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.offload not in (None, "thread", "process"):
+            raise ValueError(
+                f"Unknown offload mode for {self.stage.value}: {self.offload}"
+            )
+        if self.offload is None and not asyncio.iscoroutinefunction(self.handler):
+            raise ValueError(
+                f"Handler for {self.stage.value} must be async unless offloaded"
+            )
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+
+def _stable_json(value: Any) -> Any:
+    """JSON fallback that does not depend on the process's hash seed"""
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    return str(value)
+
+
+class StepResultCache:
+    """LRU + TTL cache of thinking step results, optionally backed by a directory
+
+    Keys are content addresses built from the step id, the stage handler version
+    and a hash of the inputs the step resolved to, so any change in upstream
+    results or campaign context produces a different key.
+
+    Files on disk are signed with an HMAC-SHA256 over the key and the pickled
+    entry and are only unpickled once the signature checks out. Without an
+    explicit ``signing_key`` a random one is kept in the storage directory,
+    readable by its owner only.
+    """
+
+    SIGNING_KEY_FILE = ".signing-key"
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: timedelta = timedelta(hours=6),
+        storage_path: Optional[str] = None,
+        clock: Optional[Clock] = None,
+        signing_key: Optional[bytes] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl.total_seconds()
+        self.storage_path = storage_path
+        self.clock = clock or SystemClock()
+        self.entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.logger = structlog.get_logger(__name__)
+        self._signing_key = signing_key
+
+        if storage_path:
+            os.makedirs(storage_path, exist_ok=True)
+            if self._signing_key is None:
+                self._signing_key = self._load_signing_key(storage_path)
+
+    @staticmethod
+    def make_key(step_id: str, handler_version: str, inputs: Dict[str, Any]) -> str:
+        """Build the content address for a step execution"""
+        inputs_hash = hashlib.sha256(
+            json.dumps(inputs, sort_keys=True, default=_stable_json).encode("utf-8")
+        ).hexdigest()
+        return hashlib.sha256(
+            f"{step_id}:{handler_version}:{inputs_hash}".encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (hit, result); results are copies callers cannot mutate"""
+        now = self.clock.time()
+        entry = self.entries.get(key)
+
+        if entry is None and self.storage_path:
+            entry = self._load_from_disk(key)
+            if entry is not None:
+                self.entries[key] = entry
+
+        if entry is not None and now - entry[0] > self.ttl_seconds:
+            self._discard(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        self.entries.move_to_end(key)
+        self._evict_overflow()
+        self.hits += 1
+        return True, copy.deepcopy(entry[1])
+
+    def put(self, key: str, result: Any) -> None:
+        """Store a step result"""
+        entry = (self.clock.time(), copy.deepcopy(result))
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        self._evict_overflow()
+
+        if self.storage_path:
+            self._write_to_disk(key, entry)
+
+    def clear(self) -> None:
+        """Drop every cached result, in memory and on disk"""
+        for key in list(self.entries):
+            self._discard(key)
+        if self.storage_path:
+            for filename in os.listdir(self.storage_path):
+                if filename.endswith(".pkl"):
+                    os.remove(os.path.join(self.storage_path, filename))
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "persistent": bool(self.storage_path),
+        }
+
+    def _evict_overflow(self) -> None:
+        # Only the in-memory copy is evicted; the disk store is bounded by TTL
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _discard(self, key: str) -> None:
+        self.entries.pop(key, None)
+        if self.storage_path:
+            try:
+                os.remove(self._disk_path(key))
+            except FileNotFoundError:
+                pass
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.storage_path or "", f"{key}.pkl")
+
+    @classmethod
+    def _load_signing_key(cls, storage_path: str) -> bytes:
+        """Read the directory's signing key, creating an owner-only one if missing"""
+        path = os.path.join(storage_path, cls.SIGNING_KEY_FILE)
+        try:
+            descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(path, "rb") as handle:
+                return handle.read()
+
+        signing_key = os.urandom(32)
+        with os.fdopen(descriptor, "wb") as handle:
+            handle.write(signing_key)
+        return signing_key
+
+    def _signature(self, key: str, payload: bytes) -> bytes:
+        return hmac.new(
+            self._signing_key or b"", key.encode("utf-8") + payload, hashlib.sha256
+        ).digest()
+
+    def _load_from_disk(self, key: str) -> Optional[Tuple[float, Any]]:
+        try:
+            with open(self._disk_path(key), "rb") as handle:
+                signature = handle.read(hashlib.sha256().digest_size)
+                payload = handle.read()
+        except FileNotFoundError:
+            return None
+
+        if not hmac.compare_digest(signature, self._signature(key, payload)):
+            self.logger.warning(
+                "Discarding cached step result with a bad signature", key=key
+            )
+            self._discard(key)
+            return None
+
+        try:
+            entry: Tuple[float, Any] = pickle.loads(payload)
+            return entry
+        except Exception as e:
+            self.logger.warning(
+                "Discarding unreadable cached step result", key=key, error=str(e)
+            )
+            self._discard(key)
+            return None
+
+    def _write_to_disk(self, key: str, entry: Tuple[float, Any]) -> None:
+        path = self._disk_path(key)
+        temp_path = f"{path}.tmp"
+        try:
+            payload = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(temp_path, "wb") as handle:
+                handle.write(self._signature(key, payload))
+                handle.write(payload)
+            os.replace(temp_path, path)
+        except Exception as e:
+            self.logger.warning(
+                "Failed to persist cached step result", key=key, error=str(e)
+            )
+
+
+@dataclass
+class PatternProgress:
+    """Step counters for a pattern, maintained on every status transition"""
+
+    total_steps: int
+    status_counts: Dict[ThinkingStatus, int]
+    started_at: datetime
+    next_unfinished: int = 0
+    step_started: Dict[str, datetime] = field(default_factory=dict)
+    finished_at: Optional[datetime] = None
+
+    @property
+    def finished_steps(self) -> int:
+        return (
+            self.status_counts[ThinkingStatus.COMPLETED]
+            + self.status_counts[ThinkingStatus.FAILED]
+        )
+
+
+TERMINAL_STATUSES = (ThinkingStatus.COMPLETED, ThinkingStatus.FAILED)
+
+
+class PatternIndex:
+    """Secondary indexes of tracked patterns by campaign, current stage and status
+
+    Each pattern sits in exactly one bucket per index; the engine moves it between
+    buckets as its steps transition, so lookups never scan the pattern store.
+    """
+
+    def __init__(self) -> None:
+        self.by_campaign: Dict[str, set] = {}
+        self.by_stage: Dict[str, set] = {}
+        self.by_status: Dict[str, set] = {}
+        self.keys: Dict[str, Tuple[str, str, str]] = {}
+
+    def update(
+        self, pattern_id: str, campaign_id: str, stage: str, status: str
+    ) -> None:
+        """Index a pattern under its current keys, moving it out of stale buckets"""
+        new_keys = (campaign_id, stage, status)
+        old_keys = self.keys.get(pattern_id)
+        if old_keys == new_keys:
+            return
+
+        for buckets, old, new in zip(
+            self._indexes(), old_keys or (None, None, None), new_keys
+        ):
+            if old == new:
+                continue
+            if old is not None:
+                self._discard(buckets, old, pattern_id)
+            buckets.setdefault(new, set()).add(pattern_id)
+        self.keys[pattern_id] = new_keys
+
+    def remove(self, pattern_id: str) -> None:
+        """Drop a pattern from every index"""
+        old_keys = self.keys.pop(pattern_id, None)
+        if old_keys is None:
+            return
+        for buckets, old in zip(self._indexes(), old_keys):
+            self._discard(buckets, old, pattern_id)
+
+    def find(
+        self,
+        campaign_id: Optional[str] = None,
+        stage: Optional[str] = None,
+        status: Optional[str] = None,
+    ) -> set:
+        """Pattern ids matching every given key, starting from the smallest bucket"""
+        selected = [
+            buckets.get(key, set())
+            for buckets, key in zip(self._indexes(), (campaign_id, stage, status))
+            if key is not None
+        ]
+        if not selected:
+            return set(self.keys)
+        selected.sort(key=len)
+        return selected[0].intersection(*selected[1:])
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """Bucket sizes per index"""
+        return {
+            "by_campaign": {key: len(ids) for key, ids in self.by_campaign.items()},
+            "by_stage": {key: len(ids) for key, ids in self.by_stage.items()},
+            "by_status": {key: len(ids) for key, ids in self.by_status.items()},
+        }
+
+    def _indexes(self) -> Tuple[Dict[str, set], Dict[str, set], Dict[str, set]]:
+        return self.by_campaign, self.by_stage, self.by_status
+
+    @staticmethod
+    def _discard(buckets: Dict[str, set], key: str, pattern_id: str) -> None:
+        bucket = buckets.get(key)
+        if bucket is None:
+            return
+        bucket.discard(pattern_id)
+        if not bucket:
+            del buckets[key]
+
+
+class DurationEstimator:
+    """Per-step duration statistics learned from completed runs
+
+    Keeps an exponentially weighted mean and variance of log-durations, which
+    suits the right-skewed step latencies, and derives p50/p90 from them. Runs
+    served from the step cache take no time: they only move a weighted hit rate,
+    and the quantiles are scaled by the share of runs that actually execute.
+    """
+
+    P90_Z_SCORE = 1.2816
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def observe(self, key: str, duration: timedelta, cached: bool = False) -> None:
+        """Fold one observed duration, or a cache hit, into the running statistics"""
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = {
+                "mean": 0.0,
+                "variance": 0.0,
+                "samples": 0,
+                "hit_rate": float(cached),
+            }
+        else:
+            stats["hit_rate"] += self.alpha * (float(cached) - stats["hit_rate"])
+        if cached:
+            return
+
+        log_seconds = math.log(max(duration.total_seconds(), 1e-3))
+        if not stats["samples"]:
+            stats["mean"] = log_seconds
+            stats["samples"] = 1
+            return
+
+        delta = log_seconds - stats["mean"]
+        stats["mean"] += self.alpha * delta
+        stats["variance"] = (1 - self.alpha) * (
+            stats["variance"] + self.alpha * delta * delta
+        )
+        stats["samples"] += 1
+
+    def quantiles(self, key: str, fallback: timedelta) -> Tuple[float, float]:
+        """(p50, p90) in seconds, falling back to the declared estimate when unseen"""
+        stats = self.stats.get(key)
+        if stats is None:
+            seconds = fallback.total_seconds()
+            return seconds, seconds
+
+        if stats["samples"]:
+            spread = self.P90_Z_SCORE * math.sqrt(stats["variance"])
+            p50, p90 = math.exp(stats["mean"]), math.exp(stats["mean"] + spread)
+        else:
+            p50 = p90 = fallback.total_seconds()
+        miss_rate = 1.0 - stats["hit_rate"]
+        return p50 * miss_rate, p90 * miss_rate
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Learned p50/p90 per step"""
+        summary = {}
+        for key, stats in self.stats.items():
+            p50, p90 = self.quantiles(key, timedelta())
+            summary[key] = {
+                "p50_seconds": p50,
+                "p90_seconds": p90,
+                "samples": stats["samples"],
+                "cache_hit_rate": stats["hit_rate"],
+            }
+        return summary
+
+
+@dataclass(frozen=True, eq=False)
+class CompiledPlan:
+    """Immutable execution plan for a list of thinking steps
+
+    Built once per pattern type: dependencies are resolved to index arrays and the
+    topological order, dependency waves, stage groupings and estimated critical path
+    are precomputed. Patterns created from a plan share its step templates and only
+    carry their own per-step execution state. Plans compare and hash by identity.
+    """
+
+    name: str
+    templates: Tuple[ThinkingStep, ...]
+    step_ids: Tuple[str, ...]
+    index: Dict[str, int]
+    dependencies: Tuple[Tuple[int, ...], ...]
+    dependents: Tuple[Tuple[int, ...], ...]
+    topological_order: Tuple[int, ...]
+    waves: Tuple[Tuple[int, ...], ...]
+    stage_groups: Dict[ThinkingStage, Tuple[int, ...]]
+    critical_path: Tuple[int, ...]
+    critical_path_duration: timedelta
+    # Per-step static fields copied into each instantiated step
+    descriptors: Tuple[Dict[str, Any], ...] = field(repr=False, compare=False)
+
+    @classmethod
+    def compile(cls, name: str, steps: List[ThinkingStep]) -> "CompiledPlan":
+        """Validate the dependency graph and precompute its execution structure"""
+        index: Dict[str, int] = {}
+        for position, step in enumerate(steps):
+            if step.id in index:
+                raise ValueError(f"Duplicate step id in {name}: {step.id}")
+            index[step.id] = position
+
+        dependencies = []
+        dependents: List[List[int]] = [[] for _ in steps]
+        for position, step in enumerate(steps):
+            for dependency in step.dependencies:
+                if dependency not in index:
+                    raise ValueError(
+                        f"Step {step.id} depends on unknown step: {dependency}"
+                    )
+                dependents[index[dependency]].append(position)
+            dependencies.append(
+                tuple(index[dependency] for dependency in step.dependencies)
+            )
+
+        # Kahn's algorithm, level by level; each wave holds steps that can run together
+        in_degree = [len(step_dependencies) for step_dependencies in dependencies]
+        wave = [position for position, degree in enumerate(in_degree) if degree == 0]
+        waves: List[Tuple[int, ...]] = []
+        order: List[int] = []
+        while wave:
+            waves.append(tuple(wave))
+            order.extend(wave)
+            next_wave = []
+            for position in wave:
+                for dependent in dependents[position]:
+                    in_degree[dependent] -= 1
+                    if in_degree[dependent] == 0:
+                        next_wave.append(dependent)
+            wave = next_wave
+
+        if len(order) != len(steps):
+            cyclic = sorted(
+                steps[position].id
+                for position, degree in enumerate(in_degree)
+                if degree > 0
+            )
+            raise ValueError(f"Dependency cycle between steps: {', '.join(cyclic)}")
+
+        stage_groups: Dict[ThinkingStage, List[int]] = {}
+        for position, step in enumerate(steps):
+            stage_groups.setdefault(step.stage, []).append(position)
+
+        critical_path, duration = cls._longest_path(
+            dependencies, order, [step.estimated_duration for step in steps]
+        )
+
+        return cls(
+            name=name,
+            templates=tuple(steps),
+            step_ids=tuple(step.id for step in steps),
+            index=index,
+            dependencies=tuple(dependencies),
+            dependents=tuple(tuple(step_dependents) for step_dependents in dependents),
+            topological_order=tuple(order),
+            waves=tuple(waves),
+            stage_groups={
+                stage: tuple(positions) for stage, positions in stage_groups.items()
+            },
+            critical_path=tuple(critical_path),
+            critical_path_duration=duration,
+            descriptors=tuple(cls._step_descriptor(step) for step in steps),
+        )
+
+    @staticmethod
+    def _step_descriptor(template: ThinkingStep) -> Dict[str, Any]:
+        """Static fields of a step, with lists frozen so instances share no mutations"""
+        return {
+            "id": template.id,
+            "stage": template.stage,
+            "description": template.description,
+            "inputs": tuple(template.inputs),
+            "outputs": tuple(template.outputs),
+            "dependencies": tuple(template.dependencies),
+            "priority": template.priority,
+            "estimated_duration": template.estimated_duration,
+            "actual_duration": None,
+            "status": ThinkingStatus.PENDING,
+            "result": None,
+            "errors": None,
+            "metadata": None,
+            "timestamp": None,
+        }
+
+    def longest_path(self, durations: List[timedelta]) -> Tuple[List[int], timedelta]:
+        """Longest dependency chain for the given per-step durations"""
+        return self._longest_path(self.dependencies, self.topological_order, durations)
+
+    @staticmethod
+    def _longest_path(
+        dependencies: Sequence[Tuple[int, ...]],
+        topological_order: Sequence[int],
+        durations: List[timedelta],
+    ) -> Tuple[List[int], timedelta]:
+        finish = [timedelta()] * len(durations)
+        predecessor: List[Optional[int]] = [None] * len(durations)
+
+        for step in topological_order:
+            start = timedelta()
+            for dependency in dependencies[step]:
+                if finish[dependency] > start:
+                    start = finish[dependency]
+                    predecessor[step] = dependency
+            finish[step] = start + durations[step]
+
+        if not finish:
+            return [], timedelta()
+
+        last = max(range(len(finish)), key=finish.__getitem__)
+        total = finish[last]
+        path: List[int] = []
+        position: Optional[int] = last
+        while position is not None:
+            path.append(position)
+            position = predecessor[position]
+
+        return list(reversed(path)), total
+
+    def instantiate_steps(self, timestamp: datetime) -> List[ThinkingStep]:
+        """Fresh per-pattern step state sharing the plan's static descriptors"""
+        # Bypasses the dataclass __init__ and its default factories: the descriptors
+        # were validated when the plan was compiled, only mutable state is allocated
+        steps = []
+        for descriptor in self.descriptors:
+            state = descriptor.copy()
+            state["inputs"] = list(descriptor["inputs"])
+            state["outputs"] = list(descriptor["outputs"])
+            state["dependencies"] = list(descriptor["dependencies"])
+            state["errors"] = []
+            state["metadata"] = {}
+            state["timestamp"] = timestamp
+            step = object.__new__(ThinkingStep)
+            step.__dict__ = state
+            steps.append(step)
+        return steps
+
+    def describe(self) -> Dict[str, Any]:
+        """JSON-friendly summary of the plan structure"""
+        return {
+            "name": self.name,
+            "total_steps": len(self.templates),
+            "waves": [
+                [self.step_ids[position] for position in wave] for wave in self.waves
+            ],
+            "stages": {
+                stage.value: [self.step_ids[position] for position in positions]
+                for stage, positions in self.stage_groups.items()
+            },
+            "critical_path": [
+                self.step_ids[position] for position in self.critical_path
+            ],
+            "critical_path_duration": self.critical_path_duration.total_seconds(),
+        }
+
+
+STATUS_BY_CODE = tuple(ThinkingStatus)
+EMPTY_ERRORS: Tuple[str, ...] = ()
+EMPTY_METADATA: Mapping[str, Any] = MappingProxyType({})
+STATUS_CODES = {status: code for code, status in enumerate(STATUS_BY_CODE)}
+
+
+class StepStateStore:
+    """Compact execution state for many patterns sharing one compiled plan
+
+    Status, creation time, start time and duration live in typed arrays indexed by
+    ``slot * step_count + step``; static descriptors come from the plan. Results,
+    errors and metadata are only allocated for steps that actually have them.
+    """
+
+    __slots__ = (
+        "plan",
+        "clock",
+        "step_count",
+        "status",
+        "created_at",
+        "started_at",
+        "duration",
+        "results",
+        "errors",
+        "metadata",
+        "free_slots",
+        "slot_count",
+    )
+
+    def __init__(self, plan: CompiledPlan, clock: Clock):
+        self.plan = plan
+        self.clock = clock
+        self.step_count = len(plan.templates)
+        self.status = array("b")
+        self.created_at = array("d")
+        self.started_at = array("d")
+        self.duration = array("d")
+        self.results: Dict[int, Any] = {}
+        self.errors: Dict[int, List[str]] = {}
+        self.metadata: Dict[int, Dict[str, Any]] = {}
+        self.free_slots: List[int] = []
+        self.slot_count = 0
+
+    @property
+    def active_slots(self) -> int:
+        return self.slot_count - len(self.free_slots)
+
+    def allocate(self, created_at: datetime) -> "CompactSteps":
+        """Reserve state for one pattern, reusing released slots first"""
+        now = created_at.timestamp()
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            offset = slot * self.step_count
+            for position in range(offset, offset + self.step_count):
+                self.status[position] = STATUS_CODES[ThinkingStatus.PENDING]
+                self.created_at[position] = now
+                self.started_at[position] = math.nan
+                self.duration[position] = math.nan
+        else:
+            slot = self.slot_count
+            self.slot_count += 1
+            self.status.extend([STATUS_CODES[ThinkingStatus.PENDING]] * self.step_count)
+            self.created_at.extend([now] * self.step_count)
+            self.started_at.extend([math.nan] * self.step_count)
+            self.duration.extend([math.nan] * self.step_count)
+        return CompactSteps(self, slot)
+
+    def release(self, slot: int) -> None:
+        """Return a pattern's slot to the free list and drop its lazy state"""
+        offset = slot * self.step_count
+        for position in range(offset, offset + self.step_count):
+            self.results.pop(position, None)
+            self.errors.pop(position, None)
+            self.metadata.pop(position, None)
+        self.free_slots.append(slot)
+
+    def nbytes(self) -> int:
+        """Bytes held by the typed arrays"""
+        return sum(
+            column.itemsize * len(column)
+            for column in (self.status, self.created_at, self.started_at, self.duration)
+        )
+
+
+class CompactSteps:
+    """List-like view over one pattern's steps in a StepStateStore"""
+
+    __slots__ = ("store", "slot")
+
+    def __init__(self, store: StepStateStore, slot: int):
+        self.store = store
+        self.slot = slot
+
+    def __len__(self) -> int:
+        return self.store.step_count
+
+    def __getitem__(self, position: int) -> "StepView":
+        if position < 0:
+            position += self.store.step_count
+        if not 0 <= position < self.store.step_count:
+            raise IndexError(position)
+        return StepView(
+            self.store,
+            self.slot * self.store.step_count + position,
+            self.store.plan.descriptors[position],
+        )
+
+    def __iter__(self) -> Iterator["StepView"]:
+        offset = self.slot * self.store.step_count
+        for position, descriptor in enumerate(self.store.plan.descriptors):
+            yield StepView(self.store, offset + position, descriptor)
+
+    def release(self) -> None:
+        self.store.release(self.slot)
+
+
+class StepView:
+    """ThinkingStep-compatible accessor for one step stored in a StepStateStore"""
+
+    __slots__ = ("_store", "_offset", "_descriptor")
+
+    def __init__(self, store: StepStateStore, offset: int, descriptor: Dict[str, Any]):
+        self._store = store
+        self._offset = offset
+        self._descriptor = descriptor
+
+    id = property(lambda self: self._descriptor["id"])
+    stage = property(lambda self: self._descriptor["stage"])
+    description = property(lambda self: self._descriptor["description"])
+    inputs = property(lambda self: self._descriptor["inputs"])
+    outputs = property(lambda self: self._descriptor["outputs"])
+    dependencies = property(lambda self: self._descriptor["dependencies"])
+    priority = property(lambda self: self._descriptor["priority"])
+    estimated_duration = property(lambda self: self._descriptor["estimated_duration"])
+
+    @property
+    def status(self) -> ThinkingStatus:
+        return STATUS_BY_CODE[self._store.status[self._offset]]
+
+    @status.setter
+    def status(self, status: ThinkingStatus) -> None:
+        self._store.status[self._offset] = STATUS_CODES[status]
+        if status == ThinkingStatus.IN_PROGRESS:
+            self._store.started_at[self._offset] = self._store.clock.time()
+
+    @property
+    def actual_duration(self) -> Optional[timedelta]:
+        seconds = self._store.duration[self._offset]
+        return None if math.isnan(seconds) else timedelta(seconds=seconds)
+
+    @actual_duration.setter
+    def actual_duration(self, duration: Optional[timedelta]) -> None:
+        self._store.duration[self._offset] = (
+            math.nan if duration is None else duration.total_seconds()
+        )
+
+    @property
+    def result(self) -> Any:
+        return self._store.results.get(self._offset)
+
+    @result.setter
+    def result(self, result: Any) -> None:
+        if result is None:
+            self._store.results.pop(self._offset, None)
+        else:
+            self._store.results[self._offset] = result
+
+    # Reads of unset errors and metadata return shared read-only empties, so only
+    # steps that are written to allocate; writers assign instead of mutating
+    @property
+    def errors(self) -> Sequence[str]:
+        return self._store.errors.get(self._offset, EMPTY_ERRORS)
+
+    @errors.setter
+    def errors(self, errors: Sequence[str]) -> None:
+        if errors:
+            self._store.errors[self._offset] = list(errors)
+        else:
+            self._store.errors.pop(self._offset, None)
+
+    @property
+    def metadata(self) -> Mapping[str, Any]:
+        return self._store.metadata.get(self._offset, EMPTY_METADATA)
+
+    @metadata.setter
+    def metadata(self, metadata: Mapping[str, Any]) -> None:
+        if metadata:
+            self._store.metadata[self._offset] = dict(metadata)
+        else:
+            self._store.metadata.pop(self._offset, None)
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self._store.created_at[self._offset])
+
+    @property
+    def started_at(self) -> Optional[datetime]:
+        seconds = self._store.started_at[self._offset]
+        return None if math.isnan(seconds) else datetime.fromtimestamp(seconds)
+
+    def __repr__(self) -> str:
+        return f"StepView(id={self.id!r}, status={self.status.value!r})"
+
+
 class ThinkingPattern(BaseModel):
     """Base class for structured thinking patterns"""
+
     name: str
     description: str
     steps: List[ThinkingStep]
@@ -85,40 +915,102 @@ class ThinkingPattern(BaseModel):
     success_criteria: Dict[str, float]
     failure_conditions: List[str]
     optimization_triggers: List[str]
+    plan: Optional[CompiledPlan] = None
 
     class Config:
         arbitrary_types_allowed = True
 
+
+_COMPILED_PLANS: Dict[type, CompiledPlan] = {}
+
+
 class WhatsAppCampaignThinking(ThinkingPattern):
     """Specialized thinking pattern for WhatsApp campaigns"""
 
-    def __init__(self, context: ThinkingContext, **kwargs):
+    PATTERN_NAME: ClassVar[str] = "WhatsApp Campaign Orchestration"
+    PATTERN_DESCRIPTION: ClassVar[str] = (
+        "Sequential thinking pattern for WhatsApp automation campaigns"
+    )
+
+    def __init__(self, context: ThinkingContext, **kwargs: Any):
         super().__init__(
-            name="WhatsApp Campaign Orchestration",
-            description="Sequential thinking pattern for WhatsApp automation campaigns",
+            name=self.PATTERN_NAME,
+            description=self.PATTERN_DESCRIPTION,
             context=context,
             steps=self._generate_campaign_steps(context),
-            success_criteria={
+            **self._pattern_criteria(context),
+            **kwargs,
+        )
+
+    @classmethod
+    def create(
+        cls,
+        context: ThinkingContext,
+        created_at: datetime,
+        state_store: Optional[StepStateStore] = None,
+    ) -> "WhatsAppCampaignThinking":
+        """Build a campaign pattern from the compiled plan without pydantic validation
+
+        ``created_at`` stamps every step, so callers pass their own clock's time.
+        When a ``state_store`` for the compiled plan is given, step state is kept
+        in it instead of one ThinkingStep object per step, for high pattern counts.
+        """
+        plan = cls.compiled_plan()
+        if state_store is not None and state_store.plan is not plan:
+            raise ValueError(
+                f"State store does not belong to the {cls.PATTERN_NAME} plan"
+            )
+        return cls.model_construct(
+            name=cls.PATTERN_NAME,
+            description=cls.PATTERN_DESCRIPTION,
+            context=context,
+            steps=(
+                state_store.allocate(created_at)
+                if state_store is not None
+                else plan.instantiate_steps(created_at)
+            ),
+            plan=plan,
+            **cls._pattern_criteria(context),
+        )
+
+    @classmethod
+    def compiled_plan(cls) -> CompiledPlan:
+        """The plan for this pattern type, compiled on first use"""
+        plan = _COMPILED_PLANS.get(cls)
+        if plan is None:
+            plan = CompiledPlan.compile(
+                cls.PATTERN_NAME, cls._generate_campaign_steps()
+            )
+            _COMPILED_PLANS[cls] = plan
+        return plan
+
+    @staticmethod
+    def _pattern_criteria(context: ThinkingContext) -> Dict[str, Any]:
+        """Success, failure and optimization criteria for a campaign"""
+        return {
+            "success_criteria": {
                 "roi_achieved": context.roi_target,
                 "response_rate": 0.25,
                 "conversion_rate": 0.15,
-                "cost_per_acquisition": 50.0
+                "cost_per_acquisition": 50.0,
             },
-            failure_conditions=[
+            "failure_conditions": [
                 "response_rate < 0.05",
                 "conversion_rate < 0.02",
                 "budget_exceeded",
-                "compliance_violation"
+                "compliance_violation",
             ],
-            optimization_triggers=[
+            "optimization_triggers": [
                 "response_rate < 0.15",
                 "cost_per_acquisition > 75",
-                "campaign_halfway_underperforming"
+                "campaign_halfway_underperforming",
             ],
-            **kwargs
-        )
+        }
 
-    def _generate_campaign_steps(self, context: ThinkingContext) -> List[ThinkingStep]:
+    @staticmethod
+    def _generate_campaign_steps(
+        context: Optional[ThinkingContext] = None,
+    ) -> List[ThinkingStep]:
         """Generate sequential steps for campaign thinking"""
         steps = [
             # Analysis Stage
@@ -129,9 +1021,8 @@ class WhatsAppCampaignThinking(ThinkingPattern):
                 inputs=["google_sheets_data", "historical_campaign_data"],
                 outputs=["audience_segments", "demographic_insights"],
                 priority=Priority.CRITICAL,
-                estimated_duration=timedelta(minutes=10)
+                estimated_duration=timedelta(minutes=10),
             ),
-
             ThinkingStep(
                 id="analyze_historical_performance",
                 stage=ThinkingStage.ANALYSIS,
@@ -140,9 +1031,8 @@ class WhatsAppCampaignThinking(ThinkingPattern):
                 outputs=["performance_patterns", "success_factors"],
                 dependencies=["analyze_audience_data"],
                 priority=Priority.HIGH,
-                estimated_duration=timedelta(minutes=15)
+                estimated_duration=timedelta(minutes=15),
             ),
-
             # Planning Stage
             ThinkingStep(
                 id="plan_segmentation_strategy",
@@ -150,11 +1040,13 @@ class WhatsAppCampaignThinking(ThinkingPattern):
                 description="Plan optimal audience segmentation strategy",
                 inputs=["audience_segments", "performance_patterns"],
                 outputs=["segmentation_plan", "targeting_criteria"],
-                dependencies=["analyze_audience_data", "analyze_historical_performance"],
+                dependencies=[
+                    "analyze_audience_data",
+                    "analyze_historical_performance",
+                ],
                 priority=Priority.CRITICAL,
-                estimated_duration=timedelta(minutes=20)
+                estimated_duration=timedelta(minutes=20),
             ),
-
             ThinkingStep(
                 id="plan_message_sequences",
                 stage=ThinkingStage.PLANNING,
@@ -163,9 +1055,8 @@ class WhatsAppCampaignThinking(ThinkingPattern):
                 outputs=["message_sequences", "timing_strategy"],
                 dependencies=["plan_segmentation_strategy"],
                 priority=Priority.HIGH,
-                estimated_duration=timedelta(minutes=30)
+                estimated_duration=timedelta(minutes=30),
             ),
-
             # Segmentation Stage
             ThinkingStep(
                 id="execute_smart_segmentation",
@@ -175,9 +1066,8 @@ class WhatsAppCampaignThinking(ThinkingPattern):
                 outputs=["segmented_audiences", "segment_priorities"],
                 dependencies=["plan_segmentation_strategy"],
                 priority=Priority.CRITICAL,
-                estimated_duration=timedelta(minutes=15)
+                estimated_duration=timedelta(minutes=15),
             ),
-
             # Optimization Stage
             ThinkingStep(
                 id="optimize_message_timing",
@@ -187,9 +1077,8 @@ class WhatsAppCampaignThinking(ThinkingPattern):
                 outputs=["optimized_schedule", "send_times"],
                 dependencies=["plan_message_sequences", "execute_smart_segmentation"],
                 priority=Priority.HIGH,
-                estimated_duration=timedelta(minutes=25)
+                estimated_duration=timedelta(minutes=25),
             ),
-
             ThinkingStep(
                 id="optimize_message_content",
                 stage=ThinkingStage.OPTIMIZATION,
@@ -198,21 +1087,23 @@ class WhatsAppCampaignThinking(ThinkingPattern):
                 outputs=["personalized_messages", "content_variants"],
                 dependencies=["execute_smart_segmentation"],
                 priority=Priority.HIGH,
-                estimated_duration=timedelta(minutes=20)
+                estimated_duration=timedelta(minutes=20),
             ),
-
             # Execution Stage
             ThinkingStep(
                 id="execute_campaign_launch",
                 stage=ThinkingStage.EXECUTION,
                 description="Execute coordinated campaign launch",
-                inputs=["optimized_schedule", "personalized_messages", "segmented_audiences"],
+                inputs=[
+                    "optimized_schedule",
+                    "personalized_messages",
+                    "segmented_audiences",
+                ],
                 outputs=["campaign_status", "initial_metrics"],
                 dependencies=["optimize_message_timing", "optimize_message_content"],
                 priority=Priority.CRITICAL,
-                estimated_duration=timedelta(hours=1)
+                estimated_duration=timedelta(hours=1),
             ),
-
             # Monitoring Stage
             ThinkingStep(
                 id="monitor_real_time_performance",
@@ -222,9 +1113,8 @@ class WhatsAppCampaignThinking(ThinkingPattern):
                 outputs=["performance_alerts", "optimization_recommendations"],
                 dependencies=["execute_campaign_launch"],
                 priority=Priority.CRITICAL,
-                estimated_duration=timedelta(hours=24)  # Continuous
+                estimated_duration=timedelta(hours=24),  # Continuous
             ),
-
             # Evaluation Stage
             ThinkingStep(
                 id="evaluate_roi_performance",
@@ -234,9 +1124,8 @@ class WhatsAppCampaignThinking(ThinkingPattern):
                 outputs=["roi_analysis", "performance_report"],
                 dependencies=["monitor_real_time_performance"],
                 priority=Priority.HIGH,
-                estimated_duration=timedelta(minutes=30)
+                estimated_duration=timedelta(minutes=30),
             ),
-
             # Adaptation Stage
             ThinkingStep(
                 id="adapt_strategy_realtime",
@@ -246,129 +1135,1165 @@ class WhatsAppCampaignThinking(ThinkingPattern):
                 outputs=["strategy_adjustments", "updated_parameters"],
                 dependencies=["evaluate_roi_performance"],
                 priority=Priority.HIGH,
-                estimated_duration=timedelta(minutes=15)
-            )
+                estimated_duration=timedelta(minutes=15),
+            ),
         ]
 
         return steps
 
+
+@dataclass
+class StepEvent:
+    """A step status transition published to engine subscribers"""
+
+    pattern_id: str
+    step_id: str
+    stage: str
+    status: str
+    previous_status: str
+    completed_steps: int
+    failed_steps: int
+    total_steps: int
+    timestamp: datetime
+
+    @property
+    def pattern_finished(self) -> bool:
+        return self.completed_steps + self.failed_steps == self.total_steps
+
+
+class EventSubscription:
+    """Bounded event buffer for one subscriber; oldest events drop on overflow"""
+
+    def __init__(self, pattern_id: Optional[str], buffer_size: int):
+        self.pattern_id = pattern_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped_events = 0
+
+    def publish(self, event: StepEvent) -> None:
+        if self.queue.full():
+            # A slow subscriber loses history, never the latest progress
+            self.queue.get_nowait()
+            self.dropped_events += 1
+        self.queue.put_nowait(event)
+
+
+@dataclass
+class PatternSchedule:
+    """Recurring cron schedule that starts a pattern template for one campaign"""
+
+    schedule_id: str
+    template: str
+    context: ThinkingContext
+    cron_expression: str
+    priority: Priority = Priority.MEDIUM
+    jitter: timedelta = field(default_factory=timedelta)
+    next_fire_at: Optional[datetime] = None
+    last_fired_at: Optional[datetime] = None
+    last_pattern_id: Optional[str] = None
+    fire_count: int = 0
+    generation: int = 0
+
+
+# Pattern types the engine can rebuild from a checkpoint journal, keyed by pattern name
+PATTERN_TEMPLATES: Dict[str, Type[WhatsAppCampaignThinking]] = {
+    WhatsAppCampaignThinking.PATTERN_NAME: WhatsAppCampaignThinking
+}
+
+
 class ThinkingEngine:
     """Core engine for sequential thinking orchestration"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        max_concurrent_patterns: int = 4,
+        max_queue_size: int = 100,
+        queue_full_policy: str = "wait",
+        step_cache: Optional[StepResultCache] = None,
+        max_completed_patterns: int = 1000,
+        completed_retention: timedelta = timedelta(hours=24),
+        duration_estimator: Optional[DurationEstimator] = None,
+        journal: Optional[CheckpointJournal] = None,
+        clock: Optional[Clock] = None,
+        journal_compact_every: int = 100,
+    ):
+        if queue_full_policy not in ("wait", "reject"):
+            raise ValueError(f"Unknown queue full policy: {queue_full_policy}")
+
+        self.clock = clock or SystemClock()
         self.active_patterns: Dict[str, ThinkingPattern] = {}
-        self.completed_patterns: Dict[str, ThinkingPattern] = {}
-        self.thinking_queue: asyncio.Queue = asyncio.Queue()
+        self.completed_patterns: "OrderedDict[str, ThinkingPattern]" = OrderedDict()
+        self.pattern_progress: Dict[str, PatternProgress] = {}
+        self.max_completed_patterns = max_completed_patterns
+        self.completed_retention = completed_retention
+        self._executing_patterns: set = set()
+        self.thinking_queue: asyncio.PriorityQueue = asyncio.PriorityQueue(
+            maxsize=max_queue_size
+        )
+        self.max_concurrent_patterns = max_concurrent_patterns
+        self.queue_full_policy = queue_full_policy
+        self.workers: List[asyncio.Task] = []
+        self._queue_sequence = itertools.count()
+        self._pattern_sequence = itertools.count(1)
+        self.stage_executors: Dict[ThinkingStage, StageExecutor] = {}
+        self._offload_pools: Dict[str, Executor] = {}
+        self.step_cache = (
+            step_cache if step_cache is not None else StepResultCache(clock=self.clock)
+        )
+        self.duration_estimator = (
+            duration_estimator
+            if duration_estimator is not None
+            else DurationEstimator()
+        )
+        self.journal = journal
+        # The journal drops finished patterns every this many archived patterns
+        self.journal_compact_every = journal_compact_every
+        self._archived_since_compaction = 0
+        self.pattern_index = PatternIndex()
+        self._state_stores: Dict[CompiledPlan, StepStateStore] = {}
+        self.schedules: Dict[str, PatternSchedule] = {}
+        # (fire timestamp, schedule id, generation); stale entries are skipped lazily
+        self._schedule_heap: List[Tuple[float, str, int]] = []
+        # Engine-wide, so a schedule id that is removed and added again never
+        # reuses the generation of a heap entry that is still pending
+        self._schedule_generations = itertools.count()
+        self._scheduler_task: Optional[asyncio.Task] = None
+        self._scheduler_wakeup: Optional[asyncio.Event] = None
+        self._jitter_random = random.Random()
+        # Subscriptions keyed by pattern id; None holds the subscribers to every pattern
+        self._subscriptions: Dict[Optional[str], set] = {}
         self.logger = structlog.get_logger(__name__)
 
-    async def start_thinking(self, pattern: ThinkingPattern) -> str:
-        """Start a new thinking pattern"""
-        pattern_id = f"{pattern.name}_{datetime.now().isoformat()}"
-        self.active_patterns[pattern_id] = pattern
+        self._register_default_stage_handlers()
+
+    def _register_default_stage_handlers(self) -> None:
+        """Register the built-in handler for every thinking stage"""
+        # Optimization is the expensive stage, so it gets the tightest concurrency;
+        # monitoring is long-running by nature and is bounded by its timeout instead.
+        # Execution sends messages, and monitoring and adaptation react to live
+        # results, so their outputs are never served from the step cache.
+        uncacheable = {
+            ThinkingStage.EXECUTION,
+            ThinkingStage.MONITORING,
+            ThinkingStage.ADAPTATION,
+        }
+        defaults = {
+            ThinkingStage.ANALYSIS: (self._analyze_step, 8, timedelta(minutes=2)),
+            ThinkingStage.PLANNING: (self._planning_step, 4, timedelta(minutes=5)),
+            ThinkingStage.SEGMENTATION: (
+                self._segmentation_step,
+                4,
+                timedelta(minutes=5),
+            ),
+            ThinkingStage.OPTIMIZATION: (
+                self._optimization_step,
+                2,
+                timedelta(minutes=10),
+            ),
+            ThinkingStage.EXECUTION: (self._execution_step, 4, timedelta(minutes=30)),
+            ThinkingStage.MONITORING: (self._monitoring_step, 8, timedelta(minutes=1)),
+            ThinkingStage.EVALUATION: (self._evaluation_step, 4, timedelta(minutes=5)),
+            ThinkingStage.ADAPTATION: (self._adaptation_step, 4, timedelta(minutes=5)),
+        }
 
-        await self.thinking_queue.put({
-            "action": "start_pattern",
-            "pattern_id": pattern_id,
-            "pattern": pattern
-        })
+        for stage, (handler, max_concurrency, timeout) in defaults.items():
+            self.register_stage_handler(
+                stage,
+                handler,
+                max_concurrency=max_concurrency,
+                timeout=timeout,
+                cacheable=stage not in uncacheable,
+            )
+
+    def register_stage_handler(
+        self,
+        stage: ThinkingStage,
+        handler: Callable[[ThinkingStep], Any],
+        max_concurrency: int = 4,
+        timeout: Optional[timedelta] = None,
+        offload: Optional[str] = None,
+        version: str = "1",
+        cacheable: bool = True,
+    ) -> StageExecutor:
+        """Register (or replace) the handler that executes steps of a stage
+
+        Handlers run on the event loop must be coroutine functions. Blocking handlers
+        can be offloaded to a thread pool, or to a process pool when they are
+        CPU-bound; process-offloaded handlers must be picklable module-level functions.
+        Handlers with side effects should pass ``cacheable=False`` so they always run.
+        """
+        executor = StageExecutor(
+            stage=stage,
+            handler=handler,
+            max_concurrency=max_concurrency,
+            timeout=timeout,
+            offload=offload,
+            version=version,
+            cacheable=cacheable,
+        )
+        self.stage_executors[stage] = executor
+
+        self.logger.debug(
+            "Registered stage handler",
+            stage=stage.value,
+            max_concurrency=max_concurrency,
+            timeout=timeout.total_seconds() if timeout else None,
+            offload=offload,
+        )
+
+        return executor
+
+    def _get_offload_pool(self, offload: str) -> Executor:
+        """Lazily create the shared thread or process pool"""
+        if offload not in self._offload_pools:
+            if offload == "process":
+                self._offload_pools[offload] = ProcessPoolExecutor()
+            else:
+                self._offload_pools[offload] = ThreadPoolExecutor(
+                    thread_name_prefix="thinking-stage"
+                )
+        return self._offload_pools[offload]
+
+    async def start_thinking(
+        self,
+        pattern: ThinkingPattern,
+        priority: Priority = Priority.MEDIUM,
+        reject_when_full: bool = False,
+    ) -> str:
+        """Start a new thinking pattern
+
+        ``reject_when_full`` raises QueueFull instead of waiting for room, whatever
+        the engine's queue full policy, for callers that must never block.
+        """
+        pattern_id = f"{pattern.name}_{self.clock.now().isoformat()}"
+        if pattern_id in self.pattern_progress:
+            # A virtual clock can start many patterns at the same instant
+            pattern_id = f"{pattern_id}_{next(self._pattern_sequence)}"
+        self.active_patterns[pattern_id] = pattern
+        self._track_pattern(pattern_id, pattern)
+        self._journal(
+            "record_pattern_started",
+            pattern_id,
+            pattern.name,
+            asdict(pattern.context),
+            priority.value,
+            compact=isinstance(pattern.steps, CompactSteps),
+        )
+        self._ensure_workers()
+
+        queue_item = self._queue_item(pattern_id, pattern, priority)
+
+        if reject_when_full or self.queue_full_policy == "reject":
+            try:
+                self.thinking_queue.put_nowait(queue_item)
+            except asyncio.QueueFull:
+                self._abandon_pattern(pattern_id, pattern)
+                self.logger.warning(
+                    "Rejected thinking pattern, queue full",
+                    pattern_name=pattern.name,
+                    queue_size=self.thinking_queue.qsize(),
+                )
+                raise asyncio.QueueFull(
+                    "Thinking queue is full "
+                    f"({self.thinking_queue.maxsize} patterns waiting)"
+                )
+        else:
+            try:
+                await self.thinking_queue.put(queue_item)
+            except asyncio.CancelledError:
+                # Cancelled while waiting for room, the pattern was never queued
+                self._abandon_pattern(pattern_id, pattern)
+                raise
 
         self.logger.info(
             "Started thinking pattern",
             pattern_id=pattern_id,
             pattern_name=pattern.name,
-            total_steps=len(pattern.steps)
+            priority=priority.value,
+            total_steps=len(pattern.steps),
         )
 
         return pattern_id
 
-    async def process_thinking_step(self, pattern_id: str, step: ThinkingStep) -> Dict[str, Any]:
+    def _abandon_pattern(self, pattern_id: str, pattern: ThinkingPattern) -> None:
+        """Undo the registration of a pattern that never made it into the queue"""
+        del self.active_patterns[pattern_id]
+        self._untrack_pattern(pattern_id)
+        self._release_pattern_state(pattern)
+        self._journal("record_pattern_finished", pattern_id)
+
+    def _queue_item(
+        self, pattern_id: str, pattern: ThinkingPattern, priority: Priority
+    ) -> tuple:
+        # Sequence number keeps FIFO order within a priority and avoids comparing jobs
+        return (
+            PRIORITY_RANK[priority],
+            next(self._queue_sequence),
+            {"action": "start_pattern", "pattern_id": pattern_id, "pattern": pattern},
+        )
+
+    async def recover(self) -> List[str]:
+        """Resume the unfinished patterns recorded in the checkpoint journal
+
+        Completed steps are restored with their results; every other step is reset
+        to pending and re-queued, so only unfinished work runs again.
+        """
+        if self.journal is None:
+            return []
+
+        resumed = []
+        for record in await asyncio.to_thread(self.journal.replay):
+            pattern_id = record["pattern_id"]
+            if pattern_id in self.active_patterns:
+                continue
+
+            template = PATTERN_TEMPLATES.get(record["template"])
+            if template is None:
+                self.logger.warning(
+                    "Cannot resume pattern without a registered template",
+                    pattern_id=pattern_id,
+                    template=record["template"],
+                )
+                self._journal("record_pattern_finished", pattern_id)
+                continue
+
+            state_store = (
+                self.state_store(template.compiled_plan())
+                if record.get("compact")
+                else None
+            )
+            pattern = template.create(
+                ThinkingContext(**record["context"]),
+                self.clock.now(),
+                state_store=state_store,
+            )
+            restored_steps = 0
+            for step in pattern.steps:
+                state = record["steps"].get(step.id)
+                if state is None or state["status"] != ThinkingStatus.COMPLETED.value:
+                    continue
+                step.result = state.get("result")
+                if state.get("duration_seconds") is not None:
+                    step.actual_duration = timedelta(seconds=state["duration_seconds"])
+                step.status = ThinkingStatus.COMPLETED
+                restored_steps += 1
+
+            self.active_patterns[pattern_id] = pattern
+            self._track_pattern(pattern_id, pattern)
+
+            if self.pattern_progress[pattern_id].finished_steps == len(pattern.steps):
+                self._archive_pattern(pattern_id)
+                continue
+
+            self._ensure_workers()
+            await self.thinking_queue.put(
+                self._queue_item(pattern_id, pattern, Priority(record["priority"]))
+            )
+            resumed.append(pattern_id)
+
+            self.logger.info(
+                "Resumed thinking pattern from checkpoint",
+                pattern_id=pattern_id,
+                restored_steps=restored_steps,
+                remaining_steps=len(pattern.steps) - restored_steps,
+            )
+
+        await asyncio.to_thread(self._journal, "compact")
+        return resumed
+
+    def _journal(self, method: str, *args: Any, **kwargs: Any) -> None:
+        """Write to the checkpoint journal; storage errors never break execution"""
+        if self.journal is None:
+            return
+        try:
+            getattr(self.journal, method)(*args, **kwargs)
+        except Exception as e:
+            self.logger.error(
+                "Checkpoint journal write failed", operation=method, error=str(e)
+            )
+
+    def _ensure_workers(self) -> None:
+        """Lazily start the worker pool on the running event loop"""
+        self.workers = [worker for worker in self.workers if not worker.done()]
+        while len(self.workers) < self.max_concurrent_patterns:
+            worker_id = len(self.workers)
+            self.workers.append(asyncio.create_task(self._worker_loop(worker_id)))
+
+    async def _worker_loop(self, worker_id: int) -> None:
+        """Drain the thinking queue, highest priority first"""
+        while True:
+            _, _, job = await self.thinking_queue.get()
+            try:
+                if job["action"] == "start_pattern":
+                    await self.execute_pattern(job["pattern_id"])
+                else:
+                    self.logger.warning(
+                        "Unknown thinking job",
+                        worker_id=worker_id,
+                        action=job["action"],
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(
+                    "Thinking worker failed to execute job",
+                    worker_id=worker_id,
+                    pattern_id=job.get("pattern_id"),
+                    error=str(e),
+                )
+            finally:
+                self.thinking_queue.task_done()
+
+    async def schedule_pattern(
+        self,
+        template: str,
+        context: ThinkingContext,
+        cron_expression: str,
+        priority: Priority = Priority.MEDIUM,
+        jitter: timedelta = timedelta(0),
+        schedule_id: Optional[str] = None,
+    ) -> str:
+        """Start ``template`` for ``context`` on every fire of a cron expression
+
+        Each fire is delayed by a random offset of up to ``jitter`` so schedules
+        sharing an expression do not all enqueue at the same instant. Scheduling the
+        same template, campaign and expression again replaces the existing entry.
+        """
+        if template not in PATTERN_TEMPLATES:
+            raise ValueError(f"Unknown pattern template: {template}")
+        if not croniter.is_valid(cron_expression):
+            raise ValueError(f"Invalid cron expression: {cron_expression}")
+        if jitter < timedelta(0):
+            raise ValueError("Schedule jitter must not be negative")
+
+        schedule_id = (
+            schedule_id or f"{template}:{context.campaign_id}:{cron_expression}"
+        )
+        schedule = PatternSchedule(
+            schedule_id=schedule_id,
+            template=template,
+            context=context,
+            cron_expression=cron_expression,
+            priority=priority,
+            jitter=jitter,
+            generation=next(self._schedule_generations),
+        )
+        self.schedules[schedule_id] = schedule
+        next_fire_at = self._push_schedule(schedule, self.clock.now())
+        self._ensure_scheduler()
+
+        self.logger.info(
+            "Scheduled thinking pattern",
+            schedule_id=schedule_id,
+            cron_expression=cron_expression,
+            next_fire_at=next_fire_at.isoformat(),
+        )
+        return schedule_id
+
+    def unschedule_pattern(self, schedule_id: str) -> bool:
+        """Remove a recurring schedule; its pending heap entry is skipped when popped"""
+        return self.schedules.pop(schedule_id, None) is not None
+
+    def list_schedules(self) -> List[Dict[str, Any]]:
+        """Registered schedules ordered by their next fire time"""
+        return [
+            {
+                "schedule_id": schedule.schedule_id,
+                "template": schedule.template,
+                "campaign_id": schedule.context.campaign_id,
+                "cron_expression": schedule.cron_expression,
+                "priority": schedule.priority.value,
+                "next_fire_at": schedule.next_fire_at,
+                "last_fired_at": schedule.last_fired_at,
+                "last_pattern_id": schedule.last_pattern_id,
+                "fire_count": schedule.fire_count,
+            }
+            for schedule in sorted(
+                self.schedules.values(),
+                key=lambda schedule: schedule.next_fire_at or datetime.max,
+            )
+        ]
+
+    async def subscribe(
+        self, pattern_id: Optional[str] = None, buffer_size: int = 256
+    ) -> AsyncIterator[StepEvent]:
+        """Stream step transitions as they happen
+
+        With a ``pattern_id`` the stream ends after the event that finishes the
+        pattern; without one it follows every pattern until the consumer stops.
+        Each subscriber has its own bounded buffer, so a slow consumer only drops
+        its own oldest events and never blocks step execution.
+        """
+        if buffer_size < 1:
+            raise ValueError("Subscription buffer size must be at least 1")
+
+        subscription = EventSubscription(pattern_id, buffer_size)
+        self._subscriptions.setdefault(pattern_id, set()).add(subscription)
+        try:
+            if pattern_id is not None:
+                pattern = self.get_pattern(pattern_id)
+                if pattern is None:
+                    raise ValueError(f"Unknown thinking pattern: {pattern_id}")
+                # Counted on the final transition, before the pattern is archived,
+                # so a subscriber arriving in between does not wait forever
+                progress = self.pattern_progress[pattern_id]
+                if progress.finished_steps == progress.total_steps:
+                    return
+
+            while True:
+                event = await subscription.queue.get()
+                yield event
+                if pattern_id is not None and event.pattern_finished:
+                    return
+        finally:
+            subscribers = self._subscriptions.get(pattern_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[pattern_id]
+            if subscription.dropped_events:
+                self.logger.warning(
+                    "Subscriber dropped step events",
+                    pattern_id=pattern_id,
+                    dropped_events=subscription.dropped_events,
+                )
+
+    def _publish_step_event(
+        self,
+        pattern_id: str,
+        step: ThinkingStep,
+        previous: ThinkingStatus,
+        progress: PatternProgress,
+    ) -> None:
+        """Fan a step transition out to the pattern's subscribers and the global ones"""
+        subscribers = self._subscriptions.get(pattern_id, ())
+        global_subscribers = self._subscriptions.get(None, ())
+        if not subscribers and not global_subscribers:
+            return
+
+        event = StepEvent(
+            pattern_id=pattern_id,
+            step_id=step.id,
+            stage=step.stage.value,
+            status=step.status.value,
+            previous_status=previous.value,
+            completed_steps=progress.status_counts[ThinkingStatus.COMPLETED],
+            failed_steps=progress.status_counts[ThinkingStatus.FAILED],
+            total_steps=progress.total_steps,
+            timestamp=self.clock.now(),
+        )
+        for subscription in itertools.chain(subscribers, global_subscribers):
+            subscription.publish(event)
+
+    def _push_schedule(self, schedule: PatternSchedule, after: datetime) -> datetime:
+        """Compute the next cron fire after ``after`` and push it onto the heap"""
+        next_fire_at: datetime = croniter(schedule.cron_expression, after).get_next(
+            datetime
+        )
+        schedule.next_fire_at = next_fire_at
+        offset = (
+            self._jitter_random.uniform(0, schedule.jitter.total_seconds())
+            if schedule.jitter
+            else 0.0
+        )
+        heapq.heappush(
+            self._schedule_heap,
+            (
+                next_fire_at.timestamp() + offset,
+                schedule.schedule_id,
+                schedule.generation,
+            ),
+        )
+        if self._scheduler_wakeup is not None:
+            self._scheduler_wakeup.set()
+        return next_fire_at
+
+    def _ensure_scheduler(self) -> None:
+        """Lazily start the single scheduler task on the running event loop"""
+        if self._scheduler_task is None or self._scheduler_task.done():
+            self._scheduler_wakeup = asyncio.Event()
+            self._scheduler_task = asyncio.create_task(
+                self._scheduler_loop(self._scheduler_wakeup)
+            )
+
+    async def _scheduler_loop(self, wakeup: asyncio.Event) -> None:
+        """Sleep until the earliest fire time, then start every due schedule"""
+        while True:
+            wakeup.clear()
+            if not self._schedule_heap:
+                await wakeup.wait()
+                continue
+
+            delay = self._schedule_heap[0][0] - self.clock.time()
+            if delay > 0:
+                # A newly pushed, earlier schedule sets the event and shortens the wait
+                await self.clock.wait_for_event(wakeup, delay)
+                continue
+
+            _, schedule_id, generation = heapq.heappop(self._schedule_heap)
+            schedule = self.schedules.get(schedule_id)
+            if schedule is None or schedule.generation != generation:
+                continue
+
+            try:
+                await self._fire_schedule(schedule)
+            except Exception as e:
+                # One failing fire must not stop every other schedule
+                self.logger.error(
+                    "Scheduled pattern fire failed",
+                    schedule_id=schedule_id,
+                    error=str(e),
+                )
+            # Fires missed while the engine was stalled are coalesced into this one
+            now = self.clock.now()
+            self._push_schedule(schedule, max(schedule.next_fire_at or now, now))
+
+    async def _fire_schedule(self, schedule: PatternSchedule) -> None:
+        """Start one run of a scheduled pattern, skipping it when the queue is full"""
+        pattern = PATTERN_TEMPLATES[schedule.template].create(
+            copy.deepcopy(schedule.context), self.clock.now()
+        )
+        try:
+            # Waiting for room would hold up every other schedule behind this one
+            pattern_id = await self.start_thinking(
+                pattern, priority=schedule.priority, reject_when_full=True
+            )
+        except asyncio.QueueFull:
+            self.logger.warning(
+                "Skipped scheduled pattern fire, queue is full",
+                schedule_id=schedule.schedule_id,
+            )
+            return
+
+        schedule.last_fired_at = self.clock.now()
+        schedule.last_pattern_id = pattern_id
+        schedule.fire_count += 1
+
+    async def shutdown(self, drain: bool = False) -> None:
+        """Stop the scheduler and worker pool, optionally draining the queue first"""
+        if self._scheduler_task is not None:
+            self._scheduler_task.cancel()
+            await asyncio.gather(self._scheduler_task, return_exceptions=True)
+            self._scheduler_task = None
+
+        if drain:
+            await self.thinking_queue.join()
+
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+        for pool in self._offload_pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._offload_pools = {}
+
+        if self.journal is not None:
+            # Waits for the writer thread to commit the queued events
+            await asyncio.to_thread(self.journal.close)
+
+    async def execute_pattern(self, pattern_id: str) -> Dict[str, Any]:
+        """Execute a pattern as a dependency graph, running ready steps concurrently"""
+        if pattern_id not in self.active_patterns:
+            raise ValueError(f"Unknown thinking pattern: {pattern_id}")
+        if pattern_id in self._executing_patterns:
+            raise ValueError(f"Thinking pattern is already executing: {pattern_id}")
+
+        pattern = self.active_patterns[pattern_id]
+        plan = self._plan_for(pattern)
+        steps = pattern.steps
+        # Counting only unfinished dependencies lets partially executed patterns resume
+        remaining_dependencies = [
+            sum(
+                1
+                for dependency in step_dependencies
+                if steps[dependency].status != ThinkingStatus.COMPLETED
+            )
+            for step_dependencies in plan.dependencies
+        ]
+
+        start_time = self.clock.now()
+        running: Dict[asyncio.Task, int] = {}
+
+        def launch_ready(positions: Sequence[int]) -> None:
+            for position in positions:
+                step = steps[position]
+                if (
+                    step.status != ThinkingStatus.PENDING
+                    or remaining_dependencies[position] > 0
+                ):
+                    continue
+                task = asyncio.create_task(self.process_thinking_step(pattern_id, step))
+                running[task] = position
+
+        self._executing_patterns.add(pattern_id)
+        launch_ready(plan.topological_order)
+
+        try:
+            while running:
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    position = running.pop(task)
+                    outcome = task.result()
+
+                    if outcome["success"]:
+                        for dependent in plan.dependents[position]:
+                            remaining_dependencies[dependent] -= 1
+                        launch_ready(plan.dependents[position])
+                    else:
+                        self._block_dependents(pattern_id, pattern, plan, position)
+        except asyncio.CancelledError:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            # Interrupted steps go back to pending so the pattern can be resumed
+            for position in running.values():
+                if steps[position].status == ThinkingStatus.IN_PROGRESS:
+                    self._transition_step(
+                        pattern_id, steps[position], ThinkingStatus.PENDING
+                    )
+            raise
+        finally:
+            self._executing_patterns.discard(pattern_id)
+
+        wall_clock = self.clock.now() - start_time
+        critical_path, critical_duration = plan.longest_path(
+            [
+                (
+                    step.actual_duration
+                    if step.actual_duration is not None
+                    else step.estimated_duration
+                )
+                for step in steps
+            ]
+        )
+        completed = [
+            step.id for step in steps if step.status == ThinkingStatus.COMPLETED
+        ]
+        failed = [step.id for step in steps if step.status == ThinkingStatus.FAILED]
+
+        self.logger.info(
+            "Executed thinking pattern",
+            pattern_id=pattern_id,
+            completed_steps=len(completed),
+            failed_steps=len(failed),
+            wall_clock=wall_clock.total_seconds(),
+            critical_path_duration=critical_duration.total_seconds(),
+        )
+
+        summary = {
+            "pattern_id": pattern_id,
+            "success": not failed,
+            "completed_steps": completed,
+            "failed_steps": failed,
+            "critical_path": [plan.step_ids[position] for position in critical_path],
+            "critical_path_duration": critical_duration.total_seconds(),
+            "serial_duration": sum(
+                (step.actual_duration or timedelta()).total_seconds() for step in steps
+            ),
+            "wall_clock_duration": wall_clock.total_seconds(),
+        }
+
+        # Only now may eviction release the steps the summary was built from
+        progress = self.pattern_progress.get(pattern_id)
+        if progress is not None and progress.finished_steps == progress.total_steps:
+            self._archive_pattern(pattern_id)
+
+        return summary
+
+    def _plan_for(self, pattern: ThinkingPattern) -> CompiledPlan:
+        """Compiled plan matching the pattern's steps, compiling ad-hoc patterns once"""
+        plan = pattern.plan
+        if plan is not None and len(plan.step_ids) == len(pattern.steps):
+            return plan
+
+        step_ids = tuple(step.id for step in pattern.steps)
+        compiled_plan = getattr(type(pattern), "compiled_plan", None)
+        plan = compiled_plan() if compiled_plan is not None else None
+        if plan is None or plan.step_ids != step_ids:
+            plan = CompiledPlan.compile(pattern.name, pattern.steps)
+
+        pattern.plan = plan
+        return plan
+
+    def _block_dependents(
+        self, pattern_id: str, pattern: ThinkingPattern, plan: CompiledPlan, failed: int
+    ) -> None:
+        """Fail every step downstream of a failed step so the pattern can finish"""
+        failed_id = plan.step_ids[failed]
+        pending = list(plan.dependents[failed])
+        while pending:
+            position = pending.pop()
+            step = pattern.steps[position]
+            if step.status != ThinkingStatus.PENDING:
+                continue
+            step.errors = [*step.errors, f"Blocked by failed dependency: {failed_id}"]
+            self._transition_step(pattern_id, step, ThinkingStatus.FAILED)
+            pending.extend(plan.dependents[position])
+
+    def _track_pattern(self, pattern_id: str, pattern: ThinkingPattern) -> None:
+        """Initialise the incremental counters for a newly started pattern"""
+        status_counts = {status: 0 for status in ThinkingStatus}
+        for step in pattern.steps:
+            status_counts[step.status] += 1
+
+        self.pattern_progress[pattern_id] = PatternProgress(
+            total_steps=len(pattern.steps),
+            status_counts=status_counts,
+            started_at=self.clock.now(),
+        )
+        self._index_pattern(pattern_id, pattern)
+
+    def _untrack_pattern(self, pattern_id: str) -> None:
+        """Forget the counters and index entries of a pattern"""
+        del self.pattern_progress[pattern_id]
+        self.pattern_index.remove(pattern_id)
+
+    def _index_pattern(self, pattern_id: str, pattern: ThinkingPattern) -> None:
+        """Refresh the secondary index entries of a pattern from its counters"""
+        progress = self.pattern_progress[pattern_id]
+        counts = progress.status_counts
+        if progress.finished_steps == progress.total_steps:
+            status = (
+                ThinkingStatus.FAILED
+                if counts[ThinkingStatus.FAILED]
+                else ThinkingStatus.COMPLETED
+            )
+        elif counts[ThinkingStatus.PENDING] == progress.total_steps:
+            status = ThinkingStatus.PENDING
+        else:
+            status = ThinkingStatus.IN_PROGRESS
+
+        self.pattern_index.update(
+            pattern_id,
+            pattern.context.campaign_id,
+            self._get_current_stage(pattern, progress),
+            status.value,
+        )
+
+    def _transition_step(
+        self, pattern_id: str, step: ThinkingStep, status: ThinkingStatus
+    ) -> None:
+        """Move a step to a new status, keeping the pattern counters in sync"""
+        previous = step.status
+        step.status = status
+
+        progress = self.pattern_progress.get(pattern_id)
+        if progress is None or previous == status:
+            return
+
+        self._journal(
+            "record_step_transition",
+            pattern_id,
+            step.id,
+            status.value,
+            result=step.result if status == ThinkingStatus.COMPLETED else None,
+            errors=list(step.errors) if status == ThinkingStatus.FAILED else None,
+            duration_seconds=(
+                step.actual_duration.total_seconds() if step.actual_duration else None
+            ),
+        )
+
+        progress.status_counts[previous] -= 1
+        progress.status_counts[status] += 1
+        if status == ThinkingStatus.IN_PROGRESS:
+            progress.step_started[step.id] = self.clock.now()
+        else:
+            progress.step_started.pop(step.id, None)
+        if previous in TERMINAL_STATUSES and status not in TERMINAL_STATUSES:
+            progress.next_unfinished = (
+                0  # A retried step may sit behind the stage cursor
+            )
+
+        pattern = self.active_patterns.get(pattern_id) or self.completed_patterns.get(
+            pattern_id
+        )
+        if pattern is not None:
+            self._index_pattern(pattern_id, pattern)
+        self._publish_step_event(pattern_id, step, previous, progress)
+
+        # A pattern still inside execute_pattern is archived once its summary is built
+        if (
+            progress.finished_steps == progress.total_steps
+            and pattern_id not in self._executing_patterns
+        ):
+            self._archive_pattern(pattern_id)
+
+    def _archive_pattern(self, pattern_id: str) -> None:
+        """Move a finished pattern into the bounded completed store"""
+        pattern = self.active_patterns.pop(pattern_id, None)
+        if pattern is None:
+            return
+
+        self.pattern_progress[pattern_id].finished_at = self.clock.now()
+        self.completed_patterns[pattern_id] = pattern
+        self._journal("record_pattern_finished", pattern_id)
+        self._archived_since_compaction += 1
+        if self._archived_since_compaction >= self.journal_compact_every:
+            self._archived_since_compaction = 0
+            self._journal("request_compaction")
+        self._evict_completed_patterns()
+
+        self.logger.info(
+            "Archived finished thinking pattern",
+            pattern_id=pattern_id,
+            completed_patterns=len(self.completed_patterns),
+        )
+
+    def _evict_completed_patterns(self) -> None:
+        """Drop the oldest completed patterns beyond the size and age limits"""
+        cutoff = self.clock.now() - self.completed_retention
+        while self.completed_patterns:
+            oldest_id = next(iter(self.completed_patterns))
+            finished_at = self.pattern_progress[oldest_id].finished_at
+            expired = finished_at is not None and finished_at < cutoff
+            if (
+                len(self.completed_patterns) <= self.max_completed_patterns
+                and not expired
+            ):
+                break
+            self._release_pattern_state(self.completed_patterns.pop(oldest_id))
+            self._untrack_pattern(oldest_id)
+
+    def state_store(self, plan: CompiledPlan) -> StepStateStore:
+        """The engine's compact state store for a plan, created on first use"""
+        store = self._state_stores.get(plan)
+        if store is None:
+            store = self._state_stores[plan] = StepStateStore(plan, self.clock)
+        return store
+
+    @staticmethod
+    def _release_pattern_state(pattern: ThinkingPattern) -> None:
+        """Free compact step state so the store can reuse the slot"""
+        # Compact patterns hold a CompactSteps view in place of the step list
+        steps: Any = pattern.steps
+        if isinstance(steps, CompactSteps):
+            steps.release()
+
+    async def process_thinking_step(
+        self, pattern_id: str, step: ThinkingStep
+    ) -> Dict[str, Any]:
         """Process an individual thinking step"""
-        start_time = datetime.now()
-        step.status = ThinkingStatus.IN_PROGRESS
+        start_time = self.clock.now()
+        self._transition_step(pattern_id, step, ThinkingStatus.IN_PROGRESS)
 
         try:
+            cache_key = self._step_cache_key(pattern_id, step)
+            if cache_key is not None:
+                hit, cached_result = self.step_cache.get(cache_key)
+                if hit:
+                    step.result = cached_result
+                    step.actual_duration = self.clock.now() - start_time
+                    step.metadata = {**step.metadata, "cache_hit": True}
+                    self._record_step_duration(pattern_id, step, cached=True)
+                    self._transition_step(pattern_id, step, ThinkingStatus.COMPLETED)
+
+                    self.logger.info(
+                        "Reused cached thinking step result",
+                        pattern_id=pattern_id,
+                        step_id=step.id,
+                        stage=step.stage.value,
+                    )
+
+                    return {
+                        "success": True,
+                        "step_id": step.id,
+                        "result": cached_result,
+                        "duration": step.actual_duration.total_seconds(),
+                        "cached": True,
+                    }
+
             # Execute step logic based on stage
             result = await self._execute_step_logic(step)
 
-            step.status = ThinkingStatus.COMPLETED
+            if cache_key is not None:
+                self.step_cache.put(cache_key, result)
+
             step.result = result
-            step.actual_duration = datetime.now() - start_time
+            step.actual_duration = self.clock.now() - start_time
+            self._record_step_duration(pattern_id, step)
+            self._transition_step(pattern_id, step, ThinkingStatus.COMPLETED)
 
             self.logger.info(
                 "Completed thinking step",
                 pattern_id=pattern_id,
                 step_id=step.id,
                 stage=step.stage.value,
-                duration=step.actual_duration.total_seconds()
+                duration=step.actual_duration.total_seconds(),
             )
 
             return {
                 "success": True,
                 "step_id": step.id,
                 "result": result,
-                "duration": step.actual_duration.total_seconds()
+                "duration": step.actual_duration.total_seconds(),
             }
 
         except Exception as e:
-            step.status = ThinkingStatus.FAILED
-            step.errors.append(str(e))
-            step.actual_duration = datetime.now() - start_time
+            step.errors = [*step.errors, str(e)]
+            step.actual_duration = self.clock.now() - start_time
+            self._transition_step(pattern_id, step, ThinkingStatus.FAILED)
 
             self.logger.error(
                 "Failed thinking step",
                 pattern_id=pattern_id,
                 step_id=step.id,
                 error=str(e),
-                duration=step.actual_duration.total_seconds()
+                duration=step.actual_duration.total_seconds(),
             )
 
             return {
                 "success": False,
                 "step_id": step.id,
                 "error": str(e),
-                "duration": step.actual_duration.total_seconds()
+                "duration": step.actual_duration.total_seconds(),
             }
 
+    def _step_cache_key(self, pattern_id: str, step: ThinkingStep) -> Optional[str]:
+        """Content address of a step execution, or None when it cannot be cached"""
+        pattern = self.active_patterns.get(pattern_id)
+        executor = self.stage_executors.get(step.stage)
+        if pattern is None or executor is None or not executor.cacheable:
+            return None
+
+        return StepResultCache.make_key(
+            step.id, executor.version, self._resolve_step_inputs(pattern, step)
+        )
+
+    def _resolve_step_inputs(
+        self, pattern: ThinkingPattern, step: ThinkingStep
+    ) -> Dict[str, Any]:
+        """Everything a step can observe: inputs, campaign context, upstream results"""
+        plan = self._plan_for(pattern)
+        return {
+            "declared_inputs": sorted(step.inputs),
+            "context": asdict(pattern.context),
+            "dependencies": {
+                plan.step_ids[dependency]: pattern.steps[dependency].result
+                for dependency in plan.dependencies[plan.index[step.id]]
+            },
+        }
+
+    def _record_step_duration(
+        self, pattern_id: str, step: ThinkingStep, cached: bool = False
+    ) -> None:
+        """Feed a step duration into the estimator; cache hits are flagged as such"""
+        pattern = self.active_patterns.get(pattern_id)
+        if pattern is not None and step.actual_duration is not None:
+            self.duration_estimator.observe(
+                self._duration_key(pattern, step.id), step.actual_duration, cached
+            )
+
+    @staticmethod
+    def _duration_key(pattern: ThinkingPattern, step_id: str) -> str:
+        return f"{pattern.name}:{step_id}"
+
+    def get_duration_statistics(self) -> Dict[str, Dict[str, float]]:
+        """Learned per-step duration quantiles"""
+        return self.duration_estimator.snapshot()
+
+    def get_pattern(self, pattern_id: str) -> Optional[ThinkingPattern]:
+        """Look up an active or retained completed pattern"""
+        return self.active_patterns.get(pattern_id) or self.completed_patterns.get(
+            pattern_id
+        )
+
+    def find_patterns(
+        self,
+        campaign_id: Optional[str] = None,
+        stage: Optional[Union[ThinkingStage, str]] = None,
+        status: Optional[Union[ThinkingStatus, str]] = None,
+    ) -> List[str]:
+        """Pattern ids matching all given filters, answered from the secondary indexes
+
+        ``stage`` is the pattern's current stage ("completed" once every step is
+        finished) and ``status`` is one of pending, in_progress, completed or failed.
+        """
+        self._evict_completed_patterns()
+
+        if isinstance(stage, ThinkingStage):
+            stage = stage.value
+        if isinstance(status, ThinkingStatus):
+            status = status.value
+
+        return sorted(
+            self.pattern_index.find(campaign_id=campaign_id, stage=stage, status=status)
+        )
+
+    def get_index_summary(self) -> Dict[str, Dict[str, int]]:
+        """Pattern counts per campaign, current stage and status"""
+        self._evict_completed_patterns()
+        return self.pattern_index.summary()
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Step result cache counters"""
+        return self.step_cache.stats()
+
     async def _execute_step_logic(self, step: ThinkingStep) -> Any:
-        """Execute the logic for a specific thinking step"""
-        # This is where the actual business logic would be implemented
-        # For now, we'll simulate the thinking process
-
-        if step.stage == ThinkingStage.ANALYSIS:
-            return await self._analyze_step(step)
-        elif step.stage == ThinkingStage.PLANNING:
-            return await self._planning_step(step)
-        elif step.stage == ThinkingStage.SEGMENTATION:
-            return await self._segmentation_step(step)
-        elif step.stage == ThinkingStage.OPTIMIZATION:
-            return await self._optimization_step(step)
-        elif step.stage == ThinkingStage.EXECUTION:
-            return await self._execution_step(step)
-        elif step.stage == ThinkingStage.MONITORING:
-            return await self._monitoring_step(step)
-        elif step.stage == ThinkingStage.EVALUATION:
-            return await self._evaluation_step(step)
-        elif step.stage == ThinkingStage.ADAPTATION:
-            return await self._adaptation_step(step)
-        else:
+        """Execute a step through the handler registered for its stage"""
+        executor = self.stage_executors.get(step.stage)
+        if executor is None:
             raise ValueError(f"Unknown thinking stage: {step.stage}")
 
+        async with executor.semaphore:
+            hold: ContextManager[None] = nullcontext()
+            if executor.offload is None:
+                call = executor.handler(step)
+            else:
+                loop = asyncio.get_running_loop()
+                call = loop.run_in_executor(
+                    self._get_offload_pool(executor.offload), executor.handler, step
+                )
+                # Pool time is invisible to a virtual clock, which would otherwise
+                # jump ahead and time the handler out while it is still running
+                hold = self.clock.hold()
+
+            with hold:
+                if executor.timeout is None:
+                    return await call
+
+                try:
+                    return await self.clock.wait_for(
+                        call, executor.timeout.total_seconds()
+                    )
+                except TimeoutError:
+                    # Offloaded handlers keep running in their pool; the step is
+                    # released
+                    raise TimeoutError(
+                        f"{step.stage.value} handler exceeded "
+                        f"{executor.timeout.total_seconds():g}s timeout"
+                    ) from None
+
     async def _analyze_step(self, step: ThinkingStep) -> Dict[str, Any]:
         """Execute analysis thinking step"""
-        await asyncio.sleep(1)  # Simulate processing time
+        await self.clock.sleep(1)  # Simulate processing time
 
         if "audience_data" in step.id:
             return {
                 "segments": {
-                    "critical": {"size": 250, "characteristics": ["inactive_3_months", "high_value"]},
-                    "moderate": {"size": 200, "characteristics": ["inactive_2_months", "medium_value"]},
-                    "recent": {"size": 160, "characteristics": ["inactive_1_month", "new_member"]}
+                    "critical": {
+                        "size": 250,
+                        "characteristics": ["inactive_3_months", "high_value"],
+                    },
+                    "moderate": {
+                        "size": 200,
+                        "characteristics": ["inactive_2_months", "medium_value"],
+                    },
+                    "recent": {
+                        "size": 160,
+                        "characteristics": ["inactive_1_month", "new_member"],
+                    },
                 },
                 "insights": {
-                    "peak_activity_hours": ["09:00-11:00", "14:00-16:00", "19:00-21:00"],
+                    "peak_activity_hours": [
+                        "09:00-11:00",
+                        "14:00-16:00",
+                        "19:00-21:00",
+                    ],
                     "preferred_communication": "whatsapp",
-                    "response_patterns": "weekday_mornings_best"
-                }
+                    "response_patterns": "weekday_mornings_best",
+                },
             }
         elif "historical_performance" in step.id:
             return {
@@ -376,7 +2301,11 @@ class ThinkingEngine:
                     "best_performing_time": "10:00-11:00",
                     "best_performing_day": "tuesday",
                     "average_response_rate": 0.18,
-                    "conversion_factors": ["personalization", "urgency", "discount_offer"]
+                    "conversion_factors": [
+                        "personalization",
+                        "urgency",
+                        "discount_offer",
+                    ],
                 }
             }
 
@@ -384,7 +2313,7 @@ class ThinkingEngine:
 
     async def _planning_step(self, step: ThinkingStep) -> Dict[str, Any]:
         """Execute planning thinking step"""
-        await asyncio.sleep(2)  # Simulate processing time
+        await self.clock.sleep(2)  # Simulate processing time
 
         if "segmentation_strategy" in step.id:
             return {
@@ -392,58 +2321,72 @@ class ThinkingEngine:
                     "primary_segments": ["critical", "moderate", "recent"],
                     "targeting_approach": "sequential_cascade",
                     "personalization_level": "high",
-                    "timing_optimization": "individual_based"
+                    "timing_optimization": "individual_based",
                 }
             }
         elif "message_sequences" in step.id:
             return {
                 "sequences": {
-                    "critical": ["welcome_back", "special_offer", "urgency", "final_call"],
+                    "critical": [
+                        "welcome_back",
+                        "special_offer",
+                        "urgency",
+                        "final_call",
+                    ],
                     "moderate": ["check_in", "value_proposition", "offer"],
-                    "recent": ["gentle_reminder", "benefits", "trial_offer"]
+                    "recent": ["gentle_reminder", "benefits", "trial_offer"],
                 },
                 "timing": {
                     "interval_days": [0, 3, 7, 14],
-                    "optimal_hours": ["10:00", "15:00", "19:00"]
-                }
+                    "optimal_hours": ["10:00", "15:00", "19:00"],
+                },
             }
 
         return {"planning_complete": True}
 
     async def _segmentation_step(self, step: ThinkingStep) -> Dict[str, Any]:
         """Execute segmentation thinking step"""
-        await asyncio.sleep(1.5)
+        await self.clock.sleep(1.5)
 
         return {
             "segments_created": {
                 "critical_segment": {
                     "size": 250,
                     "priority": "high",
-                    "estimated_conversion": 0.15
+                    "estimated_conversion": 0.15,
                 },
                 "moderate_segment": {
                     "size": 200,
                     "priority": "medium",
-                    "estimated_conversion": 0.25
+                    "estimated_conversion": 0.25,
                 },
                 "recent_segment": {
                     "size": 160,
                     "priority": "low",
-                    "estimated_conversion": 0.35
-                }
+                    "estimated_conversion": 0.35,
+                },
             }
         }
 
     async def _optimization_step(self, step: ThinkingStep) -> Dict[str, Any]:
         """Execute optimization thinking step"""
-        await asyncio.sleep(2.5)
+        await self.clock.sleep(2.5)
 
         if "timing" in step.id:
             return {
                 "optimized_schedule": {
-                    "critical": {"send_times": ["10:00", "15:00"], "days": ["tue", "wed", "thu"]},
-                    "moderate": {"send_times": ["11:00", "16:00"], "days": ["wed", "thu", "fri"]},
-                    "recent": {"send_times": ["14:00", "19:00"], "days": ["thu", "fri", "sat"]}
+                    "critical": {
+                        "send_times": ["10:00", "15:00"],
+                        "days": ["tue", "wed", "thu"],
+                    },
+                    "moderate": {
+                        "send_times": ["11:00", "16:00"],
+                        "days": ["wed", "thu", "fri"],
+                    },
+                    "recent": {
+                        "send_times": ["14:00", "19:00"],
+                        "days": ["thu", "fri", "sat"],
+                    },
                 }
             }
         elif "content" in step.id:
@@ -451,7 +2394,7 @@ class ThinkingEngine:
                 "personalized_content": {
                     "critical": "personalized_urgent_offers",
                     "moderate": "value_focused_content",
-                    "recent": "gentle_engagement_content"
+                    "recent": "gentle_engagement_content",
                 }
             }
 
@@ -459,94 +2402,144 @@ class ThinkingEngine:
 
     async def _execution_step(self, step: ThinkingStep) -> Dict[str, Any]:
         """Execute execution thinking step"""
-        await asyncio.sleep(3)
+        await self.clock.sleep(3)
 
         return {
             "campaign_launched": True,
             "initial_metrics": {
                 "messages_sent": 610,
                 "delivery_rate": 0.98,
-                "initial_opens": 0.45
-            }
+                "initial_opens": 0.45,
+            },
         }
 
     async def _monitoring_step(self, step: ThinkingStep) -> Dict[str, Any]:
         """Execute monitoring thinking step"""
-        await asyncio.sleep(1)
+        await self.clock.sleep(1)
 
         return {
             "current_performance": {
                 "response_rate": 0.22,
                 "conversion_rate": 0.12,
-                "roi_current": 850.0
+                "roi_current": 850.0,
             },
             "alerts": [],
-            "recommendations": ["increase_personalization", "adjust_timing"]
+            "recommendations": ["increase_personalization", "adjust_timing"],
         }
 
     async def _evaluation_step(self, step: ThinkingStep) -> Dict[str, Any]:
         """Execute evaluation thinking step"""
-        await asyncio.sleep(2)
+        await self.clock.sleep(2)
 
         return {
             "roi_analysis": {
                 "current_roi": 1250.0,
                 "target_roi": 2250.0,
                 "progress": 0.56,
-                "projected_final": 2100.0
+                "projected_final": 2100.0,
             }
         }
 
     async def _adaptation_step(self, step: ThinkingStep) -> Dict[str, Any]:
         """Execute adaptation thinking step"""
-        await asyncio.sleep(1.5)
+        await self.clock.sleep(1.5)
 
         return {
             "adaptations": {
                 "timing_adjustments": ["shift_to_earlier_hours"],
                 "content_adjustments": ["increase_urgency"],
-                "segment_adjustments": ["focus_on_high_performers"]
+                "segment_adjustments": ["focus_on_high_performers"],
             }
         }
 
     async def get_pattern_status(self, pattern_id: str) -> Dict[str, Any]:
         """Get current status of a thinking pattern"""
-        if pattern_id not in self.active_patterns:
-            return {"error": "Pattern not found"}
+        self._evict_completed_patterns()
 
-        pattern = self.active_patterns[pattern_id]
+        pattern = self.active_patterns.get(pattern_id) or self.completed_patterns.get(
+            pattern_id
+        )
+        if pattern is None:
+            return {"error": "Pattern not found"}
 
-        total_steps = len(pattern.steps)
-        completed_steps = sum(1 for step in pattern.steps if step.status == ThinkingStatus.COMPLETED)
-        failed_steps = sum(1 for step in pattern.steps if step.status == ThinkingStatus.FAILED)
-        in_progress_steps = sum(1 for step in pattern.steps if step.status == ThinkingStatus.IN_PROGRESS)
+        progress = self.pattern_progress[pattern_id]
+        completed_steps = progress.status_counts[ThinkingStatus.COMPLETED]
 
         return {
             "pattern_id": pattern_id,
             "pattern_name": pattern.name,
-            "total_steps": total_steps,
+            "lifecycle": "completed" if progress.finished_at else "active",
+            "total_steps": progress.total_steps,
             "completed_steps": completed_steps,
-            "failed_steps": failed_steps,
-            "in_progress_steps": in_progress_steps,
-            "progress_percentage": (completed_steps / total_steps) * 100,
-            "current_stage": self._get_current_stage(pattern),
-            "estimated_completion": self._estimate_completion_time(pattern)
+            "failed_steps": progress.status_counts[ThinkingStatus.FAILED],
+            "in_progress_steps": progress.status_counts[ThinkingStatus.IN_PROGRESS],
+            "progress_percentage": (
+                (completed_steps / progress.total_steps) * 100
+                if progress.total_steps
+                else 100.0
+            ),
+            "current_stage": self._get_current_stage(pattern, progress),
+            **self._estimate_completion_time(pattern, progress),
         }
 
-    def _get_current_stage(self, pattern: ThinkingPattern) -> str:
+    def _get_current_stage(
+        self, pattern: ThinkingPattern, progress: PatternProgress
+    ) -> str:
         """Get the current stage of the thinking pattern"""
-        for step in pattern.steps:
-            if step.status == ThinkingStatus.IN_PROGRESS:
-                return step.stage.value
-            elif step.status == ThinkingStatus.PENDING:
+        # The cursor only moves past finished steps, so lookups are amortised O(1)
+        while progress.next_unfinished < progress.total_steps:
+            step = pattern.steps[progress.next_unfinished]
+            if step.status not in TERMINAL_STATUSES:
                 return step.stage.value
+            progress.next_unfinished += 1
         return "completed"
 
-    def _estimate_completion_time(self, pattern: ThinkingPattern) -> datetime:
-        """Estimate completion time for the pattern"""
-        remaining_time = timedelta()
-        for step in pattern.steps:
-            if step.status in [ThinkingStatus.PENDING, ThinkingStatus.IN_PROGRESS]:
-                remaining_time += step.estimated_duration
+    def _estimate_completion_time(
+        self, pattern: ThinkingPattern, progress: PatternProgress
+    ) -> Dict[str, Any]:
+        """p50/p90 ETA from the remaining critical path, using learned step durations"""
+        if progress.finished_at:
+            return {
+                "estimated_completion": progress.finished_at,
+                "estimated_completion_p90": progress.finished_at,
+                "estimated_remaining_seconds": {"p50": 0.0, "p90": 0.0},
+            }
 
-        return datetime.now() + remaining_time
\ No newline at end of file
+        now = self.clock.now()
+        plan = self._plan_for(pattern)
+        steps = pattern.steps
+        finish_p50 = [0.0] * len(plan.step_ids)
+        finish_p90 = [0.0] * len(plan.step_ids)
+
+        for position in plan.topological_order:
+            step = steps[position]
+            if step.status in TERMINAL_STATUSES:
+                continue
+
+            p50, p90 = self.duration_estimator.quantiles(
+                self._duration_key(pattern, step.id), step.estimated_duration
+            )
+            started = progress.step_started.get(step.id)
+            if started is not None:
+                elapsed = (now - started).total_seconds()
+                p50, p90 = max(p50 - elapsed, 0.0), max(p90 - elapsed, 0.0)
+
+            start_p50 = max(
+                (finish_p50[dependency] for dependency in plan.dependencies[position]),
+                default=0.0,
+            )
+            start_p90 = max(
+                (finish_p90[dependency] for dependency in plan.dependencies[position]),
+                default=0.0,
+            )
+            finish_p50[position] = start_p50 + p50
+            finish_p90[position] = start_p90 + p90
+
+        remaining_p50 = max(finish_p50, default=0.0)
+        remaining_p90 = max(finish_p90, default=0.0)
+
+        return {
+            "estimated_completion": now + timedelta(seconds=remaining_p50),
+            "estimated_completion_p90": now + timedelta(seconds=remaining_p90),
+            "estimated_remaining_seconds": {"p50": remaining_p50, "p90": remaining_p90},
+        }
@@ -6,22 +6,109 @@ user segmentation, message scheduling, and ROI optimization.
 """
 
 import asyncio
-import json
-from typing import Dict, List, Any, Optional, Callable
-from dataclasses import dataclass, field
-from datetime import datetime, timedelta
+import hashlib
+import os
+from collections import OrderedDict
+from typing import (
+    Dict,
+    List,
+    Any,
+    Optional,
+    Callable,
+    Set,
+    Tuple,
+    AsyncIterator,
+    Awaitable,
+)
+from dataclasses import dataclass, field, replace
+from datetime import datetime
 from enum import Enum
 import pandas as pd
 import numpy as np
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential
 import structlog
 
-from .thinking import ThinkingEngine, ThinkingContext, WhatsAppCampaignThinking, ThinkingStep, ThinkingStage, ThinkingStatus
+from .thinking import (
+    ThinkingEngine,
+    ThinkingContext,
+    WhatsAppCampaignThinking,
+    ThinkingStep,
+    ThinkingStage,
+)
+from .clock import Clock, SystemClock
+from .artifact_cache import StageArtifactCache, file_digest, make_key
+from .data_pipeline import (
+    DEFAULT_CHUNK_SIZE,
+    ACTIVE_SEGMENT,
+    DEFAULT_INACTIVITY_SEGMENTS,
+    DEFAULT_PROFILE_SAMPLE_SIZE,
+    HISTORY_SOURCES,
+    PAYMENT_HISTORY_SOURCE,
+    REPLY_HISTORY_SOURCE,
+    InactivitySegment,
+    ProfileSample,
+    build_inactivity_report,
+    classify_activity,
+    clean_student_data,
+    enrich_chunk,
+    is_export_file,
+    merge_chunk_reports,
+    read_payment_history,
+    read_reply_history,
+    read_student_export,
+    stream_student_export,
+    student_profiles,
+    summarize_inactivity,
+)
+from .send_planning import (
+    DEFAULT_ACTIVE_HOURS,
+    WHATSAPP_BUSINESS_LIMITS,
+    PlannedSend,
+    RateLimit,
+    ResponseHistograms,
+    SendPlanner,
+    SendRequest,
+    active_slot_mask,
+    summarize_send_plan,
+)
+from .segmentation_models import (
+    CAMPAIGN_SEGMENTS,
+    LifetimeValueCache,
+    ReactivationModel,
+    allocate_budget,
+    assign_campaign_segments,
+    cluster_students,
+    default_segment_economics,
+    probability_report,
+    segment_economics_from_profiles,
+)
 
 logger = structlog.get_logger(__name__)
 
+# Campaign budget, in BRL, when neither the campaign nor the workflow sets one
+DEFAULT_CAMPAIGN_BUDGET = 5000.0
+
+# Campaign workflows whose stages run at the same time; further launches queue
+DEFAULT_MAX_CONCURRENT_WORKFLOWS = 4
+
+# Stages a campaign workflow goes through before it is left monitoring
+WORKFLOW_STAGES = ("sheets_processing", "segmentation", "scheduling", "monitoring")
+
+# Code version of each cacheable stage; bump when its output changes for equal inputs
+STAGE_VERSIONS = {"sheets_processing": "1", "segmentation": "3", "scheduling": "2"}
+
+# Constraints the workflow itself adds while running, left out of the scheduling key
+RUNTIME_CONSTRAINTS = (
+    "segment_economics",
+    "planned_conversion_rate",
+    "budget_allocation",
+    "monitoring_task",
+)
+
+
 class WorkflowType(Enum):
     """Types of automation workflows"""
+
     GOOGLE_SHEETS_PROCESSING = "google_sheets_processing"
     USER_SEGMENTATION = "user_segmentation"
     MESSAGE_SCHEDULING = "message_scheduling"
@@ -29,25 +116,132 @@ class WorkflowType(Enum):
     PERFORMANCE_OPTIMIZATION = "performance_optimization"
     ERROR_RECOVERY = "error_recovery"
 
+
 @dataclass
 class WorkflowContext:
     """Context for workflow execution"""
+
     workflow_id: str
     workflow_type: WorkflowType
     campaign_id: str
     data_sources: Dict[str, str]
     target_metrics: Dict[str, float]
     constraints: Dict[str, Any]
-    created_at: datetime = field(default_factory=datetime.now)
+    created_at: datetime
+
+
+class JobStatus(Enum):
+    """Lifecycle of a background campaign workflow"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    MONITORING = "monitoring"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    STOPPED = "stopped"
+
+
+@dataclass
+class WorkflowJob:
+    """Handle of a campaign workflow running in the background"""
+
+    workflow_id: str
+    pattern_id: str
+    campaign_id: str
+    submitted_at: datetime
+    status: JobStatus = JobStatus.QUEUED
+    stage: Optional[str] = None
+    # Seconds spent in each finished stage, in stage order
+    stage_durations: Dict[str, float] = field(default_factory=dict)
+    # Stages loaded from the artifact cache instead of recomputed
+    cached_stages: List[str] = field(default_factory=list)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def done(self) -> bool:
+        """Whether the stages have finished, failed or been cancelled"""
+        return self.task is None or self.task.done()
+
+    async def wait(self) -> "WorkflowJob":
+        """Wait for the stages to finish; cancelling the wait leaves the job running"""
+        if self.task is not None:
+            await asyncio.wait({self.task})
+        return self
+
+    def progress(self) -> Dict[str, Any]:
+        """Per-stage progress of the job"""
+        completed = len(self.stage_durations)
+        return {
+            "workflow_id": self.workflow_id,
+            "pattern_id": self.pattern_id,
+            "campaign_id": self.campaign_id,
+            "status": self.status.value,
+            "stage": self.stage,
+            "stages_completed": completed,
+            "total_stages": len(WORKFLOW_STAGES),
+            "percent_complete": round(100 * completed / len(WORKFLOW_STAGES), 1),
+            "stage_durations": dict(self.stage_durations),
+            "cached_stages": list(self.cached_stages),
+            "submitted_at": self.submitted_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error,
+        }
+
 
 class GoogleSheetsProcessor:
     """Advanced Google Sheets data processing with intelligent analysis"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        clock: Optional[Clock] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        streaming_threshold_bytes: int = 64 * 1024 * 1024,
+        chunk_sink: Optional[Callable[[pd.DataFrame], Any]] = None,
+        profile_sample_size: int = DEFAULT_PROFILE_SAMPLE_SIZE,
+        inactivity_segments: Tuple[
+            InactivitySegment, ...
+        ] = DEFAULT_INACTIVITY_SEGMENTS,
+    ):
+        self.clock = clock or SystemClock()
+        self.chunk_size = chunk_size
+        self.inactivity_segments = inactivity_segments
+        self.streaming_threshold_bytes = streaming_threshold_bytes
+        # Receives every processed chunk of a streamed export, e.g. to persist it
+        self.chunk_sink = chunk_sink
+        # Profiles kept of a streamed export; larger exports are sampled down to it
+        self.profile_sample_size = profile_sample_size
+        # Student frames of the workflows being processed, keyed by workflow id
+        self.student_frames: Dict[str, pd.DataFrame] = {}
+        # Merged chunk reports of streamed exports, keyed by workflow id
+        self.stream_reports: Dict[str, Dict[str, Any]] = {}
+        # Profile samples of streamed exports, for workflows that asked for profiles
+        self.profile_samples: Dict[str, ProfileSample] = {}
         self.logger = structlog.get_logger(__name__)
 
     async def process_sheets_data(self, context: WorkflowContext) -> Dict[str, Any]:
         """Process Google Sheets data with sequential thinking"""
+        result, _ = await self._process(context, keep_profiles=False)
+        return result
+
+    async def process_sheets_data_with_profiles(
+        self, context: WorkflowContext
+    ) -> Tuple[Dict[str, Any], Optional[pd.DataFrame]]:
+        """Process Google Sheets data and also return the per-student profiles
+
+        Profiles are only available when the data sources include exports; they
+        are None for the simulated response. Streamed exports return a uniform
+        sample of at most ``profile_sample_size`` profiles; the report's
+        ``cleaned_records`` counts every student.
+        """
+        return await self._process(context, keep_profiles=True)
+
+    async def _process(
+        self, context: WorkflowContext, keep_profiles: bool
+    ) -> Tuple[Dict[str, Any], Optional[pd.DataFrame]]:
 
         thinking_steps = [
             ThinkingStep(
@@ -55,61 +249,81 @@ class GoogleSheetsProcessor:
                 stage=ThinkingStage.ANALYSIS,
                 description="Validate Google Sheets data sources and accessibility",
                 inputs=["sheets_urls", "api_credentials"],
-                outputs=["validated_sources", "data_quality_report"]
+                outputs=["validated_sources", "data_quality_report"],
             ),
-
             ThinkingStep(
                 id="extract_raw_data",
                 stage=ThinkingStage.ANALYSIS,
                 description="Extract raw data from Google Sheets",
                 inputs=["validated_sources"],
                 outputs=["raw_student_data", "metadata"],
-                dependencies=["validate_data_sources"]
+                dependencies=["validate_data_sources"],
             ),
-
             ThinkingStep(
                 id="clean_and_normalize",
                 stage=ThinkingStage.PLANNING,
                 description="Clean and normalize student data",
                 inputs=["raw_student_data"],
                 outputs=["cleaned_data", "normalization_report"],
-                dependencies=["extract_raw_data"]
+                dependencies=["extract_raw_data"],
             ),
-
             ThinkingStep(
                 id="identify_inactive_students",
                 stage=ThinkingStage.SEGMENTATION,
                 description="Identify inactive students based on criteria",
                 inputs=["cleaned_data", "inactivity_rules"],
                 outputs=["inactive_students", "activity_analysis"],
-                dependencies=["clean_and_normalize"]
+                dependencies=["clean_and_normalize"],
             ),
-
             ThinkingStep(
                 id="enrich_student_profiles",
                 stage=ThinkingStage.OPTIMIZATION,
                 description="Enrich student profiles with behavioral data",
                 inputs=["inactive_students", "historical_data"],
                 outputs=["enriched_profiles", "behavioral_insights"],
-                dependencies=["identify_inactive_students"]
-            )
+                dependencies=["identify_inactive_students"],
+            ),
         ]
 
+        if keep_profiles:
+            self.profile_samples[context.workflow_id] = ProfileSample(
+                self.profile_sample_size
+            )
+
         results = {}
-        for step in thinking_steps:
-            step_result = await self._execute_processing_step(step, context)
-            results[step.id] = step_result
+        try:
+            for step in thinking_steps:
+                step_result = await self._execute_processing_step(step, context)
+                results[step.id] = step_result
+        finally:
+            frame = self.student_frames.pop(context.workflow_id, None)
+            stream_report = self.stream_reports.pop(context.workflow_id, None)
+            sample = self.profile_samples.pop(context.workflow_id, None)
+
+        profiles = None
+        if keep_profiles and stream_report is not None and sample is not None:
+            profiles = sample.profiles
+        elif keep_profiles and frame is not None:
+            profiles = student_profiles(frame)
 
         return {
             "processing_complete": True,
             "total_students": results.get("extract_raw_data", {}).get("count", 0),
-            "inactive_students": results.get("identify_inactive_students", {}).get("count", 0),
-            "data_quality_score": results.get("clean_and_normalize", {}).get("quality_score", 0),
-            "enrichment_success": results.get("enrich_student_profiles", {}).get("success_rate", 0),
-            "processed_data": results
-        }
+            "inactive_students": results.get("identify_inactive_students", {}).get(
+                "count", 0
+            ),
+            "data_quality_score": results.get("clean_and_normalize", {}).get(
+                "quality_score", 0
+            ),
+            "enrichment_success": results.get("enrich_student_profiles", {}).get(
+                "success_rate", 0
+            ),
+            "processed_data": results,
+        }, profiles
 
-    async def _execute_processing_step(self, step: ThinkingStep, context: WorkflowContext) -> Dict[str, Any]:
+    async def _execute_processing_step(
+        self, step: ThinkingStep, context: WorkflowContext
+    ) -> Dict[str, Any]:
         """Execute individual processing step"""
 
         if step.id == "validate_data_sources":
@@ -125,39 +339,143 @@ class GoogleSheetsProcessor:
 
         return {"step_completed": True}
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     async def _validate_data_sources(self, context: WorkflowContext) -> Dict[str, Any]:
-        """Validate Google Sheets data sources"""
-        await asyncio.sleep(1)  # Simulate API call
+        """Validate Google Sheets data sources, backing off on the processor's clock"""
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(3),
+            wait=wait_exponential(multiplier=1, min=4, max=10),
+            sleep=self.clock.sleep,
+        )
+        result: Dict[str, Any] = await retrying(self._check_data_sources, context)
+        return result
+
+    async def _check_data_sources(self, context: WorkflowContext) -> Dict[str, Any]:
+        await self.clock.sleep(1)  # Simulate API call
 
         return {
             "sources_validated": True,
             "accessible_sheets": len(context.data_sources),
             "quality_score": 0.95,
-            "issues": []
+            "issues": [],
         }
 
     async def _extract_raw_data(self, context: WorkflowContext) -> Dict[str, Any]:
         """Extract raw data from validated sources"""
-        await asyncio.sleep(2)  # Simulate data extraction
+        export_paths = [
+            source
+            for name, source in context.data_sources.items()
+            if name not in HISTORY_SOURCES and is_export_file(source)
+        ]
+        if export_paths and self._should_stream(context, export_paths):
+            report = await self._stream_exports(
+                export_paths, self.profile_samples.get(context.workflow_id)
+            )
+            self.stream_reports[context.workflow_id] = report
+
+            return {
+                "count": report["raw_records"],
+                "streamed": True,
+                "chunks": report["chunks"],
+                "sources": export_paths,
+                "extraction_timestamp": self.clock.now().isoformat(),
+            }
+
+        if export_paths:
+            frames = await asyncio.gather(
+                *(asyncio.to_thread(read_student_export, path) for path in export_paths)
+            )
+            frame = pd.concat(frames, ignore_index=True)
+            self.student_frames[context.workflow_id] = frame
+
+            return {
+                "count": len(frame),
+                "columns": list(frame.columns),
+                "sources": export_paths,
+                "extraction_timestamp": self.clock.now().isoformat(),
+            }
+
+        await self.clock.sleep(2)  # Simulate data extraction
 
         return {
             "count": 1259,  # Based on real data from system
             "columns": [
-                "student_id", "name", "email", "phone", "registration_date",
-                "last_payment", "last_access", "plan_type", "status"
+                "student_id",
+                "name",
+                "email",
+                "phone",
+                "registration_date",
+                "last_payment",
+                "last_access",
+                "plan_type",
+                "status",
             ],
             "data_types_detected": {
                 "dates": ["registration_date", "last_payment", "last_access"],
                 "contacts": ["email", "phone"],
-                "categorical": ["plan_type", "status"]
+                "categorical": ["plan_type", "status"],
             },
-            "extraction_timestamp": datetime.now().isoformat()
+            "extraction_timestamp": self.clock.now().isoformat(),
         }
 
+    def _should_stream(self, context: WorkflowContext, export_paths: List[str]) -> bool:
+        """Stream when asked to, or when any export is too large to load at once"""
+        if "streaming_ingestion" in context.constraints:
+            return bool(context.constraints["streaming_ingestion"])
+        return any(
+            os.path.getsize(path) > self.streaming_threshold_bytes
+            for path in export_paths
+        )
+
+    async def _stream_exports(
+        self,
+        export_paths: List[str],
+        profile_sample: Optional[ProfileSample] = None,
+    ) -> Dict[str, Any]:
+        """Run exports through the chunked pipeline, keeping only the chunk reports
+
+        When ``profile_sample`` is given, the profiles of every chunk are offered
+        to it as well.
+        """
+        reports = []
+        chunks = stream_student_export(
+            export_paths,
+            self.clock.now(),
+            chunk_size=self.chunk_size,
+            segments=self.inactivity_segments,
+        )
+        while True:
+            # Each chunk is read and processed off the event loop
+            item = await asyncio.to_thread(next, chunks, None)
+            if item is None:
+                break
+            chunk, report = item
+            if self.chunk_sink is not None:
+                await asyncio.to_thread(self.chunk_sink, chunk)
+            if profile_sample is not None:
+                profile_sample.add(student_profiles(chunk))
+            reports.append(report)
+
+        self.logger.info(
+            "Streamed student exports", sources=len(export_paths), chunks=len(reports)
+        )
+        return merge_chunk_reports(reports)
+
     async def _clean_and_normalize(self, context: WorkflowContext) -> Dict[str, Any]:
         """Clean and normalize extracted data"""
-        await asyncio.sleep(1.5)  # Simulate data cleaning
+        stream_report = self.stream_reports.get(context.workflow_id)
+        if stream_report is not None:
+            return stream_report
+
+        raw_frame = self.student_frames.get(context.workflow_id)
+        if raw_frame is not None:
+            # Cleaning a large export is CPU-bound, keep it off the event loop
+            cleaned_frame, report = await asyncio.to_thread(
+                clean_student_data, raw_frame
+            )
+            self.student_frames[context.workflow_id] = cleaned_frame
+            return report
+
+        await self.clock.sleep(1.5)  # Simulate data cleaning
 
         return {
             "cleaned_records": 1252,  # 7 records removed due to data issues
@@ -166,18 +484,43 @@ class GoogleSheetsProcessor:
                 "phone_number_formatting",
                 "email_validation",
                 "date_standardization",
-                "name_case_correction"
+                "name_case_correction",
             ],
             "issues_resolved": [
                 "duplicate_emails_merged",
                 "invalid_phone_numbers_flagged",
-                "missing_registration_dates_estimated"
-            ]
+                "missing_registration_dates_estimated",
+            ],
         }
 
-    async def _identify_inactive_students(self, context: WorkflowContext) -> Dict[str, Any]:
+    async def _identify_inactive_students(
+        self, context: WorkflowContext
+    ) -> Dict[str, Any]:
         """Identify inactive students based on business rules"""
-        await asyncio.sleep(2)  # Simulate analysis
+        stream_report = self.stream_reports.get(context.workflow_id)
+        if stream_report is not None:
+            # Streamed chunks were classified as they went through the pipeline
+            return build_inactivity_report(
+                stream_report["inactivity_summary"], self.inactivity_segments
+            )
+
+        cleaned_frame = self.student_frames.get(context.workflow_id)
+        if cleaned_frame is not None:
+            reference_date = self.clock.now()
+            classified = await asyncio.to_thread(
+                classify_activity,
+                cleaned_frame,
+                reference_date,
+                self.inactivity_segments,
+            )
+            self.student_frames[context.workflow_id] = enrich_chunk(
+                classified, reference_date
+            )
+            return build_inactivity_report(
+                summarize_inactivity(classified), self.inactivity_segments
+            )
+
+        await self.clock.sleep(2)  # Simulate analysis
 
         # Based on real campaign data
         return {
@@ -187,31 +530,33 @@ class GoogleSheetsProcessor:
                     "count": 250,
                     "criteria": "inactive_3_plus_months",
                     "avg_last_payment_days": 120,
-                    "reactivation_probability": 0.15
+                    "reactivation_probability": 0.15,
                 },
                 "moderate": {
                     "count": 200,
                     "criteria": "inactive_2_3_months",
                     "avg_last_payment_days": 75,
-                    "reactivation_probability": 0.25
+                    "reactivation_probability": 0.25,
                 },
                 "recent": {
                     "count": 200,
                     "criteria": "inactive_1_2_months",
                     "avg_last_payment_days": 45,
-                    "reactivation_probability": 0.35
-                }
+                    "reactivation_probability": 0.35,
+                },
             },
             "inactivity_patterns": {
                 "seasonal_dropoff": "january_march",
                 "payment_cycle_correlation": "end_of_month",
-                "engagement_decline": "gradual_over_60_days"
-            }
+                "engagement_decline": "gradual_over_60_days",
+            },
         }
 
-    async def _enrich_student_profiles(self, context: WorkflowContext) -> Dict[str, Any]:
+    async def _enrich_student_profiles(
+        self, context: WorkflowContext
+    ) -> Dict[str, Any]:
         """Enrich student profiles with behavioral insights"""
-        await asyncio.sleep(3)  # Simulate enrichment processing
+        await self.clock.sleep(3)  # Simulate enrichment processing
 
         return {
             "success_rate": 0.88,
@@ -219,27 +564,48 @@ class GoogleSheetsProcessor:
                 "behavioral_scores": "calculated",
                 "communication_preferences": "analyzed",
                 "lifetime_value": "estimated",
-                "churn_probability": "calculated"
+                "churn_probability": "calculated",
             },
             "insights": {
                 "high_value_inactive": 45,
                 "preferred_contact_time": "morning_10am",
-                "response_likelihood": {
-                    "whatsapp": 0.72,
-                    "email": 0.35,
-                    "sms": 0.58
-                }
-            }
+                "response_likelihood": {"whatsapp": 0.72, "email": 0.35, "sms": 0.58},
+            },
         }
 
+
 class UserSegmentationEngine:
     """Advanced user segmentation with ML-driven insights"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        clock: Optional[Clock] = None,
+        n_clusters: int = 5,
+        ltv_cache: Optional[LifetimeValueCache] = None,
+        reactivation_model: Optional[ReactivationModel] = None,
+    ):
+        self.clock = clock or SystemClock()
+        self.n_clusters = n_clusters
+        # Lifetime values persist across workflows and are updated as payments arrive
+        self.ltv_cache = ltv_cache or LifetimeValueCache()
+        # Content hashes of the payment histories already folded into the cache
+        self.folded_histories: Set[str] = set()
+        self.reactivation_model = reactivation_model
+        # Per-student profiles of running segmentations, keyed by workflow id
+        self.student_profiles: Dict[str, pd.DataFrame] = {}
         self.logger = structlog.get_logger(__name__)
 
-    async def execute_segmentation(self, context: WorkflowContext, student_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute intelligent user segmentation"""
+    async def execute_segmentation(
+        self,
+        context: WorkflowContext,
+        student_data: Dict[str, Any],
+        profiles: Optional[pd.DataFrame] = None,
+    ) -> Dict[str, Any]:
+        """Execute intelligent user segmentation
+
+        With ``profiles`` (one row per student, see data_pipeline.PROFILE_COLUMNS)
+        behavioral clusters are computed from the data instead of simulated.
+        """
 
         segmentation_steps = [
             ThinkingStep(
@@ -247,66 +613,99 @@ class UserSegmentationEngine:
                 stage=ThinkingStage.ANALYSIS,
                 description="Analyze behavioral patterns in student data",
                 inputs=["student_data", "historical_patterns"],
-                outputs=["behavioral_clusters", "pattern_insights"]
+                outputs=["behavioral_clusters", "pattern_insights"],
             ),
-
             ThinkingStep(
                 id="calculate_lifetime_value",
                 stage=ThinkingStage.ANALYSIS,
                 description="Calculate customer lifetime value for each student",
                 inputs=["student_data", "payment_history"],
                 outputs=["ltv_scores", "value_segments"],
-                dependencies=["analyze_behavioral_patterns"]
+                dependencies=["analyze_behavioral_patterns"],
             ),
-
             ThinkingStep(
                 id="predict_reactivation_probability",
                 stage=ThinkingStage.OPTIMIZATION,
                 description="Predict reactivation probability using ML models",
                 inputs=["behavioral_clusters", "ltv_scores"],
                 outputs=["reactivation_scores", "confidence_intervals"],
-                dependencies=["calculate_lifetime_value"]
+                dependencies=["calculate_lifetime_value"],
             ),
-
             ThinkingStep(
                 id="create_optimal_segments",
                 stage=ThinkingStage.SEGMENTATION,
                 description="Create optimal segments for campaign targeting",
                 inputs=["reactivation_scores", "business_constraints"],
                 outputs=["final_segments", "targeting_strategy"],
-                dependencies=["predict_reactivation_probability"]
-            )
+                dependencies=["predict_reactivation_probability"],
+            ),
         ]
 
+        if profiles is not None and len(profiles) > 0:
+            self.student_profiles[context.workflow_id] = profiles
+
         results = {}
-        for step in segmentation_steps:
-            step_result = await self._execute_segmentation_step(step, context, student_data)
-            results[step.id] = step_result
+        try:
+            for step in segmentation_steps:
+                step_result = await self._execute_segmentation_step(
+                    step, context, student_data
+                )
+                results[step.id] = step_result
+        finally:
+            self.student_profiles.pop(context.workflow_id, None)
 
         return {
             "segmentation_complete": True,
-            "segments_created": results.get("create_optimal_segments", {}).get("segments", {}),
-            "targeting_strategy": results.get("create_optimal_segments", {}).get("strategy", {}),
-            "quality_metrics": self._calculate_segmentation_quality(results)
+            "segments_created": results.get("create_optimal_segments", {}).get(
+                "segments", {}
+            ),
+            "targeting_strategy": results.get("create_optimal_segments", {}).get(
+                "strategy", {}
+            ),
+            "segment_economics": results.get("create_optimal_segments", {}).get(
+                "economics", []
+            ),
+            "planned_conversion_rate": results.get("create_optimal_segments", {}).get(
+                "planned_conversion_rate", 0.0
+            ),
+            "segment_members": results.get("create_optimal_segments", {}).get(
+                "members"
+            ),
+            "quality_metrics": self._calculate_segmentation_quality(results),
         }
 
-    async def _execute_segmentation_step(self, step: ThinkingStep, context: WorkflowContext, data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _execute_segmentation_step(
+        self, step: ThinkingStep, context: WorkflowContext, data: Dict[str, Any]
+    ) -> Dict[str, Any]:
         """Execute individual segmentation step"""
 
         if step.id == "analyze_behavioral_patterns":
-            return await self._analyze_behavioral_patterns(data)
+            return await self._analyze_behavioral_patterns(data, context)
         elif step.id == "calculate_lifetime_value":
-            return await self._calculate_lifetime_value(data)
+            return await self._calculate_lifetime_value(data, context)
         elif step.id == "predict_reactivation_probability":
-            return await self._predict_reactivation_probability(data)
+            return await self._predict_reactivation_probability(data, context)
         elif step.id == "create_optimal_segments":
             return await self._create_optimal_segments(data, context)
 
         return {"step_completed": True}
 
-    async def _analyze_behavioral_patterns(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _analyze_behavioral_patterns(
+        self, data: Dict[str, Any], context: WorkflowContext
+    ) -> Dict[str, Any]:
         """Analyze behavioral patterns in student data"""
-        await asyncio.sleep(2)
+        profiles = self.student_profiles.get(context.workflow_id)
+        if profiles is not None:
+            # Clustering a large student base is CPU-bound, keep it off the event loop
+            labels, clustering = await asyncio.to_thread(
+                cluster_students, profiles, self.n_clusters
+            )
+            self.student_profiles[context.workflow_id] = profiles.assign(
+                behavior_cluster=labels
+            )
+            return clustering
+
+        await self.clock.sleep(2)
 
         return {
             "clusters_identified": 5,
@@ -314,32 +713,88 @@ class UserSegmentationEngine:
                 "engagement_dropoff": "gradual_decline",
                 "payment_behavior": "monthly_cycle_sensitive",
                 "activity_preference": "evening_workouts",
-                "seasonal_patterns": "winter_decrease"
+                "seasonal_patterns": "winter_decrease",
             },
-            "cluster_sizes": [150, 200, 120, 100, 80]
+            "cluster_sizes": [150, 200, 120, 100, 80],
         }
 
-    async def _calculate_lifetime_value(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    async def record_payments(self, payments: pd.DataFrame) -> int:
+        """Fold new cleaned payments into the lifetime value cache"""
+        return await asyncio.to_thread(self.ltv_cache.add_payments, payments)
+
+    async def record_payment_history(self, context: WorkflowContext) -> int:
+        """Fold the workflow's payment history export in, once per file content"""
+        history_path = context.data_sources.get(PAYMENT_HISTORY_SOURCE)
+        if not is_export_file(history_path):
+            return 0
+        digest = await asyncio.to_thread(file_digest, history_path)
+        if digest in self.folded_histories:
+            return 0
+
+        payments = await asyncio.to_thread(read_payment_history, history_path)
+        # Cached payments are skipped, so re-sent histories only add what is new
+        recomputed = await self.record_payments(payments)
+        if digest is not None:
+            self.folded_histories.add(digest)
+        return recomputed
+
+    async def _calculate_lifetime_value(
+        self, data: Dict[str, Any], context: WorkflowContext
+    ) -> Dict[str, Any]:
         """Calculate customer lifetime value"""
-        await asyncio.sleep(1.5)
+        await self.record_payment_history(context)
+
+        if len(self.ltv_cache):
+            profiles = self.student_profiles.get(context.workflow_id)
+            if profiles is None:
+                return self.ltv_cache.report()
+
+            self.student_profiles[context.workflow_id] = profiles.assign(
+                ltv=self.ltv_cache.lifetime_values(profiles["student_id"])
+            )
+            return self.ltv_cache.report(profiles["student_id"])
+
+        await self.clock.sleep(1.5)
 
         return {
             "avg_ltv": 485.50,
             "ltv_distribution": {
                 "high_value": {"count": 95, "min_ltv": 800},
                 "medium_value": {"count": 320, "min_ltv": 400},
-                "low_value": {"count": 235, "min_ltv": 150}
+                "low_value": {"count": 235, "min_ltv": 150},
             },
             "ltv_factors": {
                 "plan_type_weight": 0.35,
                 "tenure_weight": 0.25,
-                "engagement_weight": 0.40
-            }
+                "engagement_weight": 0.40,
+            },
         }
 
-    async def _predict_reactivation_probability(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _predict_reactivation_probability(
+        self, data: Dict[str, Any], context: WorkflowContext
+    ) -> Dict[str, Any]:
         """Predict reactivation probability using ML models"""
-        await asyncio.sleep(3)
+        profiles = self.student_profiles.get(context.workflow_id)
+        if self.reactivation_model is not None and profiles is not None:
+            # Only the inactive audience is scored; active students keep no probability
+            inactive = (
+                (profiles["inactivity_segment"] != ACTIVE_SEGMENT).to_numpy()
+                if "inactivity_segment" in profiles.columns
+                else np.ones(len(profiles), dtype=bool)
+            )
+            probabilities = np.full(len(profiles), np.nan)
+            probabilities[inactive] = await asyncio.to_thread(
+                self.reactivation_model.score_profiles, profiles[inactive]
+            )
+            self.student_profiles[context.workflow_id] = profiles.assign(
+                reactivation_probability=probabilities
+            )
+
+            report = probability_report(probabilities[inactive])
+            report["key_predictors"] = self.reactivation_model.key_predictors()
+            return report
+
+        await self.clock.sleep(3)
 
         return {
             "model_accuracy": 0.78,
@@ -347,77 +802,237 @@ class UserSegmentationEngine:
             "probability_distribution": {
                 "high_probability": {"count": 125, "avg_prob": 0.75},
                 "medium_probability": {"count": 285, "avg_prob": 0.45},
-                "low_probability": {"count": 240, "avg_prob": 0.15}
+                "low_probability": {"count": 240, "avg_prob": 0.15},
             },
             "key_predictors": [
                 "days_since_last_payment",
                 "historical_engagement_score",
                 "plan_value",
-                "seasonality_factor"
-            ]
+                "seasonality_factor",
+            ],
         }
 
-    async def _create_optimal_segments(self, data: Dict[str, Any], context: WorkflowContext) -> Dict[str, Any]:
+    async def _create_optimal_segments(
+        self, data: Dict[str, Any], context: WorkflowContext
+    ) -> Dict[str, Any]:
         """Create optimal segments for campaign targeting"""
-        await asyncio.sleep(2)
+        profiles = self.student_profiles.get(context.workflow_id)
+        members = None
+        if profiles is not None and {"reactivation_probability", "ltv"} <= set(
+            profiles.columns
+        ):
+            # Streamed exports hand over a sample, sized back up to every student
+            economics = segment_economics_from_profiles(
+                profiles, data.get("clean_and_normalize", {}).get("cleaned_records")
+            )
+            members = self._segment_members(profiles)
+        else:
+            economics = default_segment_economics()
+
+        budget = context.constraints.get("budget_limit", DEFAULT_CAMPAIGN_BUDGET)
+        allocation = allocate_budget(economics, budget)
+
+        segments = {}
+        for segment in economics:
+            planned = allocation["allocations"][segment.name]
+            segments[segment.name] = {
+                "size": segment.size,
+                "characteristics": CAMPAIGN_SEGMENTS[segment.name]["characteristics"],
+                "strategy": CAMPAIGN_SEGMENTS[segment.name]["strategy"],
+                "expected_roi": planned["expected_roi"],
+                "budget": planned["spend"],
+                "messages": planned["messages"],
+                "students_reached": planned["students_reached"],
+                "touches": planned["touches_funded"],
+            }
 
         return {
-            "segments": {
-                "priority_1_high_value": {
-                    "size": 85,
-                    "characteristics": ["high_ltv", "high_reactivation_prob"],
-                    "strategy": "premium_personalized_approach",
-                    "expected_roi": 15.2
-                },
-                "priority_2_engaged": {
-                    "size": 165,
-                    "characteristics": ["medium_ltv", "recent_activity"],
-                    "strategy": "value_proposition_focus",
-                    "expected_roi": 8.5
-                },
-                "priority_3_price_sensitive": {
-                    "size": 200,
-                    "characteristics": ["budget_conscious", "promotion_responsive"],
-                    "strategy": "discount_driven_campaign",
-                    "expected_roi": 4.2
-                },
-                "priority_4_long_term": {
-                    "size": 200,
-                    "characteristics": ["low_immediate_prob", "future_potential"],
-                    "strategy": "nurture_sequence",
-                    "expected_roi": 2.1
-                }
-            },
+            "segments": segments,
             "strategy": {
                 "approach": "sequential_cascade",
                 "timing": "staggered_launch",
                 "personalization_level": "segment_specific",
+                # Keyed by full segment name, as rebalanced during monitoring
                 "budget_allocation": {
-                    "priority_1": 0.40,
-                    "priority_2": 0.35,
-                    "priority_3": 0.20,
-                    "priority_4": 0.05
-                }
-            }
+                    name: planned["budget_share"]
+                    for name, planned in allocation["allocations"].items()
+                },
+                "unallocated_budget": allocation["unallocated"],
+                "expected_revenue": allocation["expected_revenue"],
+                "expected_roi": allocation["expected_roi"],
+            },
+            "economics": economics,
+            "members": members,
+            "planned_conversion_rate": (
+                allocation["expected_conversions"]
+                / sum(
+                    planned["messages"]
+                    for planned in allocation["allocations"].values()
+                )
+                if allocation["total_spend"]
+                else 0.0
+            ),
         }
 
-    def _calculate_segmentation_quality(self, results: Dict[str, Any]) -> Dict[str, float]:
+    def _segment_members(self, profiles: pd.DataFrame) -> pd.DataFrame:
+        """Scored students with their campaign segment, likeliest first per segment"""
+        codes, probabilities, _ = assign_campaign_segments(profiles)
+        scored = codes >= 0
+        members = pd.DataFrame(
+            {
+                "student_id": profiles["student_id"].to_numpy()[scored],
+                "segment": pd.Categorical.from_codes(
+                    codes[scored], categories=list(CAMPAIGN_SEGMENTS)
+                ),
+                "reactivation_probability": probabilities[scored],
+            }
+        )
+        return members.sort_values(
+            ["segment", "reactivation_probability"],
+            ascending=[True, False],
+            kind="stable",
+            ignore_index=True,
+        )
+
+    def _calculate_segmentation_quality(
+        self, results: Dict[str, Any]
+    ) -> Dict[str, float]:
         """Calculate quality metrics for segmentation"""
+        clustering = results.get("analyze_behavioral_patterns", {})
+        if "quality" in clustering:
+            return {
+                "silhouette_score": clustering["quality"]["silhouette_score"],
+                "intra_cluster_similarity": clustering["quality"][
+                    "intra_cluster_similarity"
+                ],
+                "inter_cluster_separation": clustering["quality"][
+                    "inter_cluster_separation"
+                ],
+                "business_relevance_score": clustering["actionable_share"],
+            }
+
         return {
             "silhouette_score": 0.74,
             "intra_cluster_similarity": 0.82,
             "inter_cluster_separation": 0.68,
-            "business_relevance_score": 0.89
+            "business_relevance_score": 0.89,
         }
 
+
 class MessageSchedulingOptimizer:
     """Intelligent message scheduling with real-time optimization"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        clock: Optional[Clock] = None,
+        send_limits: Tuple[RateLimit, ...] = WHATSAPP_BUSINESS_LIMITS,
+        active_hours: Optional[Tuple[int, int]] = DEFAULT_ACTIVE_HOURS,
+        response_histograms: Optional[ResponseHistograms] = None,
+    ):
+        self.clock = clock or SystemClock()
+        self.send_planner = SendPlanner(send_limits, active_hours)
+        # Reply timing persists across workflows and is updated as replies arrive
+        self.response_histograms = response_histograms or ResponseHistograms()
+        # Content hashes of the reply histories already folded into the histograms
+        self.folded_histories: Set[str] = set()
+        # Per-workflow segment members and send plan, shared by the scheduling steps
+        self.segment_members: Dict[str, pd.DataFrame] = {}
+        self.send_plans: Dict[str, Dict[str, Any]] = {}
         self.logger = structlog.get_logger(__name__)
 
-    async def optimize_scheduling(self, context: WorkflowContext, segments: Dict[str, Any]) -> Dict[str, Any]:
-        """Optimize message scheduling based on segment characteristics"""
+    async def record_replies(self, replies: pd.DataFrame) -> int:
+        """Fold new cleaned replies into the response histograms"""
+        return await asyncio.to_thread(self.response_histograms.add_replies, replies)
+
+    async def record_reply_history(self, context: WorkflowContext) -> int:
+        """Fold the workflow's reply history export in, once per file content
+
+        Replies carry no id, so a history seen before would be counted twice.
+        """
+        history_path = context.data_sources.get(REPLY_HISTORY_SOURCE)
+        if not is_export_file(history_path):
+            return 0
+        digest = await asyncio.to_thread(file_digest, history_path)
+        if digest in self.folded_histories:
+            return 0
+
+        replies = await asyncio.to_thread(read_reply_history, history_path)
+        recorded = await self.record_replies(replies)
+        if digest is not None:
+            self.folded_histories.add(digest)
+        return recorded
+
+    def best_send_slots(
+        self, contact_ids: pd.Series, segment: Optional[str] = None
+    ) -> np.ndarray:
+        """Best hour-of-week slot of each contact in active hours, -1 without history"""
+        return self.response_histograms.best_slots(
+            contact_ids, segment, active_slot_mask(self.send_planner.active_hours)
+        )
+
+    def build_send_requests(
+        self, segments: Dict[str, Any], members: Optional[pd.DataFrame] = None
+    ) -> List[SendRequest]:
+        """One send request per segment, prioritized by "priority_<n>" segment names
+
+        With segment ``members`` (student_id and segment, likeliest first), each
+        segment's recipients are its first members and every recipient is sent
+        to in their best hour-of-week slot. Recipients beyond the known members,
+        as when the members are a sample, have no slot preference.
+        """
+        requests = []
+        for order, (name, segment) in enumerate(segments.items()):
+            parts = name.split("_")
+            priority = (
+                int(parts[1])
+                if len(parts) > 1 and parts[0] == "priority" and parts[1].isdigit()
+                else order + 1
+            )
+            recipients = int(segment.get("students_reached", segment.get("size", 0)))
+            send_slots = None
+            if members is not None and recipients > 0:
+                contact_ids = members["student_id"][members["segment"] == name]
+                send_slots = np.full(recipients, -1, dtype=np.int64)
+                known = contact_ids.iloc[:recipients]
+                send_slots[: len(known)] = self.best_send_slots(known, name)
+            requests.append(
+                SendRequest(
+                    segment=name,
+                    recipients=recipients,
+                    priority=priority,
+                    touches=max(int(segment.get("touches", 1)), 1),
+                    send_slots=send_slots,
+                )
+            )
+        return requests
+
+    async def stream_send_plan(
+        self,
+        segments: Dict[str, Any],
+        start: Optional[datetime] = None,
+        members: Optional[pd.DataFrame] = None,
+    ) -> AsyncIterator[PlannedSend]:
+        """Stream the planned send of every message, in send order"""
+        sends = self.send_planner.plan(
+            self.build_send_requests(segments, members), start or self.clock.now()
+        )
+        for send in sends:
+            yield send
+            # Let other tasks run while long plans are consumed
+            if send.sequence % 1000 == 999:
+                await asyncio.sleep(0)
+
+    async def optimize_scheduling(
+        self,
+        context: WorkflowContext,
+        segments: Dict[str, Any],
+        members: Optional[pd.DataFrame] = None,
+    ) -> Dict[str, Any]:
+        """Optimize message scheduling based on segment characteristics
+
+        ``members`` are the segmented students, as returned by segmentation;
+        with them every recipient is scheduled in their best send slot.
+        """
 
         optimization_steps = [
             ThinkingStep(
@@ -425,56 +1040,68 @@ class MessageSchedulingOptimizer:
                 stage=ThinkingStage.ANALYSIS,
                 description="Analyze optimal timing patterns for each segment",
                 inputs=["segment_data", "historical_response_patterns"],
-                outputs=["timing_insights", "peak_response_windows"]
+                outputs=["timing_insights", "peak_response_windows"],
             ),
-
             ThinkingStep(
                 id="calculate_send_rates",
                 stage=ThinkingStage.OPTIMIZATION,
                 description="Calculate optimal send rates to avoid spam detection",
                 inputs=["platform_limits", "segment_sizes"],
                 outputs=["send_rate_limits", "distribution_schedule"],
-                dependencies=["analyze_optimal_timing"]
+                dependencies=["analyze_optimal_timing"],
             ),
-
             ThinkingStep(
                 id="create_scheduling_strategy",
                 stage=ThinkingStage.PLANNING,
                 description="Create comprehensive scheduling strategy",
                 inputs=["timing_insights", "send_rate_limits"],
                 outputs=["master_schedule", "fallback_options"],
-                dependencies=["calculate_send_rates"]
+                dependencies=["calculate_send_rates"],
             ),
-
             ThinkingStep(
                 id="implement_adaptive_scheduling",
                 stage=ThinkingStage.EXECUTION,
                 description="Implement adaptive scheduling with real-time adjustments",
                 inputs=["master_schedule", "real_time_metrics"],
                 outputs=["active_schedule", "monitoring_alerts"],
-                dependencies=["create_scheduling_strategy"]
-            )
+                dependencies=["create_scheduling_strategy"],
+            ),
         ]
 
+        if members is not None and len(members) > 0:
+            self.segment_members[context.workflow_id] = members
+
         results = {}
-        for step in optimization_steps:
-            step_result = await self._execute_scheduling_step(step, context, segments)
-            results[step.id] = step_result
+        try:
+            for step in optimization_steps:
+                step_result = await self._execute_scheduling_step(
+                    step, context, segments
+                )
+                results[step.id] = step_result
+        finally:
+            self.segment_members.pop(context.workflow_id, None)
+            self.send_plans.pop(context.workflow_id, None)
 
         return {
             "optimization_complete": True,
-            "master_schedule": results.get("create_scheduling_strategy", {}).get("schedule", {}),
-            "adaptive_features": results.get("implement_adaptive_scheduling", {}).get("features", {}),
-            "expected_performance": self._calculate_expected_performance(results)
+            "master_schedule": results.get("create_scheduling_strategy", {}).get(
+                "schedule", {}
+            ),
+            "adaptive_features": results.get("implement_adaptive_scheduling", {}).get(
+                "features", {}
+            ),
+            "expected_performance": self._calculate_expected_performance(results),
         }
 
-    async def _execute_scheduling_step(self, step: ThinkingStep, context: WorkflowContext, segments: Dict[str, Any]) -> Dict[str, Any]:
+    async def _execute_scheduling_step(
+        self, step: ThinkingStep, context: WorkflowContext, segments: Dict[str, Any]
+    ) -> Dict[str, Any]:
         """Execute individual scheduling optimization step"""
 
         if step.id == "analyze_optimal_timing":
-            return await self._analyze_optimal_timing(segments)
+            return await self._analyze_optimal_timing(segments, context)
         elif step.id == "calculate_send_rates":
-            return await self._calculate_send_rates(segments)
+            return await self._calculate_send_rates(segments, context)
         elif step.id == "create_scheduling_strategy":
             return await self._create_scheduling_strategy(segments, context)
         elif step.id == "implement_adaptive_scheduling":
@@ -482,139 +1109,246 @@ class MessageSchedulingOptimizer:
 
         return {"step_completed": True}
 
-    async def _analyze_optimal_timing(self, segments: Dict[str, Any]) -> Dict[str, Any]:
+    async def _analyze_optimal_timing(
+        self, segments: Dict[str, Any], context: WorkflowContext
+    ) -> Dict[str, Any]:
         """Analyze optimal timing patterns"""
-        await asyncio.sleep(2)
+        await self.record_reply_history(context)
+
+        histograms = self.response_histograms
+        if histograms.replies_recorded:
+            allowed = active_slot_mask(self.send_planner.active_hours)
+            return {
+                "optimal_windows": {
+                    name: histograms.timing_report(name, allowed) for name in segments
+                },
+                "day_preferences": histograms.day_preferences(),
+                "contacts_with_history": len(histograms),
+                "replies_analyzed": histograms.replies_recorded,
+            }
+
+        await self.clock.sleep(2)
 
         return {
             "optimal_windows": {
                 "priority_1_high_value": {
                     "primary": "10:00-11:00",
                     "secondary": "15:00-16:00",
-                    "avoid": ["12:00-13:00", "18:00-19:00"]
+                    "avoid": ["12:00-13:00", "18:00-19:00"],
                 },
                 "priority_2_engaged": {
                     "primary": "09:00-10:00",
                     "secondary": "14:00-15:00",
-                    "avoid": ["lunch_hour", "late_evening"]
+                    "avoid": ["lunch_hour", "late_evening"],
                 },
                 "priority_3_price_sensitive": {
                     "primary": "11:00-12:00",
                     "secondary": "16:00-17:00",
-                    "avoid": ["early_morning", "dinner_time"]
-                }
+                    "avoid": ["early_morning", "dinner_time"],
+                },
             },
             "day_preferences": {
                 "best_days": ["tuesday", "wednesday", "thursday"],
                 "avoid_days": ["monday", "friday", "weekend"],
-                "seasonal_adjustments": "winter_later_starts"
-            }
+                "seasonal_adjustments": "winter_later_starts",
+            },
         }
 
-    async def _calculate_send_rates(self, segments: Dict[str, Any]) -> Dict[str, Any]:
+    async def _calculate_send_rates(
+        self, segments: Dict[str, Any], context: WorkflowContext
+    ) -> Dict[str, Any]:
         """Calculate optimal send rates"""
-        await asyncio.sleep(1.5)
+        requests = await asyncio.to_thread(
+            self.build_send_requests,
+            segments,
+            self.segment_members.get(context.workflow_id),
+        )
+        # Planning is CPU-bound for large campaigns, keep it off the event loop
+        plan = await asyncio.to_thread(
+            lambda: summarize_send_plan(
+                self.send_planner.plan(requests, self.clock.now())
+            )
+        )
+        self.send_plans[context.workflow_id] = plan
+        limits = {
+            limit.period_seconds: limit.capacity for limit in self.send_planner.limits
+        }
 
         return {
             "platform_limits": {
-                "whatsapp_business": {"max_per_hour": 250, "max_per_day": 1000},
-                "recommended_rate": {"messages_per_minute": 3, "batch_size": 10}
+                "whatsapp_business": {
+                    "max_per_hour": limits.get(3600),
+                    "max_per_day": limits.get(86400),
+                },
+                "recommended_rate": {"messages_per_minute": limits.get(60)},
+                "active_hours": self.send_planner.active_hours,
             },
             "segment_schedules": {
-                "priority_1": {"messages_per_hour": 85, "total_duration": "1 hour"},
-                "priority_2": {"messages_per_hour": 55, "total_duration": "3 hours"},
-                "priority_3": {"messages_per_hour": 40, "total_duration": "5 hours"}
+                "_".join(name.split("_")[:2]): schedule
+                for name, schedule in plan["segments"].items()
+            },
+            "send_plan": {
+                key: value
+                for key, value in plan.items()
+                if key not in ("segments", "weekly_slots")
+            },
+            "slotted_recipients": {
+                "_".join(request.segment.split("_")[:2]): (
+                    int((request.send_slots >= 0).sum())
+                    if request.send_slots is not None
+                    else 0
+                )
+                for request in requests
             },
             "safety_margins": {
                 "buffer_time": "15_minutes_between_batches",
                 "emergency_stop": "enabled",
-                "rate_limiting": "adaptive_based_on_response"
-            }
+                "rate_limiting": "adaptive_based_on_response",
+            },
         }
 
-    async def _create_scheduling_strategy(self, segments: Dict[str, Any], context: WorkflowContext) -> Dict[str, Any]:
-        """Create comprehensive scheduling strategy"""
-        await asyncio.sleep(2.5)
+    async def _create_scheduling_strategy(
+        self, segments: Dict[str, Any], context: WorkflowContext
+    ) -> Dict[str, Any]:
+        """Create comprehensive scheduling strategy
+
+        The schedule is the send plan grouped by campaign week and hour-of-week
+        slot, with the segment, message type and message count sent in each.
+        """
+        plan = self.send_plans.get(context.workflow_id)
+        if plan is None:
+            await self._calculate_send_rates(segments, context)
+            plan = self.send_plans[context.workflow_id]
+
+        schedule: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        for week, slots in plan["weekly_slots"].items():
+            schedule[week] = {
+                slot: [
+                    {
+                        "segment": "_".join(sent["segment"].split("_")[:2]),
+                        "count": sent["messages"],
+                        "message_type": self._message_type(
+                            sent["segment"], sent["touch"]
+                        ),
+                    }
+                    for sent in sends
+                ]
+                for slot, sends in slots.items()
+            }
 
         return {
-            "schedule": {
-                "week_1": {
-                    "tuesday_10am": {"segment": "priority_1", "count": 85, "message_type": "premium_welcome"},
-                    "wednesday_9am": {"segment": "priority_2", "count": 165, "message_type": "value_proposition"},
-                    "thursday_11am": {"segment": "priority_3", "count": 200, "message_type": "discount_offer"}
-                },
-                "week_2": {
-                    "tuesday_3pm": {"segment": "priority_1", "count": 85, "message_type": "urgency_follow_up"},
-                    "wednesday_2pm": {"segment": "priority_2", "count": 165, "message_type": "benefits_reminder"},
-                    "thursday_4pm": {"segment": "priority_3", "count": 200, "message_type": "limited_time_offer"}
-                }
-            },
+            "schedule": schedule,
             "fallback_options": {
                 "high_response_rate": "accelerate_schedule",
                 "low_response_rate": "adjust_timing_and_content",
-                "platform_issues": "switch_to_backup_method"
-            }
+                "platform_issues": "switch_to_backup_method",
+            },
         }
 
-    async def _implement_adaptive_scheduling(self, segments: Dict[str, Any], context: WorkflowContext) -> Dict[str, Any]:
+    @staticmethod
+    def _message_type(segment: str, touch: int) -> str:
+        """Message sent at a touch, generic outside the campaign segments"""
+        types = CAMPAIGN_SEGMENTS.get(segment, {}).get("message_types")
+        if not types:
+            return "first_contact" if touch == 0 else f"follow_up_{touch}"
+        return str(types[min(touch, len(types) - 1)])
+
+    async def _implement_adaptive_scheduling(
+        self, segments: Dict[str, Any], context: WorkflowContext
+    ) -> Dict[str, Any]:
         """Implement adaptive scheduling with real-time adjustments"""
-        await asyncio.sleep(2)
+        await self.clock.sleep(2)
 
         return {
             "features": {
                 "real_time_monitoring": "enabled",
                 "automatic_adjustments": "response_rate_based",
                 "learning_algorithm": "reinforcement_learning",
-                "a_b_testing": "message_timing_variants"
+                "a_b_testing": "message_timing_variants",
             },
             "monitoring_alerts": {
                 "response_rate_threshold": 0.05,
                 "delivery_failure_threshold": 0.02,
-                "spam_detection_alerts": "enabled"
+                "spam_detection_alerts": "enabled",
             },
             "adaptive_rules": [
                 "if_response_rate_low_adjust_timing",
                 "if_delivery_issues_reduce_rate",
-                "if_high_engagement_increase_frequency"
-            ]
+                "if_high_engagement_increase_frequency",
+            ],
         }
 
-    def _calculate_expected_performance(self, results: Dict[str, Any]) -> Dict[str, float]:
+    def _calculate_expected_performance(
+        self, results: Dict[str, Any]
+    ) -> Dict[str, float]:
         """Calculate expected performance metrics"""
         return {
             "expected_response_rate": 0.22,
             "expected_conversion_rate": 0.144,
             "expected_roi": 2250.0,
             "delivery_success_rate": 0.98,
-            "schedule_adherence": 0.95
+            "schedule_adherence": 0.95,
         }
 
+
 class WorkflowOrchestrator:
     """Main orchestrator for all automation workflows"""
 
-    def __init__(self):
-        self.thinking_engine = ThinkingEngine()
-        self.sheets_processor = GoogleSheetsProcessor()
-        self.segmentation_engine = UserSegmentationEngine()
-        self.scheduling_optimizer = MessageSchedulingOptimizer()
+    def __init__(
+        self,
+        clock: Optional[Clock] = None,
+        reactivation_model: Optional[ReactivationModel] = None,
+        max_concurrent_workflows: int = DEFAULT_MAX_CONCURRENT_WORKFLOWS,
+        max_finished_jobs: int = 1000,
+        artifact_cache: Optional[StageArtifactCache] = None,
+        thinking_engine: Optional[ThinkingEngine] = None,
+    ):
+        if max_concurrent_workflows < 1:
+            raise ValueError("max_concurrent_workflows must be at least 1")
+
+        self.clock = clock or SystemClock()
+        # Shared with the server so a campaign's pattern runs on one engine only
+        self.thinking_engine = thinking_engine or ThinkingEngine(clock=self.clock)
+        self.sheets_processor = GoogleSheetsProcessor(clock=self.clock)
+        self.segmentation_engine = UserSegmentationEngine(
+            clock=self.clock, reactivation_model=reactivation_model
+        )
+        self.scheduling_optimizer = MessageSchedulingOptimizer(clock=self.clock)
         self.active_workflows: Dict[str, WorkflowContext] = {}
+        self.jobs: Dict[str, WorkflowJob] = {}
+        self.max_finished_jobs = max_finished_jobs
+        # Failed, cancelled and stopped jobs kept for status queries, oldest first
+        self._finished_jobs: "OrderedDict[str, None]" = OrderedDict()
+        self._workflow_slots = asyncio.Semaphore(max_concurrent_workflows)
+        # Stage outputs persisted across runs; stages with unchanged inputs are loaded
+        self.artifact_cache = artifact_cache
         self.logger = structlog.get_logger(__name__)
 
-    async def start_campaign_workflow(self, campaign_config: Dict[str, Any]) -> str:
-        """Start a complete campaign workflow"""
-
-        # Create thinking context
-        thinking_context = ThinkingContext(
-            campaign_id=campaign_config["campaign_id"],
-            target_audience_size=campaign_config["target_audience_size"],
-            roi_target=campaign_config["roi_target"],
-            budget_limit=campaign_config["budget_limit"],
-            time_constraints=campaign_config["time_constraints"]
-        )
-
-        # Start sequential thinking pattern
-        campaign_thinking = WhatsAppCampaignThinking(context=thinking_context)
-        pattern_id = await self.thinking_engine.start_thinking(campaign_thinking)
+    async def start_campaign_workflow(
+        self, campaign_config: Dict[str, Any], pattern_id: Optional[str] = None
+    ) -> WorkflowJob:
+        """Start a complete campaign workflow in the background; return its job
+
+        pattern_id names a thinking pattern already started for the campaign; a
+        new pattern is only started on the orchestrator's engine without one.
+        """
+
+        if pattern_id is None:
+            thinking_context = ThinkingContext(
+                campaign_id=campaign_config["campaign_id"],
+                target_audience_size=campaign_config["target_audience_size"],
+                roi_target=campaign_config["roi_target"],
+                budget_limit=campaign_config["budget_limit"],
+                time_constraints=campaign_config["time_constraints"],
+            )
+            campaign_thinking = WhatsAppCampaignThinking.create(
+                thinking_context,
+                self.clock.now(),
+                state_store=self.thinking_engine.state_store(
+                    WhatsAppCampaignThinking.compiled_plan()
+                ),
+            )
+            pattern_id = await self.thinking_engine.start_thinking(campaign_thinking)
 
         # Create workflow context
         workflow_context = WorkflowContext(
@@ -623,55 +1357,293 @@ class WorkflowOrchestrator:
             campaign_id=campaign_config["campaign_id"],
             data_sources=campaign_config["data_sources"],
             target_metrics=campaign_config["target_metrics"],
-            constraints=campaign_config["constraints"]
+            constraints={
+                "budget_limit": campaign_config["budget_limit"],
+                **campaign_config["constraints"],
+            },
+            created_at=self.clock.now(),
         )
 
         self.active_workflows[workflow_context.workflow_id] = workflow_context
 
-        # Execute workflow steps
-        await self._execute_complete_workflow(workflow_context, pattern_id)
+        job = WorkflowJob(
+            workflow_id=workflow_context.workflow_id,
+            pattern_id=pattern_id,
+            campaign_id=workflow_context.campaign_id,
+            submitted_at=self.clock.now(),
+        )
+        self.jobs[job.workflow_id] = job
+        job.task = asyncio.create_task(self._run_workflow_job(job, workflow_context))
 
-        return workflow_context.workflow_id
+        self.logger.info(
+            "Queued campaign workflow",
+            workflow_id=job.workflow_id,
+            campaign_id=job.campaign_id,
+        )
+        return job
 
-    async def _execute_complete_workflow(self, context: WorkflowContext, pattern_id: str):
+    async def _run_workflow_job(
+        self, job: WorkflowJob, context: WorkflowContext
+    ) -> None:
+        """Run a workflow's stages once one of the concurrency slots is free"""
+        try:
+            async with self._workflow_slots:
+                job.status = JobStatus.RUNNING
+                job.started_at = self.clock.now()
+                await self._execute_complete_workflow(context, job.pattern_id, job)
+        except asyncio.CancelledError:
+            job.status = JobStatus.CANCELLED
+            self.logger.info(
+                "Cancelled workflow", workflow_id=job.workflow_id, stage=job.stage
+            )
+            raise
+        finally:
+            job.finished_at = self.clock.now()
+            if job.status in (JobStatus.FAILED, JobStatus.CANCELLED):
+                self._release_workflow(job.workflow_id)
+                self._retire_job(job)
+
+    def _release_workflow(self, workflow_id: str) -> bool:
+        """Forget a workflow's context and cancel its monitoring task, if it has one"""
+        context = self.active_workflows.pop(workflow_id, None)
+        if context is None:
+            return False
+
+        monitoring_task = context.constraints.get("monitoring_task")
+        if monitoring_task is not None:
+            monitoring_task.cancel()
+        return True
+
+    def _retire_job(self, job: WorkflowJob) -> None:
+        """Keep a finished job for status queries, dropping the oldest past the limit"""
+        self._finished_jobs[job.workflow_id] = None
+        while len(self._finished_jobs) > self.max_finished_jobs:
+            workflow_id, _ = self._finished_jobs.popitem(last=False)
+            self.jobs.pop(workflow_id, None)
+
+    async def _run_stage(
+        self,
+        job: Optional[WorkflowJob],
+        stage: str,
+        work: Callable[[], Awaitable[Any]],
+        key: Optional[str] = None,
+    ) -> Any:
+        """Run one workflow stage, recording it in the job's progress
+
+        With an artifact key the stored output is used when present, and a
+        computed output is stored for the next run.
+        """
+        if job is not None:
+            job.stage = stage
+        started = self.clock.now()
+
+        cache = self.artifact_cache
+        hit, result = False, None
+        if key is not None and cache is not None:
+            hit, result = await asyncio.to_thread(cache.get, key)
+        if hit:
+            self.logger.info("Loaded stage artifact", stage=stage, key=key)
+            if job is not None:
+                job.cached_stages.append(stage)
+        else:
+            result = await work()
+            if key is not None and cache is not None:
+                await asyncio.to_thread(cache.put, key, result)
+
+        if job is not None:
+            job.stage_durations[stage] = (self.clock.now() - started).total_seconds()
+        return result
+
+    async def _stage_key(
+        self,
+        context: WorkflowContext,
+        stage: str,
+        inputs: Dict[str, Any],
+        sources: Optional[Tuple[str, ...]] = None,
+    ) -> Optional[str]:
+        """Artifact key of a stage run, None without an artifact cache
+
+        ``sources`` names the data sources the stage reads, by default the
+        student exports.
+        """
+        if self.artifact_cache is None:
+            return None
+        return make_key(
+            stage,
+            STAGE_VERSIONS[stage],
+            {**inputs, "sources": await self._source_digests(context, sources)},
+        )
+
+    async def _source_digests(
+        self, context: WorkflowContext, names: Optional[Tuple[str, ...]] = None
+    ) -> Dict[str, str]:
+        """Content hashes of data sources; non-file sources count by their location"""
+        sources = {
+            name: source
+            for name, source in context.data_sources.items()
+            if (name in names if names is not None else name not in HISTORY_SOURCES)
+        }
+        digests = await asyncio.to_thread(
+            lambda: {
+                name: file_digest(source) if is_export_file(source) else None
+                for name, source in sources.items()
+            }
+        )
+        return {name: digests[name] or str(source) for name, source in sources.items()}
+
+    def _reactivation_model_digest(self) -> Optional[str]:
+        model = self.segmentation_engine.reactivation_model
+        if model is None:
+            return None
+        weights = np.concatenate(
+            [model.mean, model.scale, model.coefficients, [model.intercept]]
+        )
+        return hashlib.sha256(
+            weights.tobytes() + ",".join(model.features).encode("utf-8")
+        ).hexdigest()
+
+    async def _execute_complete_workflow(
+        self,
+        context: WorkflowContext,
+        pattern_id: str,
+        job: Optional[WorkflowJob] = None,
+    ) -> None:
         """Execute the complete automation workflow"""
 
+        # Taken before the workflow adds its own runtime constraints
+        campaign_constraints = {
+            name: value
+            for name, value in context.constraints.items()
+            if name not in RUNTIME_CONSTRAINTS
+        }
+
         try:
             # Step 1: Process Google Sheets data
-            self.logger.info("Starting Google Sheets processing", workflow_id=context.workflow_id)
-            sheets_result = await self.sheets_processor.process_sheets_data(context)
+            self.logger.info(
+                "Starting Google Sheets processing", workflow_id=context.workflow_id
+            )
+            # Inactivity is measured in days, so artifacts are reused within a day
+            sheets_key = await self._stage_key(
+                context,
+                "sheets_processing",
+                {
+                    "reference_day": self.clock.now().date(),
+                    "chunk_size": self.sheets_processor.chunk_size,
+                    "profile_sample_size": self.sheets_processor.profile_sample_size,
+                    "inactivity_segments": self.sheets_processor.inactivity_segments,
+                },
+            )
+            sheets_result, profiles = await self._run_stage(
+                job,
+                "sheets_processing",
+                lambda: self.sheets_processor.process_sheets_data_with_profiles(
+                    context
+                ),
+                sheets_key,
+            )
 
             # Step 2: Execute user segmentation
-            self.logger.info("Starting user segmentation", workflow_id=context.workflow_id)
-            segmentation_result = await self.segmentation_engine.execute_segmentation(
-                context, sheets_result["processed_data"]
+            self.logger.info(
+                "Starting user segmentation", workflow_id=context.workflow_id
+            )
+            # Histories are folded before keying, so a stored artifact still updates
+            # the cache, and the key follows everything the cache has taken in
+            await self.segmentation_engine.record_payment_history(context)
+            segmentation_key = await self._stage_key(
+                context,
+                "segmentation",
+                {
+                    "upstream": sheets_key,
+                    "budget_limit": campaign_constraints.get(
+                        "budget_limit", DEFAULT_CAMPAIGN_BUDGET
+                    ),
+                    "n_clusters": self.segmentation_engine.n_clusters,
+                    "reactivation_model": self._reactivation_model_digest(),
+                    "ltv_cache": self.segmentation_engine.ltv_cache.state_digest,
+                },
+                sources=(),
             )
+            segmentation_result = await self._run_stage(
+                job,
+                "segmentation",
+                lambda: self.segmentation_engine.execute_segmentation(
+                    context, sheets_result["processed_data"], profiles
+                ),
+                segmentation_key,
+            )
+            # Kept for re-solving the budget split as live conversion rates come in
+            context.constraints["segment_economics"] = segmentation_result[
+                "segment_economics"
+            ]
+            context.constraints["planned_conversion_rate"] = segmentation_result[
+                "planned_conversion_rate"
+            ]
 
             # Step 3: Optimize message scheduling
-            self.logger.info("Starting scheduling optimization", workflow_id=context.workflow_id)
-            scheduling_result = await self.scheduling_optimizer.optimize_scheduling(
-                context, segmentation_result["segments_created"]
+            self.logger.info(
+                "Starting scheduling optimization", workflow_id=context.workflow_id
+            )
+            # Send plans start now, so a stored schedule is only reused within a minute
+            await self.scheduling_optimizer.record_reply_history(context)
+            scheduling_key = await self._stage_key(
+                context,
+                "scheduling",
+                {
+                    "upstream": segmentation_key,
+                    "constraints": campaign_constraints,
+                    "send_limits": self.scheduling_optimizer.send_planner.limits,
+                    "active_hours": self.scheduling_optimizer.send_planner.active_hours,
+                    "start": self.clock.now().replace(second=0, microsecond=0),
+                    "response_histograms": (
+                        self.scheduling_optimizer.response_histograms.state_digest
+                    ),
+                },
+                sources=(),
+            )
+            scheduling_result = await self._run_stage(
+                job,
+                "scheduling",
+                lambda: self.scheduling_optimizer.optimize_scheduling(
+                    context,
+                    segmentation_result["segments_created"],
+                    segmentation_result.get("segment_members"),
+                ),
+                scheduling_key,
             )
 
             # Step 4: Monitor and adapt
-            self.logger.info("Starting monitoring and adaptation", workflow_id=context.workflow_id)
-            await self._start_monitoring_loop(context, scheduling_result)
+            self.logger.info(
+                "Starting monitoring and adaptation", workflow_id=context.workflow_id
+            )
+            await self._run_stage(
+                job,
+                "monitoring",
+                lambda: self._start_monitoring_loop(context, scheduling_result),
+            )
+            if job is not None:
+                job.status = JobStatus.MONITORING
+                job.stage = None
 
             self.logger.info(
                 "Workflow execution completed successfully",
                 workflow_id=context.workflow_id,
-                pattern_id=pattern_id
+                pattern_id=pattern_id,
             )
 
         except Exception as e:
             self.logger.error(
                 "Workflow execution failed",
                 workflow_id=context.workflow_id,
-                error=str(e)
+                error=str(e),
             )
+            if job is not None:
+                job.status = JobStatus.FAILED
+                job.error = str(e)
             await self._handle_workflow_error(context, e)
 
-    async def _start_monitoring_loop(self, context: WorkflowContext, scheduling_result: Dict[str, Any]):
+    async def _start_monitoring_loop(
+        self, context: WorkflowContext, scheduling_result: Dict[str, Any]
+    ) -> None:
         """Start continuous monitoring and optimization loop"""
 
         monitoring_task = asyncio.create_task(
@@ -681,7 +1653,9 @@ class WorkflowOrchestrator:
         # Store task reference for cleanup
         context.constraints["monitoring_task"] = monitoring_task
 
-    async def _continuous_monitoring(self, context: WorkflowContext, scheduling_result: Dict[str, Any]):
+    async def _continuous_monitoring(
+        self, context: WorkflowContext, scheduling_result: Dict[str, Any]
+    ) -> None:
         """Continuous monitoring with adaptive optimization"""
 
         while True:
@@ -690,28 +1664,32 @@ class WorkflowOrchestrator:
                 current_metrics = await self._get_current_metrics(context)
 
                 # Analyze performance against targets
-                performance_analysis = await self._analyze_performance(current_metrics, context.target_metrics)
+                performance_analysis = await self._analyze_performance(
+                    current_metrics, context.target_metrics
+                )
 
                 # Make adaptive adjustments if needed
                 if performance_analysis["needs_adjustment"]:
                     await self._make_adaptive_adjustments(context, performance_analysis)
 
+                self._rebalance_budget(context, current_metrics)
+
                 # Wait before next check
-                await asyncio.sleep(300)  # Check every 5 minutes
+                await self.clock.sleep(300)  # Check every 5 minutes
 
             except Exception as e:
                 self.logger.error(
                     "Error in monitoring loop",
                     workflow_id=context.workflow_id,
-                    error=str(e)
+                    error=str(e),
                 )
-                await asyncio.sleep(60)  # Wait 1 minute before retry
+                await self.clock.sleep(60)  # Wait 1 minute before retry
 
     async def _get_current_metrics(self, context: WorkflowContext) -> Dict[str, float]:
         """Get current campaign performance metrics"""
         # This would integrate with the actual WhatsApp system
         # For now, simulate metrics
-        await asyncio.sleep(0.5)
+        await self.clock.sleep(0.5)
 
         return {
             "messages_sent": 450,
@@ -720,23 +1698,27 @@ class WorkflowOrchestrator:
             "conversions": 18,
             "current_roi": 1250.0,
             "response_rate": 0.203,
-            "conversion_rate": 0.125
+            "conversion_rate": 0.125,
         }
 
-    async def _analyze_performance(self, current_metrics: Dict[str, float], targets: Dict[str, float]) -> Dict[str, Any]:
+    async def _analyze_performance(
+        self, current_metrics: Dict[str, float], targets: Dict[str, float]
+    ) -> Dict[str, Any]:
         """Analyze current performance against targets"""
 
-        analysis = {
+        analysis: Dict[str, Any] = {
             "needs_adjustment": False,
             "adjustments": [],
-            "performance_score": 0.0
+            "performance_score": 0.0,
         }
 
         # Calculate performance score
         score_components = []
 
         if "response_rate" in targets and "response_rate" in current_metrics:
-            response_performance = current_metrics["response_rate"] / targets["response_rate"]
+            response_performance = (
+                current_metrics["response_rate"] / targets["response_rate"]
+            )
             score_components.append(min(response_performance, 1.0))
 
             if response_performance < 0.7:
@@ -744,50 +1726,98 @@ class WorkflowOrchestrator:
                 analysis["adjustments"].append("improve_response_rate")
 
         if "conversion_rate" in targets and "conversion_rate" in current_metrics:
-            conversion_performance = current_metrics["conversion_rate"] / targets["conversion_rate"]
+            conversion_performance = (
+                current_metrics["conversion_rate"] / targets["conversion_rate"]
+            )
             score_components.append(min(conversion_performance, 1.0))
 
             if conversion_performance < 0.7:
                 analysis["needs_adjustment"] = True
                 analysis["adjustments"].append("improve_conversion_rate")
 
-        analysis["performance_score"] = sum(score_components) / len(score_components) if score_components else 0.0
+        analysis["performance_score"] = (
+            sum(score_components) / len(score_components) if score_components else 0.0
+        )
 
         return analysis
 
-    async def _make_adaptive_adjustments(self, context: WorkflowContext, analysis: Dict[str, Any]):
+    def _rebalance_budget(
+        self, context: WorkflowContext, current_metrics: Dict[str, float]
+    ) -> Optional[Dict[str, float]]:
+        """Re-solve the segment budget split with conversion rates from live results"""
+        economics = context.constraints.get("segment_economics")
+        planned_rate = context.constraints.get("planned_conversion_rate")
+        delivered = current_metrics.get("messages_delivered", 0)
+        if not economics or not planned_rate or not delivered:
+            return None
+
+        # Scale every segment by how far observed conversions per message are from plan
+        calibration = current_metrics.get("conversions", 0) / delivered / planned_rate
+        calibrated = [
+            replace(
+                segment, conversion_rate=min(segment.conversion_rate * calibration, 1.0)
+            )
+            for segment in economics
+        ]
+        allocation = allocate_budget(
+            calibrated, context.constraints.get("budget_limit", DEFAULT_CAMPAIGN_BUDGET)
+        )
+
+        budget_allocation = {
+            name: planned["budget_share"]
+            for name, planned in allocation["allocations"].items()
+        }
+        if budget_allocation != context.constraints.get("budget_allocation"):
+            context.constraints["budget_allocation"] = budget_allocation
+            self.logger.info(
+                "Rebalanced campaign budget",
+                workflow_id=context.workflow_id,
+                calibration=round(calibration, 3),
+                budget_allocation=budget_allocation,
+            )
+        return budget_allocation
+
+    async def _make_adaptive_adjustments(
+        self, context: WorkflowContext, analysis: Dict[str, Any]
+    ) -> None:
         """Make adaptive adjustments based on performance analysis"""
 
         for adjustment in analysis["adjustments"]:
             if adjustment == "improve_response_rate":
-                await self._adjust_messaging_strategy(context, "increase_personalization")
+                await self._adjust_messaging_strategy(
+                    context, "increase_personalization"
+                )
             elif adjustment == "improve_conversion_rate":
-                await self._adjust_messaging_strategy(context, "strengthen_call_to_action")
+                await self._adjust_messaging_strategy(
+                    context, "strengthen_call_to_action"
+                )
 
         self.logger.info(
             "Made adaptive adjustments",
             workflow_id=context.workflow_id,
-            adjustments=analysis["adjustments"]
+            adjustments=analysis["adjustments"],
         )
 
-    async def _adjust_messaging_strategy(self, context: WorkflowContext, strategy: str):
+    async def _adjust_messaging_strategy(
+        self, context: WorkflowContext, strategy: str
+    ) -> None:
         """Adjust messaging strategy based on performance"""
         # This would integrate with the message scheduling system
-        await asyncio.sleep(1)
+        await self.clock.sleep(1)
 
         self.logger.info(
             "Adjusted messaging strategy",
             workflow_id=context.workflow_id,
-            strategy=strategy
+            strategy=strategy,
         )
 
-    async def _handle_workflow_error(self, context: WorkflowContext, error: Exception):
+    async def _handle_workflow_error(
+        self, context: WorkflowContext, error: Exception
+    ) -> None:
         """Handle workflow errors with recovery strategies"""
 
         self.logger.error(
-            "Handling workflow error",
-            workflow_id=context.workflow_id,
-            error=str(error)
+            "Handling workflow error", workflow_id=context.workflow_id, error=str(error)
         )
 
         # Implement error recovery strategies
@@ -796,35 +1826,51 @@ class WorkflowOrchestrator:
     async def get_workflow_status(self, workflow_id: str) -> Dict[str, Any]:
         """Get current status of a workflow"""
 
+        job = self.jobs.get(workflow_id)
         if workflow_id not in self.active_workflows:
-            return {"error": "Workflow not found"}
+            # Failed, cancelled and stopped workflows are only known by their job
+            return (
+                job.progress() if job is not None else {"error": "Workflow not found"}
+            )
 
         context = self.active_workflows[workflow_id]
 
-        return {
+        status: Dict[str, Any] = {
             "workflow_id": workflow_id,
             "workflow_type": context.workflow_type.value,
             "campaign_id": context.campaign_id,
             "created_at": context.created_at.isoformat(),
-            "status": "active",  # This would be determined by actual workflow state
-            "current_metrics": await self._get_current_metrics(context)
+            "status": job.status.value if job is not None else "active",
         }
+        if job is not None:
+            status["progress"] = job.progress()
+        # Live metrics only exist once the campaign is being monitored
+        if job is None or job.status == JobStatus.MONITORING:
+            status["current_metrics"] = await self._get_current_metrics(context)
+        return status
 
     async def stop_workflow(self, workflow_id: str) -> bool:
-        """Stop a running workflow"""
+        """Stop a workflow, cancelling its stages if they are still queued or running"""
 
-        if workflow_id not in self.active_workflows:
-            return False
+        job = self.jobs.get(workflow_id)
+        cancelled = False
+        if job is not None and job.task is not None and not job.done:
+            job.task.cancel()
+            await job.wait()
+            cancelled = True
 
-        context = self.active_workflows[workflow_id]
+        # A cancelled job has already released its context
+        if not self._release_workflow(workflow_id):
+            return cancelled
 
-        # Cancel monitoring task if it exists
-        if "monitoring_task" in context.constraints:
-            monitoring_task = context.constraints["monitoring_task"]
-            monitoring_task.cancel()
-
-        # Clean up workflow
-        del self.active_workflows[workflow_id]
+        if job is not None and job.status == JobStatus.MONITORING:
+            job.status = JobStatus.STOPPED
+            self._retire_job(job)
 
         self.logger.info("Stopped workflow", workflow_id=workflow_id)
-        return True
\ No newline at end of file
+        return True
+
+    async def shutdown(self) -> None:
+        """Cancel every workflow, running or monitoring"""
+        for workflow_id in list(self.jobs) + list(self.active_workflows):
+            await self.stop_workflow(workflow_id)
@@ -0,0 +1,31 @@
+"""
+Shared fixtures for the test suite
+
+Everything time-dependent runs on a virtual clock, so step durations, timeouts
+and rate limits are simulated instead of waited for.
+"""
+
+from datetime import datetime
+import pytest
+
+from mcp_sequential_thinking.clock import VirtualClock
+from mcp_sequential_thinking.thinking import ThinkingContext
+
+# A Monday morning, inside the default active sending hours
+START = datetime(2026, 1, 5, 9, 0)
+
+
+@pytest.fixture
+def clock() -> VirtualClock:
+    return VirtualClock(start=START)
+
+
+@pytest.fixture
+def context() -> ThinkingContext:
+    return ThinkingContext(
+        campaign_id="campaign-test",
+        target_audience_size=650,
+        roi_target=2.0,
+        budget_limit=1000.0,
+        time_constraints={"max_duration_days": 7},
+    )
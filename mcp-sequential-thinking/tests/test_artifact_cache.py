@@ -0,0 +1,258 @@
+"""Stage artifact storage and invalidation when stage inputs change"""
+
+import os
+from typing import Any, Dict
+
+import pandas as pd
+import pytest
+
+from mcp_sequential_thinking.artifact_cache import (
+    StageArtifactCache,
+    file_digest,
+    make_key,
+    pa,
+)
+from mcp_sequential_thinking.data_pipeline import (
+    PAYMENT_HISTORY_SOURCE,
+    REPLY_HISTORY_SOURCE,
+)
+from mcp_sequential_thinking.workflows import (
+    JobStatus,
+    WorkflowContext,
+    WorkflowOrchestrator,
+    WorkflowType,
+)
+
+
+@pytest.fixture
+def cache(tmp_path) -> StageArtifactCache:
+    return StageArtifactCache(str(tmp_path / "artifacts"), use_arrow=pa is not None)
+
+
+def test_stores_and_loads_stage_outputs_with_frames(cache):
+    frame = pd.DataFrame({"student_id": [1, 2, 3], "segment": ["a", "b", "a"]})
+    key = make_key("segmentation", "1", {"n_clusters": 3})
+
+    assert cache.get(key) == (False, None)
+    cache.put(key, ({"total": 3}, frame))
+    hit, (summary, loaded) = cache.get(key)
+
+    assert hit
+    assert summary == {"total": 3}
+    pd.testing.assert_frame_equal(loaded, frame)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.parametrize("filename", ["result.pkl", "frame.pkl"])
+def test_tampered_pickles_are_discarded_unread(tmp_path, filename):
+    cache = StageArtifactCache(str(tmp_path / "artifacts"), use_arrow=False)
+    key = make_key("segmentation", "1", {})
+    cache.put(key, pd.DataFrame({"student_id": [1, 2]}))
+
+    path = os.path.join(cache.storage_path, key, filename)
+    with open(path, "r+b") as handle:
+        handle.seek(-1, os.SEEK_END)
+        last = handle.read(1)
+        handle.seek(-1, os.SEEK_END)
+        handle.write(bytes([last[0] ^ 0xFF]))
+
+    assert cache.get(key) == (False, None)
+    assert cache.keys() == []
+    assert cache.stats()["misses"] == 1
+
+
+def test_artifacts_from_another_signing_key_are_rejected(tmp_path):
+    storage_path = str(tmp_path / "artifacts")
+    key = make_key("segmentation", "1", {})
+    StageArtifactCache(storage_path, use_arrow=False, signing_key=b"a" * 32).put(
+        key, {"rows": 2}
+    )
+
+    assert StageArtifactCache(storage_path, use_arrow=False).get(key) == (False, None)
+
+
+def test_signing_key_is_kept_owner_only(tmp_path):
+    cache = StageArtifactCache(str(tmp_path / "artifacts"), use_arrow=False)
+    key_path = os.path.join(cache.storage_path, StageArtifactCache.SIGNING_KEY_FILE)
+
+    assert os.stat(key_path).st_mode & 0o777 == 0o600
+    assert cache.keys() == []
+    reopened = StageArtifactCache(cache.storage_path, use_arrow=False)
+    cache.put("k", {"rows": 2})
+    assert reopened.get("k") == (True, {"rows": 2})
+
+
+@pytest.mark.skipif(pa is not None, reason="pyarrow is installed")
+def test_cache_requires_pyarrow_unless_told_to_pickle(tmp_path):
+    with pytest.raises(ImportError, match="pyarrow"):
+        StageArtifactCache(str(tmp_path / "artifacts"))
+
+
+def test_key_changes_with_inputs_and_stage_version():
+    key = make_key(
+        "segmentation", "1", {"n_clusters": 3, "sources": {"students": "abc"}}
+    )
+
+    assert key == make_key(
+        "segmentation", "1", {"sources": {"students": "abc"}, "n_clusters": 3}
+    )
+    assert key != make_key(
+        "segmentation", "1", {"n_clusters": 4, "sources": {"students": "abc"}}
+    )
+    assert key != make_key(
+        "segmentation", "1", {"n_clusters": 3, "sources": {"students": "abd"}}
+    )
+    assert key != make_key(
+        "segmentation", "2", {"n_clusters": 3, "sources": {"students": "abc"}}
+    )
+
+
+def test_file_digest_follows_file_contents(tmp_path):
+    export = tmp_path / "students.csv"
+    export.write_text("student_id,name\n1,Ana\n")
+    digest = file_digest(str(export))
+
+    assert file_digest(str(export)) == digest
+    export.write_text("student_id,name\n1,Ana\n2,Bruno\n")
+    assert file_digest(str(export)) != digest
+    assert file_digest(str(tmp_path / "missing.csv")) is None
+
+
+async def test_stage_reruns_only_when_its_export_changes(tmp_path, cache, clock):
+    export = tmp_path / "students.csv"
+    export.write_text("student_id,name\n1,Ana\n")
+    orchestrator = WorkflowOrchestrator(clock=clock, artifact_cache=cache)
+    context = WorkflowContext(
+        workflow_id="workflow-test",
+        workflow_type=WorkflowType.USER_SEGMENTATION,
+        campaign_id="campaign-test",
+        data_sources={"students": str(export)},
+        target_metrics={},
+        constraints={},
+        created_at=clock.now(),
+    )
+    runs = []
+
+    async def segment() -> Dict[str, Any]:
+        runs.append(export.read_text())
+        return {"rows": len(runs)}
+
+    async def run_segmentation() -> Any:
+        key = await orchestrator._stage_key(context, "segmentation", {"n_clusters": 3})
+        return await orchestrator._run_stage(None, "segmentation", segment, key)
+
+    assert await run_segmentation() == {"rows": 1}
+    # Unchanged export: the stored artifact is loaded instead of recomputed
+    assert await run_segmentation() == {"rows": 1}
+    assert len(runs) == 1
+
+    export.write_text("student_id,name\n1,Ana\n2,Bruno\n")
+    assert await run_segmentation() == {"rows": 2}
+    assert len(runs) == 2
+    assert len(cache.keys()) == 2
+
+
+@pytest.mark.parametrize(
+    "use_arrow",
+    [
+        False,
+        pytest.param(
+            True, marks=pytest.mark.skipif(pa is None, reason="needs pyarrow")
+        ),
+    ],
+)
+def test_frame_indexes_survive_storage(tmp_path, use_arrow):
+    cache = StageArtifactCache(str(tmp_path / "artifacts"), use_arrow=use_arrow)
+    indexed = pd.DataFrame(
+        {"ltv": [120.0, 80.0]}, index=pd.Index(["s1", "s2"], name="student_id")
+    )
+    ranged = pd.DataFrame({"student_id": ["s1", "s2"]})
+    key = make_key("segmentation", "1", {})
+
+    cache.put(key, {"ltv": indexed, "members": ranged})
+    hit, loaded = cache.get(key)
+
+    assert hit
+    pd.testing.assert_frame_equal(loaded["ltv"], indexed)
+    pd.testing.assert_frame_equal(loaded["members"], ranged)
+
+
+def history_config(tmp_path) -> Dict[str, Any]:
+    students = tmp_path / "students.csv"
+    students.write_text("student_id,email,last_access\n1,a@example.com,2025-10-01\n")
+    payments = tmp_path / "payments.csv"
+    payments.write_text(
+        "payment_id,student_id,amount,paid_at,plan_type\n"
+        "p1,1,49.90,2025-09-01,mensal\n"
+    )
+    replies = tmp_path / "replies.csv"
+    replies.write_text("student_id,replied_at\n1,2025-12-30 10:15\n")
+    return {
+        "campaign_id": "campaign-test",
+        "target_audience_size": 1,
+        "roi_target": 2.0,
+        "budget_limit": 1000.0,
+        "time_constraints": {"max_duration_days": 7},
+        "data_sources": {
+            "students": str(students),
+            PAYMENT_HISTORY_SOURCE: str(payments),
+            REPLY_HISTORY_SOURCE: str(replies),
+        },
+        "target_metrics": {},
+        "constraints": {},
+    }
+
+
+async def run_campaign(orchestrator: WorkflowOrchestrator, config: Dict[str, Any]):
+    job = await orchestrator.start_campaign_workflow(config)
+    await job.wait()
+    assert job.status == JobStatus.MONITORING, job.error
+    await orchestrator.stop_workflow(job.workflow_id)
+    return job
+
+
+async def test_stored_stages_still_fold_their_histories(tmp_path, cache, clock):
+    config = history_config(tmp_path)
+    first = WorkflowOrchestrator(clock=clock, artifact_cache=cache)
+    await run_campaign(first, config)
+
+    # A new process starts with empty histories and loads every stage from disk
+    second = WorkflowOrchestrator(clock=clock, artifact_cache=cache)
+    job = await run_campaign(second, config)
+
+    assert job.cached_stages == ["sheets_processing", "segmentation", "scheduling"]
+    assert len(second.segmentation_engine.ltv_cache) == 1
+    assert second.scheduling_optimizer.response_histograms.replies_recorded == 1
+    assert (
+        second.segmentation_engine.ltv_cache.state_digest
+        == first.segmentation_engine.ltv_cache.state_digest
+    )
+
+    # The same histories again change nothing, so the stored stages still apply
+    job = await run_campaign(second, config)
+    assert second.scheduling_optimizer.response_histograms.replies_recorded == 1
+    assert job.cached_stages == ["sheets_processing", "segmentation", "scheduling"]
+
+
+async def test_stage_keys_follow_the_folded_histories(tmp_path, cache, clock):
+    config = history_config(tmp_path)
+    orchestrator = WorkflowOrchestrator(clock=clock, artifact_cache=cache)
+    await run_campaign(orchestrator, config)
+
+    # Replies recorded since the last run change the histograms, not the exports
+    await orchestrator.scheduling_optimizer.record_replies(
+        pd.DataFrame(
+            {"student_id": ["1"], "replied_at": [pd.Timestamp("2026-01-01 18:00")]}
+        )
+    )
+    job = await run_campaign(orchestrator, config)
+    assert job.cached_stages == ["sheets_processing", "segmentation"]
+
+    (tmp_path / "payments.csv").write_text(
+        "payment_id,student_id,amount,paid_at,plan_type\n"
+        "p1,1,49.90,2025-09-01,mensal\n"
+        "p2,1,49.90,2025-10-01,mensal\n"
+    )
+    job = await run_campaign(orchestrator, config)
+    assert job.cached_stages == ["sheets_processing"]
@@ -0,0 +1,149 @@
+"""Checkpoint journal replay and engine recovery after a crash"""
+
+import asyncio
+import pytest
+from typing import Any, Dict, List
+
+from mcp_sequential_thinking.checkpoint import CheckpointJournal
+from mcp_sequential_thinking.thinking import (
+    ThinkingEngine,
+    ThinkingStage,
+    ThinkingStatus,
+    ThinkingStep,
+    WhatsAppCampaignThinking,
+)
+
+
+def test_replay_returns_last_state_of_unfinished_patterns(tmp_path, clock):
+    path = str(tmp_path / "journal.db")
+    journal = CheckpointJournal(path, clock=clock)
+    journal.record_pattern_started("finished", "Template", {"campaign_id": "a"}, "high")
+    journal.record_pattern_finished("finished")
+    journal.record_pattern_started(
+        "unfinished", "Template", {"campaign_id": "b"}, "low"
+    )
+    journal.record_step_transition("unfinished", "first", "in_progress")
+    journal.record_step_transition(
+        "unfinished", "first", "completed", result={"value": 1}, duration_seconds=2.0
+    )
+    journal.record_step_transition("unfinished", "second", "in_progress")
+    journal.close()
+
+    # A new process sees everything committed before the old one went away
+    reopened = CheckpointJournal(path, clock=clock)
+    try:
+        records = reopened.replay()
+        assert [record["pattern_id"] for record in records] == ["unfinished"]
+        assert records[0]["priority"] == "low"
+        assert records[0]["context"] == {"campaign_id": "b"}
+        assert records[0]["steps"]["first"]["status"] == "completed"
+        assert records[0]["steps"]["first"]["result"] == {"value": 1}
+        assert records[0]["steps"]["first"]["duration_seconds"] == 2.0
+        assert records[0]["steps"]["second"]["status"] == "in_progress"
+
+        assert reopened.compact() == 2
+        assert [record["pattern_id"] for record in reopened.replay()] == ["unfinished"]
+    finally:
+        reopened.close()
+
+
+async def test_recover_resumes_only_unfinished_steps_after_crash(
+    tmp_path, clock, context
+):
+    path = str(tmp_path / "journal.db")
+    optimization_started = asyncio.Event()
+
+    async def run_step(step: ThinkingStep) -> Dict[str, Any]:
+        await clock.sleep(1)
+        return {"step": step.id}
+
+    async def hang(step: ThinkingStep) -> Dict[str, Any]:
+        optimization_started.set()
+        await asyncio.Event().wait()
+        return {}
+
+    journal = CheckpointJournal(path, clock=clock)
+    engine = ThinkingEngine(journal=journal, clock=clock)
+    for stage in ThinkingStage:
+        engine.register_stage_handler(stage, run_step)
+    engine.register_stage_handler(ThinkingStage.OPTIMIZATION, hang)
+
+    pattern = WhatsAppCampaignThinking.create(context, clock.now())
+    pattern_id = await engine.start_thinking(pattern)
+    await optimization_started.wait()
+    completed_before_crash = {
+        step.id for step in pattern.steps if step.status == ThinkingStatus.COMPLETED
+    }
+
+    # Simulated crash: the workers die mid-pattern and only the journal survives
+    for worker in engine.workers:
+        worker.cancel()
+    await asyncio.gather(*engine.workers, return_exceptions=True)
+    journal.close()
+
+    executed: List[str] = []
+
+    async def record_step(step: ThinkingStep) -> Dict[str, Any]:
+        executed.append(step.id)
+        return await run_step(step)
+
+    journal = CheckpointJournal(path, clock=clock)
+    engine = ThinkingEngine(journal=journal, clock=clock)
+    for stage in ThinkingStage:
+        engine.register_stage_handler(stage, record_step)
+
+    try:
+        assert await engine.recover() == [pattern_id]
+        await engine.thinking_queue.join()
+
+        resumed = engine.get_pattern(pattern_id)
+        all_steps = {step.id for step in resumed.steps}
+        assert completed_before_crash and completed_before_crash != all_steps
+        # Completed work is restored from the journal, everything else runs exactly once
+        assert sorted(executed) == sorted(all_steps - completed_before_crash)
+        assert all(step.status == ThinkingStatus.COMPLETED for step in resumed.steps)
+        for step in resumed.steps:
+            if step.id in completed_before_crash:
+                assert step.result == {"step": step.id}
+
+        assert await asyncio.to_thread(journal.replay) == []
+    finally:
+        await engine.shutdown()
+
+
+async def test_journal_is_compacted_as_patterns_finish(tmp_path, clock, context):
+    async def run_step(step: ThinkingStep) -> Dict[str, Any]:
+        await clock.sleep(1)
+        return {"step": step.id}
+
+    journal = CheckpointJournal(str(tmp_path / "journal.db"), clock=clock)
+    engine = ThinkingEngine(journal=journal, clock=clock, journal_compact_every=2)
+    for stage in ThinkingStage:
+        engine.register_stage_handler(stage, run_step, cacheable=False)
+
+    def journal_rows() -> int:
+        journal.flush()
+        with journal._lock:
+            return journal.connection.execute(
+                "SELECT COUNT(*) FROM journal"
+            ).fetchone()[0]
+
+    try:
+        await engine.start_thinking(
+            WhatsAppCampaignThinking.create(context, clock.now())
+        )
+        await engine.thinking_queue.join()
+        # One finished pattern is below the interval, so its events are still there
+        assert await asyncio.to_thread(journal_rows) > 0
+
+        await engine.start_thinking(
+            WhatsAppCampaignThinking.create(context, clock.now())
+        )
+        await engine.thinking_queue.join()
+        assert await asyncio.to_thread(journal_rows) == 0
+    finally:
+        await engine.shutdown()
+
+    # Shutdown closes the journal after committing what was queued
+    with pytest.raises(RuntimeError, match="closed"):
+        journal.record_pattern_finished("late")
@@ -0,0 +1,301 @@
+"""Student export cleaning"""
+
+from datetime import datetime
+import pandas as pd
+import pytest
+
+from mcp_sequential_thinking.data_pipeline import (
+    InactivitySegment,
+    ProfileSample,
+    build_inactivity_report,
+    classify_activity,
+    clean_student_data,
+    merge_chunk_reports,
+    merge_inactivity_summaries,
+    normalize_names,
+    normalize_phone_numbers,
+    parse_dates,
+    stream_student_export,
+    summarize_inactivity,
+    validate_emails,
+)
+from conftest import START
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        "(11) 98765-4321",
+        "11987654321",
+        "+55 11 98765-4321",
+        "0055 11 98765 4321",
+        "011987654321",
+        "tel: 11 98765 4321 ☎",
+    ],
+)
+def test_spellings_of_one_number_normalize_to_e164(raw):
+    assert normalize_phone_numbers(pd.Series([raw])).tolist() == ["+5511987654321"]
+
+
+def test_landlines_and_foreign_numbers():
+    phones = pd.Series(["11 3456-7890", "+1 (415) 555-2671"])
+
+    assert normalize_phone_numbers(phones).tolist() == [
+        "+551134567890",
+        "+14155552671",
+    ]
+    assert normalize_phone_numbers(
+        pd.Series(["(415) 555-2671"]), default_country_code="1"
+    ).tolist() == ["+14155552671"]
+
+
+@pytest.mark.parametrize("raw", [None, "", "abc", "1234", "+55119876543210000"])
+def test_unrecoverable_numbers_are_missing(raw):
+    assert normalize_phone_numbers(pd.Series([raw], dtype=object)).isna().all()
+
+
+def test_keeps_index_and_mixes_valid_with_invalid():
+    phones = pd.Series(["(11) 98765-4321", None, "123"], index=[10, 20, 30])
+
+    normalized = normalize_phone_numbers(phones)
+
+    assert list(normalized.index) == [10, 20, 30]
+    assert normalized[10] == "+5511987654321"
+    assert normalized[[20, 30]].isna().all()
+
+
+def test_emails_are_lowercased_and_invalid_ones_dropped():
+    emails = pd.Series([" Ana@Example.COM ", "ana@", "no at sign", None])
+
+    validated = validate_emails(emails)
+
+    assert validated[0] == "ana@example.com"
+    assert validated[1:].isna().all()
+
+
+def test_mixed_date_formats_parse_and_garbage_becomes_nat():
+    dates = pd.Series(["2024-03-05", "05/03/2024", "05.03.2024 ", "yesterday", None])
+
+    parsed = parse_dates(dates)
+
+    assert parsed[:3].tolist() == [pd.Timestamp("2024-03-05")] * 3
+    assert parsed[3:].isna().all()
+
+
+def test_names_are_title_cased_with_lowercase_particles():
+    names = pd.Series(["  maria   DA silva ", "JOÃO DOS SANTOS", "   "])
+
+    normalized = normalize_names(names)
+
+    assert normalized[:2].tolist() == ["Maria da Silva", "João dos Santos"]
+    assert pd.isna(normalized[2])
+
+
+def student(student_id, email, phone, last_access, **fields):
+    return {
+        "student_id": student_id,
+        "name": "aluno",
+        "email": email,
+        "phone": phone,
+        "registration_date": "2023-01-10",
+        "last_payment": "2024-01-10",
+        "last_access": last_access,
+        "plan_type": " Mensal ",
+        "status": "ACTIVE",
+        **fields,
+    }
+
+
+def test_cleaning_keeps_the_most_recent_record_and_drops_the_unreachable():
+    raw = pd.DataFrame(
+        [
+            student("1", "ana@example.com", "11987654321", "2024-01-01"),
+            student("1", "ana@example.com", "11987654321", "2024-02-01"),
+            student("2", "ANA@example.com", None, "2024-03-01"),
+            student("3", "bad-email", "123", "2024-01-15"),
+            student("4", None, "(11) 3456-7890", "not a date"),
+        ]
+    )
+
+    cleaned, report = clean_student_data(raw)
+
+    assert cleaned["student_id"].tolist() == ["2", "4"]
+    assert cleaned.loc[0, "email"] == "ana@example.com"
+    assert cleaned.loc[0, "last_access"] == pd.Timestamp("2024-03-01")
+    assert cleaned.loc[1, "phone"] == "+551134567890"
+    assert pd.isna(cleaned.loc[1, "last_access"])
+    assert cleaned["plan_type"].tolist() == ["mensal", "mensal"]
+    assert report["raw_records"] == 5
+    assert report["cleaned_records"] == 2
+    assert report["records_removed"] == 3
+    assert report["issues_resolved"] == {
+        "duplicate_ids_merged": 1,
+        "duplicate_emails_merged": 1,
+        "invalid_phone_numbers_flagged": 1,
+        "invalid_emails_flagged": 1,
+        "unparsed_dates": {
+            "registration_date": 0,
+            "last_payment": 0,
+            "last_access": 1,
+        },
+        "unreachable_records_removed": 1,
+    }
+    assert report["quality_score"] == round(1 - 3 / 25, 4)
+
+
+def write_export(path, rows):
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return str(path)
+
+
+def test_streaming_keeps_what_batch_cleaning_keeps(tmp_path):
+    # Y loses its id to the more recent Z in another file, which frees its
+    # email for X; deduplicating chunk by chunk would have dropped X as well
+    first = [
+        student("y", "a@example.com", None, "2024-03-01"),
+        student("x", "a@example.com", None, "2024-02-01"),
+        student("1", "one@example.com", "11987654321", "2024-01-01"),
+        student(None, "one@example.com", None, "2024-05-01"),
+        student("2", "two@example.com", None, None),
+    ]
+    second = [
+        student("y", "b@example.com", None, "2024-04-01"),
+        student("1", None, "11987654321", "2024-01-01"),
+        student("2", "two@example.com", "11 3456-7890", None),
+        student("3", None, None, "2024-01-01"),
+    ]
+    paths = [
+        write_export(tmp_path / "first.csv", first),
+        write_export(tmp_path / "second.csv", second),
+    ]
+    batch, batch_report = clean_student_data(pd.DataFrame(first + second))
+
+    streamed = list(stream_student_export(paths, START, chunk_size=2))
+    report = merge_chunk_reports([chunk_report for _, chunk_report in streamed])
+    ids = pd.concat([chunk for chunk, _ in streamed])["student_id"].fillna("-")
+
+    # Student 1 keeps its older record, which then loses its email to the id-less one
+    assert ids.tolist() == batch["student_id"].fillna("-").tolist()
+    assert ids.tolist() == ["x", "-", "2", "y"]
+    assert report["cleaned_records"] == batch_report["cleaned_records"]
+    for issue in ("duplicate_ids_merged", "duplicate_emails_merged"):
+        assert (
+            report["issues_resolved"][issue] == batch_report["issues_resolved"][issue]
+        )
+
+
+def test_streaming_rejects_exports_without_contact_columns(tmp_path):
+    path = write_export(tmp_path / "export.csv", [{"student_id": "1"}])
+
+    with pytest.raises(ValueError, match="missing required columns"):
+        next(stream_student_export([path], START))
+
+
+def profiles(start, count):
+    return pd.DataFrame({"student_id": [str(n) for n in range(start, start + count)]})
+
+
+def test_profile_sample_holds_everything_below_capacity():
+    sample = ProfileSample(capacity=10)
+
+    sample.add(profiles(0, 4))
+    sample.add(profiles(4, 0))
+    sample.add(profiles(4, 3))
+
+    assert sample.seen == 7
+    assert sample.profiles["student_id"].tolist() == [str(n) for n in range(7)]
+
+
+def test_profile_sample_stays_at_capacity_and_is_uniform():
+    inclusions = pd.Series(0, index=[str(n) for n in range(20)])
+    for seed in range(400):
+        sample = ProfileSample(capacity=5, seed=seed)
+        for start in range(0, 20, 3):
+            sample.add(profiles(start, min(3, 20 - start)))
+
+        assert sample.seen == 20
+        assert len(sample.profiles) == 5
+        assert sample.profiles["student_id"].is_unique
+        inclusions[sample.profiles["student_id"]] += 1
+
+    # Every student is sampled with probability 5 / 20, i.e. about 100 times
+    assert inclusions.between(60, 140).all()
+
+
+def activity(last_payment, last_access):
+    return pd.DataFrame(
+        {
+            "last_payment": pd.to_datetime(pd.Series(last_payment)),
+            "last_access": pd.to_datetime(pd.Series(last_access)),
+        }
+    )
+
+
+def test_students_are_bucketed_by_their_most_recent_activity():
+    reference = datetime(2024, 6, 30)
+    frame = activity(
+        ["2024-06-20", "2024-05-31", "2024-01-01", "2024-04-15", None, None],
+        [None, "2024-04-01", "2024-05-15", "2024-04-10", "2024-03-01", None],
+    )
+
+    classified = classify_activity(frame, reference)
+
+    assert classified["inactivity_segment"].tolist() == [
+        "active",
+        "recent",
+        "recent",
+        "moderate",
+        "critical",
+        "critical",
+    ]
+    assert classified["is_inactive"].tolist() == [False] + [True] * 5
+    assert classified["days_since_last_payment"].iloc[:2].tolist() == [10.0, 30.0]
+
+
+def test_custom_segments_and_invalid_bounds():
+    reference = datetime(2024, 6, 30)
+    segments = (InactivitySegment("lapsed", 7, 0.5), InactivitySegment("gone", 14, 0.1))
+    frame = activity(["2024-06-25", "2024-06-20", "2024-06-01"], [None] * 3)
+
+    classified = classify_activity(frame, reference, segments)
+
+    assert classified["inactivity_segment"].tolist() == ["active", "lapsed", "gone"]
+    for invalid in ((), tuple(reversed(segments))):
+        with pytest.raises(ValueError, match="strictly increasing"):
+            classify_activity(frame, reference, invalid)
+
+
+def test_inactivity_report_from_merged_chunk_summaries():
+    reference = datetime(2024, 6, 30)
+    frame = activity(
+        ["2024-06-20", "2024-05-21", "2024-05-01", None, "2024-01-01"],
+        ["2024-06-20", None, "2024-05-11", None, "2024-03-01"],
+    )
+    classified = classify_activity(frame, reference)
+
+    summary = merge_inactivity_summaries(
+        [
+            summarize_inactivity(classified.iloc[:2]),
+            summarize_inactivity(classified[2:]),
+        ]
+    )
+    report = build_inactivity_report(summary)
+
+    assert summary == summarize_inactivity(classified)
+    assert report["count"] == 4
+    assert report["activity_analysis"] == {
+        "total_students": 5,
+        "active_students": 1,
+        "inactive_share": 0.8,
+    }
+    assert report["segments"]["recent"] == {
+        "count": 2,
+        "criteria": "inactive_30_60_days",
+        "avg_last_payment_days": 50.0,
+        "avg_last_access_days": 50.0,
+        "reactivation_probability": 0.35,
+    }
+    assert report["segments"]["critical"]["criteria"] == "inactive_90_plus_days"
+    assert report["segments"]["critical"]["avg_last_payment_days"] == 181.0
+    assert report["segments"]["moderate"]["count"] == 0
+    assert report["segments"]["moderate"]["avg_last_access_days"] is None
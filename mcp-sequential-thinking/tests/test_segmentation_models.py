@@ -0,0 +1,383 @@
+"""Behavioral clustering and segment economics"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mcp_sequential_thinking.data_pipeline import clean_payment_history
+from mcp_sequential_thinking.segmentation_models import (
+    FEATURE_NAMES,
+    LifetimeValueCache,
+    REACTIVATION_FEATURES,
+    MiniBatchKMeans,
+    ReactivationModel,
+    SegmentEconomics,
+    allocate_budget,
+    cluster_students,
+    default_segment_economics,
+    probability_report,
+    sampled_cluster_quality,
+    segment_economics_from_profiles,
+)
+
+CENTERS = np.array([[0.0, 0.0], [10.0, 0.0], [0.0, 10.0]])
+
+
+def blobs(sizes, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.concatenate(
+        [
+            center + rng.normal(0.0, 0.5, (size, 2))
+            for center, size in zip(CENTERS, sizes)
+        ]
+    )
+
+
+def test_kmeans_finds_separated_clusters():
+    features = blobs([300, 300, 300])
+
+    model = MiniBatchKMeans(n_clusters=3, batch_size=256).fit(features)
+    labels = model.predict(features, block_size=100)
+
+    found = model.centers_in_feature_units()
+    nearest = np.sqrt(((CENTERS[:, None] - found[None]) ** 2).sum(axis=2)).min(axis=1)
+    assert nearest.max() < 0.5
+    assert model.iterations < model.max_iterations
+    # Every blob lands in a cluster of its own
+    assert [len(set(labels[start : start + 300])) for start in (0, 300, 600)] == [1] * 3
+    assert len(set(labels)) == 3
+
+
+def test_kmeans_with_fewer_distinct_points_than_clusters():
+    features = np.array([[1.0, 2.0]] * 5 + [[3.0, 4.0]] * 5)
+
+    model = MiniBatchKMeans(n_clusters=4).fit(features)
+
+    assert len(model.fitted_centers) == 4
+    assert set(model.predict(features)) <= {0, 1, 2, 3}
+    assert len(set(model.predict(features))) == 2
+
+
+def test_kmeans_rejects_invalid_use():
+    with pytest.raises(ValueError):
+        MiniBatchKMeans(n_clusters=0)
+    with pytest.raises(ValueError, match="empty"):
+        MiniBatchKMeans().fit(np.empty((0, 2)))
+    with pytest.raises(ValueError, match="fitted"):
+        MiniBatchKMeans().predict(np.zeros((1, 2)))
+
+
+def test_sampled_quality_separates_good_and_bad_clusterings():
+    features = blobs([200, 200, 200])
+    labels = np.repeat(np.arange(3), 200)
+    random_labels = np.random.default_rng(1).integers(0, 3, len(features))
+
+    good = sampled_cluster_quality(features, labels, CENTERS, sample_size=300)
+    bad = sampled_cluster_quality(
+        features, random_labels, features[:3] * 0.01, sample_size=300
+    )
+
+    assert good["sample_size"] == 300
+    assert good["silhouette_score"] > 0.8
+    assert good["intra_cluster_similarity"] > 0.8
+    assert good["inter_cluster_separation"] > 0.5
+    assert bad["silhouette_score"] < 0.1
+
+
+def student_profiles_of(days_inactive, plan_types):
+    count = len(days_inactive)
+    return pd.DataFrame(
+        {
+            "student_id": [str(n) for n in range(count)],
+            "plan_type": plan_types,
+            "days_since_last_payment": days_inactive,
+            "days_since_last_access": days_inactive,
+            "tenure_days": np.full(count, 365.0),
+            "monthly_frequency": np.where(np.asarray(days_inactive) < 30, 12.0, 1.0),
+        }
+    )
+
+
+def test_cluster_students_numbers_clusters_by_decreasing_size():
+    days = [5.0] * 60 + [120.0] * 30 + [400.0] * 10
+    plans = ["mensal"] * 60 + ["anual"] * 30 + ["trimestral"] * 10
+    profiles = student_profiles_of(days, plans)
+
+    labels, report = cluster_students(profiles, n_clusters=3)
+
+    assert report["clusters_identified"] == 3
+    assert report["cluster_sizes"] == [60, 30, 10]
+    assert labels.tolist() == [0] * 60 + [1] * 30 + [2] * 10
+    assert report["features"] == list(FEATURE_NAMES)
+    first = report["cluster_profiles"][0]
+    assert first["share"] == 0.6
+    assert first["days_inactive"] == 5.0
+    assert first["plan_value"] == 149.9
+    assert report["actionable_share"] == 1.0
+    assert report["quality"]["silhouette_score"] > 0.9
+
+
+def payments(rows):
+    return clean_payment_history(
+        pd.DataFrame(
+            rows, columns=["payment_id", "student_id", "amount", "paid_at", "plan_type"]
+        )
+    )
+
+
+HISTORY = [
+    ("p1", "1", "149,90", "2024-01-05", "mensal"),
+    ("p2", "1", "149,90", "2024-02-05", "mensal"),
+    ("p3", "2", "1198.80", "2024-01-10", "anual"),
+]
+
+
+def test_resent_history_only_adds_new_payments():
+    cache = LifetimeValueCache()
+    assert cache.add_payments(payments(HISTORY)) == 2
+    ltv = cache.lifetime_values(pd.Series(["1", "2"]))
+
+    # The new payment has no id, which must not change the keys of the others
+    resent = HISTORY + [(None, "2", "99.90", "2024-03-10", "anual")]
+    digest = cache.state_digest
+    assert cache.add_payments(payments(resent)) == 1
+    assert cache.state_digest != digest
+    digest = cache.state_digest
+    assert cache.add_payments(payments(resent)) == 0
+    assert cache.state_digest == digest
+
+    assert cache.students.loc["1", "payment_count"] == 2
+    assert cache.students.loc["2", "payment_count"] == 2
+    assert cache.students.loc["2", "total_paid"] == pytest.approx(1298.70)
+    assert cache.lifetime_values(pd.Series(["1"]))[0] == ltv[0]
+    assert cache.lifetime_values(pd.Series(["2"]))[0] > ltv[1]
+
+
+def test_payments_repeated_within_a_batch_count_once():
+    cache = LifetimeValueCache()
+    batch = HISTORY[:1] * 2 + [(None, "3", "149.90", "2024-01-01", "mensal")] * 2
+
+    assert cache.add_payments(payments(batch)) == 2
+
+    assert cache.students.loc["1", "payment_count"] == 1
+    assert cache.students.loc["3", "total_paid"] == pytest.approx(149.90)
+    assert cache.report()["students_valued"] == 2
+
+
+def logistic_history(rows=4000, seed=3):
+    """Outcomes driven by payment recency and visit frequency, other features noise"""
+    rng = np.random.default_rng(seed)
+    features = rng.normal(50.0, 10.0, (rows, len(REACTIVATION_FEATURES)))
+    days = features[:, REACTIVATION_FEATURES.index("days_since_last_payment")]
+    frequency = features[:, REACTIVATION_FEATURES.index("monthly_frequency")]
+    logits = -0.15 * (days - 50.0) + 0.08 * (frequency - 50.0)
+    outcomes = rng.random(rows) < 1.0 / (1.0 + np.exp(-logits))
+    return features, outcomes, logits
+
+
+def test_trained_model_recovers_the_outcome_probabilities():
+    features, outcomes, logits = logistic_history()
+
+    model = ReactivationModel.train(features, outcomes)
+
+    expected = 1.0 / (1.0 + np.exp(-logits))
+    assert np.abs(model.predict_proba(features) - expected).mean() < 0.03
+    assert model.key_predictors()[:2] == [
+        "days_since_last_payment",
+        "monthly_frequency",
+    ]
+    # Standardization is folded into the raw coefficients
+    standardized = (features - model.mean) / model.scale
+    assert model.predict_proba(features) == pytest.approx(
+        1.0 / (1.0 + np.exp(-(standardized @ model.coefficients + model.intercept)))
+    )
+
+
+def test_model_weights_round_trip_through_a_file(tmp_path):
+    features, outcomes, _ = logistic_history(rows=500)
+    model = ReactivationModel.train(features, outcomes)
+    path = str(tmp_path / "reactivation.npy")
+
+    model.save(path)
+    loaded = ReactivationModel.load(path)
+
+    assert loaded.predict_proba(features) == pytest.approx(
+        model.predict_proba(features)
+    )
+    with pytest.raises(ValueError, match="shape"):
+        ReactivationModel.load(path, REACTIVATION_FEATURES[:2])
+
+
+def test_model_rejects_mismatched_inputs():
+    with pytest.raises(ValueError):
+        ReactivationModel.train(np.zeros((3, 2)), np.zeros(2))
+    with pytest.raises(ValueError):
+        ReactivationModel(np.zeros(2), np.ones(2), np.zeros(2), 0.0)
+
+
+def test_profiles_are_scored_on_the_model_features():
+    profiles = student_profiles_of([10.0, 200.0], ["mensal", "anual"]).assign(
+        ltv=[1500.0, 100.0]
+    )
+    coefficients = np.zeros(len(REACTIVATION_FEATURES))
+    coefficients[REACTIVATION_FEATURES.index("days_since_last_payment")] = -1.0
+    model = ReactivationModel(
+        np.zeros(len(coefficients)), np.full(len(coefficients), 50.0), coefficients, 0.0
+    )
+
+    probabilities = model.score_profiles(profiles)
+
+    assert probabilities == pytest.approx(1.0 / (1.0 + np.exp([0.2, 4.0])))
+
+
+def test_probability_report_buckets_scores():
+    report = probability_report(np.array([0.9, 0.7, 0.5, 0.3, 0.1]))
+
+    assert report["students_scored"] == 5
+    assert report["expected_reactivations"] == 2.5
+    assert report["prediction_confidence"] == 0.48
+    assert report["probability_distribution"] == {
+        "high_probability": {"count": 2, "avg_prob": 0.8},
+        "medium_probability": {"count": 2, "avg_prob": 0.4},
+        "low_probability": {"count": 1, "avg_prob": 0.1},
+    }
+    assert probability_report(np.array([]))["prediction_confidence"] == 0.0
+
+
+def profit(result):
+    return result["expected_revenue"] - result["total_spend"]
+
+
+def test_funds_segments_in_order_of_return():
+    segments = [
+        SegmentEconomics("best", 100, 0.10, 100.0, (1.0,)),
+        SegmentEconomics("good", 100, 0.05, 100.0, (1.0,)),
+        SegmentEconomics("unprofitable", 100, 0.005, 100.0, (1.0,)),
+    ]
+
+    result = allocate_budget(segments, 150.0)
+
+    allocations = result["allocations"]
+    assert allocations["best"]["spend"] == 100.0
+    assert allocations["best"]["students_reached"] == 100
+    # The block crossing the budget is funded partially
+    assert allocations["good"]["spend"] == 50.0
+    assert allocations["good"]["students_reached"] == 50
+    assert allocations["unprofitable"]["spend"] == 0.0
+    assert result["expected_revenue"] == 1250.0
+    assert result["unallocated"] == 0.0
+
+
+def test_never_funds_blocks_returning_less_than_they_cost():
+    segment = SegmentEconomics(
+        "only", 100, 0.10, 100.0, (1.0, 2.0, 4.0), touch_decay=0.5
+    )
+
+    result = allocate_budget([segment], 10_000.0)
+
+    # Third touch returns 2.5 per message at a cost of 4, so it stays unfunded
+    allocation = result["allocations"]["only"]
+    assert allocation["touches_funded"] == 2
+    assert allocation["messages"] == 200
+    assert result["total_spend"] == 300.0
+    assert result["unallocated"] == 9700.0
+
+
+@pytest.mark.parametrize("budget", [0.0, 1.0, 250.0, 1_000.0, 5_000.0, 1e9])
+def test_spend_stays_within_budget_and_segment_capacity(budget):
+    segments = default_segment_economics()
+
+    result = allocate_budget(segments, budget)
+
+    assert result["total_spend"] <= budget + 0.01
+    assert result["total_spend"] + result["unallocated"] == pytest.approx(
+        budget, abs=0.01
+    )
+    for segment in segments:
+        allocation = result["allocations"][segment.name]
+        assert (
+            0.0
+            <= allocation["spend"]
+            <= segment.size * sum(segment.message_costs) + 0.01
+        )
+        assert allocation["students_reached"] <= segment.size
+
+
+def test_no_feasible_allocation_earns_more():
+    rng = np.random.default_rng(7)
+    segments = [
+        SegmentEconomics(
+            f"segment_{index}",
+            int(rng.integers(50, 500)),
+            float(rng.uniform(0.01, 0.2)),
+            float(rng.uniform(20.0, 200.0)),
+            tuple(np.sort(rng.uniform(0.2, 2.0, 3))),
+            touch_decay=float(rng.uniform(0.3, 0.9)),
+        )
+        for index in range(4)
+    ]
+    budget = 800.0
+    best = profit(allocate_budget(segments, budget))
+
+    costs = np.array([segment.message_costs for segment in segments])
+    sizes = np.array([segment.size for segment in segments], dtype=float)[:, None]
+    decay = np.array([segment.touch_decay for segment in segments])[
+        :, None
+    ] ** np.arange(costs.shape[1])
+    revenue_per_message = (
+        np.array([segment.conversion_rate * segment.ltv for segment in segments])[
+            :, None
+        ]
+        * decay
+    )
+
+    # Random feasible plans: follow-ups never reach more students than the touch before
+    for _ in range(2000):
+        funded = np.minimum.accumulate(rng.uniform(0.0, 1.0, costs.shape), axis=1)
+        spend = (funded * sizes * costs).sum()
+        if spend > budget:
+            funded *= budget / spend
+        messages = funded * sizes
+        assert (messages * (revenue_per_message - costs)).sum() <= best + 0.05
+
+
+def test_rejects_invalid_inputs():
+    with pytest.raises(ValueError):
+        allocate_budget(default_segment_economics(), -1.0)
+    with pytest.raises(ValueError):
+        allocate_budget([SegmentEconomics("free", 10, 0.1, 10.0, (0.0,))], 100.0)
+
+    empty = allocate_budget([], 100.0)
+    assert empty["allocations"] == {}
+    assert empty["unallocated"] == 100.0
+
+
+@pytest.mark.filterwarnings("error")
+def test_empty_segments_with_short_cost_curves_are_left_unfunded():
+    segments = [
+        SegmentEconomics("empty", 0, 0.5, 100.0, (1.0,)),
+        SegmentEconomics("full", 10, 0.5, 100.0, (1.0, 1.0)),
+    ]
+
+    result = allocate_budget(segments, 100.0)
+
+    assert result["allocations"]["empty"]["spend"] == 0.0
+    assert result["allocations"]["full"]["messages"] == 20
+
+
+def test_segment_sizes_of_a_sample_scale_to_the_population():
+    profiles = pd.DataFrame(
+        {
+            "reactivation_probability": [0.9, 0.9, 0.5, 0.1, np.nan],
+            "ltv": [1000.0, 1000.0, np.nan, 100.0, 500.0],
+        }
+    )
+
+    sampled = segment_economics_from_profiles(profiles)
+    scaled = segment_economics_from_profiles(profiles, population=500)
+
+    # The missing LTV is the median of the scored students, enough for priority 2
+    assert [segment.size for segment in sampled] == [2, 1, 0, 1]
+    assert [segment.size for segment in scaled] == [200, 100, 0, 100]
+    assert [segment.conversion_rate for segment in scaled] == [0.9, 0.5, 0.0, 0.1]
+    assert scaled[1].ltv == 1000.0
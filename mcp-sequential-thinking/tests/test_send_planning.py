@@ -0,0 +1,210 @@
+"""Token buckets and rate-limited send planning"""
+
+from datetime import datetime, timedelta
+from typing import List
+import numpy as np
+import pandas as pd
+import pytest
+
+from mcp_sequential_thinking.send_planning import (
+    HOURS_PER_WEEK,
+    MAX_BIN_COUNT,
+    WHATSAPP_BUSINESS_LIMITS,
+    PlannedSend,
+    RateLimit,
+    ResponseHistograms,
+    SendPlanner,
+    SendRequest,
+    TokenBucket,
+    active_slot_mask,
+    add_counts,
+)
+from conftest import START
+
+
+def offsets(sends: List[PlannedSend]) -> List[float]:
+    return [(send.send_at - START).total_seconds() for send in sends]
+
+
+def max_in_window(times: List[float], period: float) -> int:
+    return max(
+        sum(1 for other in times if start <= other < start + period) for start in times
+    )
+
+
+def test_token_bucket_recycles_tokens_one_period_after_use():
+    bucket = TokenBucket(RateLimit(2, 10))
+
+    assert bucket.ready_at(0.0) == 0.0
+    bucket.take(0.0)
+    bucket.take(3.0)
+    # Both tokens are spent; the first comes back ten seconds after it was taken
+    assert bucket.ready_at(4.0) == 10.0
+    bucket.take(10.0)
+    assert bucket.ready_at(10.0) == 13.0
+    assert bucket.ready_at(20.0) == 20.0
+
+
+def test_token_bucket_rejects_invalid_limits():
+    with pytest.raises(ValueError):
+        TokenBucket(RateLimit(0, 60))
+    with pytest.raises(ValueError):
+        TokenBucket(RateLimit(5, 0))
+
+
+def test_plan_sends_at_the_earliest_instant_every_limit_allows():
+    planner = SendPlanner((RateLimit(2, 10), RateLimit(5, 100)), active_hours=None)
+
+    sends = list(planner.plan([SendRequest("segment", 12, priority=1)], START))
+
+    assert offsets(sends) == [0, 0, 10, 10, 20, 100, 100, 110, 110, 120, 200, 200]
+    assert [send.recipient for send in sends] == list(range(12))
+
+
+def test_plan_never_exceeds_whatsapp_limits_in_any_window():
+    planner = SendPlanner(WHATSAPP_BUSINESS_LIMITS, active_hours=None)
+    requests = [
+        SendRequest("urgent", 150, priority=0, touches=2, follow_up_seconds=600),
+        SendRequest("regular", 300, priority=1),
+    ]
+
+    times = offsets(list(planner.plan(requests, START)))
+
+    assert len(times) == 600
+    assert times == sorted(times)
+    for limit in WHATSAPP_BUSINESS_LIMITS:
+        assert max_in_window(times, limit.period_seconds) <= limit.capacity
+
+
+def test_plan_orders_by_priority_and_waits_for_active_hours():
+    planner = SendPlanner((RateLimit(1, 60),), active_hours=(9, 21))
+    start = START.replace(hour=20, minute=57)
+    requests = [
+        SendRequest("low", 2, priority=2),
+        SendRequest("high", 2, priority=0, touches=2, follow_up_seconds=120),
+    ]
+
+    sends = list(planner.plan(requests, start))
+
+    assert [(send.segment, send.recipient, send.touch) for send in sends] == [
+        ("high", 0, 0),
+        ("high", 1, 0),
+        ("high", 0, 1),
+        ("high", 1, 1),
+        ("low", 0, 0),
+        ("low", 1, 0),
+    ]
+    # The follow-up is due two minutes after the first touch
+    assert sends[2].send_at - sends[0].send_at == timedelta(minutes=2)
+    # Sending stops at 21:00 and resumes when the next day opens
+    assert sends[3].send_at == datetime(2026, 1, 6, 9, 0)
+    assert all(9 <= send.send_at.hour < 21 for send in sends)
+
+
+def test_plan_waits_for_each_recipients_send_slot():
+    planner = SendPlanner((RateLimit(10, 60),), active_hours=None)
+    # Tuesday 10:00, no preference, and Monday 09:00 which is already open
+    request = SendRequest(
+        "segment",
+        3,
+        priority=1,
+        touches=2,
+        follow_up_seconds=86400,
+        send_slots=np.array([34, -1, 9]),
+    )
+
+    sends = list(planner.plan([request], START))
+
+    assert [(send.recipient, send.touch, send.send_at) for send in sends] == [
+        (1, 0, datetime(2026, 1, 5, 9, 0)),
+        (2, 0, datetime(2026, 1, 5, 9, 0)),
+        (1, 1, datetime(2026, 1, 6, 9, 0)),
+        (0, 0, datetime(2026, 1, 6, 10, 0)),
+        # Follow-ups wait a day, then for the recipient's slot to come round again
+        (2, 1, datetime(2026, 1, 12, 9, 0)),
+        (0, 1, datetime(2026, 1, 13, 10, 0)),
+    ]
+
+
+def test_send_slots_must_match_the_recipients():
+    with pytest.raises(ValueError):
+        SendRequest("segment", 3, priority=1, send_slots=np.array([34, -1]))
+
+
+def replies(*rows) -> pd.DataFrame:
+    """Replies from (student_id, replied_at, segment, repeats) rows"""
+    return pd.DataFrame(
+        [
+            {"student_id": student, "replied_at": pd.Timestamp(at), "segment": segment}
+            for student, at, segment, repeats in rows
+            for _ in range(repeats)
+        ]
+    )
+
+
+def test_replies_update_contact_segment_and_overall_histograms():
+    histograms = ResponseHistograms()
+
+    histograms.add_replies(
+        replies(
+            ("a", "2026-01-06 10:15", "seg", 3),
+            ("b", "2026-01-07 15:40", None, 1),
+        )
+    )
+    histograms.add_replies(replies(("a", "2026-01-13 10:05", "seg", 1)))
+
+    assert list(histograms.contacts) == ["a", "b"]
+    # Tuesday 10:00 is slot 34, Wednesday 15:00 slot 63
+    assert histograms.contact_counts[0, 34] == 4
+    assert histograms.contact_counts[1, 63] == 1
+    assert histograms.contact_counts.sum() == 5
+    assert list(histograms.segment_counts) == ["seg"]
+    assert histograms.segment_counts["seg"][34] == 4
+    assert histograms.segment_counts["seg"].sum() == 4
+    assert histograms.overall_counts[[34, 63]].tolist() == [4, 1]
+    assert histograms.replies_recorded == 5
+
+
+def test_full_histogram_rows_are_halved_instead_of_overflowing():
+    histograms = np.zeros((2, HOURS_PER_WEEK), dtype=np.uint16)
+    histograms[0, :2] = [MAX_BIN_COUNT, 10]
+    histograms[1, 0] = 7
+
+    add_counts(
+        histograms, np.array([0, HOURS_PER_WEEK]), np.array([2, 1], dtype=np.int64)
+    )
+
+    assert histograms[0, :2].tolist() == [(MAX_BIN_COUNT + 2) // 2, 5]
+    assert histograms[1, 0] == 8
+
+
+def test_best_slots_fall_back_to_the_segment_then_all_replies():
+    histograms = ResponseHistograms(min_replies=3)
+    histograms.add_replies(
+        replies(
+            ("a", "2026-01-06 10:00", "seg", 3),
+            ("b", "2026-01-07 15:00", "other", 1),
+            ("c", "2026-01-08 11:00", "seg", 4),
+            ("d", "2026-01-09 16:00", None, 5),
+        )
+    )
+
+    # a has enough replies of its own; b and unknown contacts take the segment's
+    assert histograms.best_slots(pd.Series(["a", "b", "z"]), "seg").tolist() == [
+        34,
+        83,
+        83,
+    ]
+    # Without segment history the busiest slot overall wins, Friday 16:00
+    assert histograms.best_slots(pd.Series(["b"]), "unknown").tolist() == [112]
+    allowed = np.ones(HOURS_PER_WEEK, dtype=bool)
+    allowed[83] = False
+    assert histograms.best_slots(pd.Series(["c"]), "seg", allowed).tolist() == [34]
+    assert ResponseHistograms().best_slots(pd.Series(["a"])).tolist() == [-1]
+
+
+def test_active_slots_cover_the_active_hours_of_every_day():
+    mask = active_slot_mask((9, 21))
+
+    assert mask.sum() == 7 * 12
+    assert mask[9] and not mask[8] and not mask[21] and mask[24 * 6 + 20]
@@ -0,0 +1,806 @@
+"""Dependency-graph execution of thinking patterns"""
+
+from dataclasses import asdict
+from datetime import timedelta
+from typing import Any, Dict, List, Sequence
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+import pytest
+
+from conftest import START
+from mcp_sequential_thinking.checkpoint import CheckpointJournal
+from mcp_sequential_thinking.clock import VirtualClock
+from mcp_sequential_thinking.thinking import (
+    CompiledPlan,
+    DurationEstimator,
+    PatternIndex,
+    StepResultCache,
+    ThinkingContext,
+    ThinkingEngine,
+    ThinkingPattern,
+    ThinkingStage,
+    ThinkingStatus,
+    ThinkingStep,
+    WhatsAppCampaignThinking,
+)
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+
+
+class StepRecorder:
+    """Stage handler that records when each step runs on the virtual clock
+
+    A step sleeps ``metadata["seconds"]`` and raises when ``metadata["fail"]`` is set.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self.started: Dict[str, float] = {}
+        self.finished: Dict[str, float] = {}
+
+    async def run(self, step: ThinkingStep) -> Dict[str, Any]:
+        self.started[step.id] = self.clock.time()
+        await self.clock.sleep(step.metadata.get("seconds", 1))
+        self.finished[step.id] = self.clock.time()
+        if step.metadata.get("fail"):
+            raise RuntimeError(f"{step.id} failed")
+        return {"step": step.id}
+
+
+@pytest.fixture
+async def engine(clock):
+    engine = ThinkingEngine(clock=clock)
+    yield engine
+    await engine.shutdown()
+
+
+@pytest.fixture
+def recorder(engine, clock) -> StepRecorder:
+    recorder = StepRecorder(clock)
+    for stage in ThinkingStage:
+        engine.register_stage_handler(stage, recorder.run)
+    return recorder
+
+
+def make_step(
+    clock: VirtualClock, step_id: str, dependencies: Sequence[str] = (), **metadata: Any
+) -> ThinkingStep:
+    return ThinkingStep(
+        id=step_id,
+        stage=ThinkingStage.ANALYSIS,
+        description=step_id,
+        inputs=[],
+        outputs=[],
+        dependencies=list(dependencies),
+        metadata=metadata,
+        timestamp=clock.now(),
+    )
+
+
+def make_pattern(
+    context: ThinkingContext, steps: List[ThinkingStep]
+) -> ThinkingPattern:
+    return ThinkingPattern(
+        name="Test Pattern",
+        description="Ad-hoc dependency graph",
+        steps=steps,
+        context=context,
+        success_criteria={},
+        failure_conditions=[],
+        optimization_triggers=[],
+    )
+
+
+async def run_pattern(engine: ThinkingEngine, pattern: ThinkingPattern) -> str:
+    pattern_id = await engine.start_thinking(pattern)
+    await engine.thinking_queue.join()
+    return pattern_id
+
+
+def test_compile_orders_steps_in_dependency_waves(clock):
+    plan = CompiledPlan.compile(
+        "diamond",
+        [
+            make_step(clock, "d", ["b", "c"]),
+            make_step(clock, "b", ["a"]),
+            make_step(clock, "c", ["a"]),
+            make_step(clock, "a"),
+        ],
+    )
+
+    assert [[plan.step_ids[position] for position in wave] for wave in plan.waves] == [
+        ["a"],
+        ["b", "c"],
+        ["d"],
+    ]
+    order = [plan.step_ids[position] for position in plan.topological_order]
+    assert order.index("a") < order.index("b") < order.index("d")
+    assert order.index("c") < order.index("d")
+
+
+def test_compile_rejects_cycles_and_unknown_dependencies(clock):
+    with pytest.raises(ValueError, match="cycle"):
+        CompiledPlan.compile(
+            "cycle", [make_step(clock, "a", ["b"]), make_step(clock, "b", ["a"])]
+        )
+    with pytest.raises(ValueError, match="unknown step"):
+        CompiledPlan.compile("dangling", [make_step(clock, "a", ["missing"])])
+
+
+def test_compile_finds_the_critical_path_by_estimated_duration(clock):
+    steps = [
+        make_step(clock, "a"),
+        make_step(clock, "b", ["a"]),
+        make_step(clock, "c", ["a"]),
+        make_step(clock, "d", ["b", "c"]),
+    ]
+    for step, minutes in zip(steps, (1, 2, 10, 1)):
+        step.estimated_duration = timedelta(minutes=minutes)
+
+    plan = CompiledPlan.compile("diamond", steps)
+
+    assert [plan.step_ids[position] for position in plan.critical_path] == [
+        "a",
+        "c",
+        "d",
+    ]
+    assert plan.critical_path_duration == timedelta(minutes=12)
+    assert plan.describe()["stages"] == {"analysis": ["a", "b", "c", "d"]}
+
+
+def test_plans_are_compiled_once_and_patterns_share_no_state(clock, context):
+    plan = WhatsAppCampaignThinking.compiled_plan()
+    assert WhatsAppCampaignThinking.compiled_plan() is plan
+
+    first = WhatsAppCampaignThinking.create(context, clock.now())
+    second = WhatsAppCampaignThinking.create(context, clock.now())
+    first.steps[0].errors.append("boom")
+    first.steps[0].dependencies.append("extra")
+
+    assert second.steps[0].errors == []
+    assert list(second.steps[0].dependencies) == list(
+        plan.descriptors[0]["dependencies"]
+    )
+    assert [step.id for step in first.steps] == list(plan.step_ids)
+
+
+def test_compact_step_reads_do_not_allocate_errors_or_metadata(engine, clock, context):
+    plan = WhatsAppCampaignThinking.compiled_plan()
+    store = engine.state_store(plan)
+    pattern = WhatsAppCampaignThinking.create(context, clock.now(), state_store=store)
+
+    for step in pattern.steps:
+        assert not step.errors
+        assert step.metadata.get("cache_hit") is None
+    assert store.errors == {} and store.metadata == {}
+
+    step = pattern.steps[0]
+    step.errors = [*step.errors, "boom"]
+    step.metadata = {**step.metadata, "cache_hit": True}
+    assert step.errors == ["boom"]
+    assert step.metadata == {"cache_hit": True}
+    assert len(store.errors) == len(store.metadata) == 1
+
+
+async def test_steps_start_once_their_dependencies_complete(
+    engine, recorder, clock, context
+):
+    pattern = make_pattern(
+        context,
+        [
+            make_step(clock, "a", seconds=2),
+            make_step(clock, "b", ["a"], seconds=5),
+            make_step(clock, "c", ["a"], seconds=1),
+            make_step(clock, "d", ["b", "c"], seconds=1),
+        ],
+    )
+
+    start = clock.time()
+    await run_pattern(engine, pattern)
+
+    assert all(step.status == ThinkingStatus.COMPLETED for step in pattern.steps)
+    # Independent branches run concurrently as soon as their shared dependency finishes
+    assert recorder.started["b"] == recorder.started["c"] == recorder.finished["a"]
+    assert recorder.started["d"] == max(recorder.finished["b"], recorder.finished["c"])
+    # Wall clock follows the critical path a -> b -> d, not the sum of all steps
+    assert recorder.finished["d"] - start == 8
+
+
+async def test_failed_step_blocks_only_its_dependents(engine, recorder, clock, context):
+    pattern = make_pattern(
+        context,
+        [
+            make_step(clock, "a"),
+            make_step(clock, "b", ["a"], fail=True),
+            make_step(clock, "c", ["a"]),
+            make_step(clock, "d", ["b", "c"]),
+            make_step(clock, "e", ["d"]),
+            make_step(clock, "f", ["c"]),
+        ],
+    )
+
+    pattern_id = await run_pattern(engine, pattern)
+    steps = {step.id: step for step in pattern.steps}
+
+    assert steps["b"].status == ThinkingStatus.FAILED
+    assert steps["b"].errors == ["b failed"]
+    for step_id in ("d", "e"):
+        assert steps[step_id].status == ThinkingStatus.FAILED
+        assert step_id not in recorder.started
+    assert steps["d"].errors == ["Blocked by failed dependency: b"]
+    assert steps["e"].errors == ["Blocked by failed dependency: b"]
+    for step_id in ("a", "c", "f"):
+        assert steps[step_id].status == ThinkingStatus.COMPLETED
+
+    # Every step reached a terminal status, so the pattern is archived as failed
+    assert pattern_id in engine.completed_patterns
+    assert engine.find_patterns(status=ThinkingStatus.FAILED) == [pattern_id]
+
+
+async def test_cancelled_execution_returns_running_steps_to_pending(
+    clock, context, tmp_path
+):
+    path = str(tmp_path / "journal.db")
+    engine = ThinkingEngine(clock=clock, journal=CheckpointJournal(path, clock=clock))
+    recorder = StepRecorder(clock)
+    for stage in ThinkingStage:
+        engine.register_stage_handler(stage, recorder.run)
+    pattern = make_pattern(
+        context,
+        [
+            make_step(clock, "a"),
+            make_step(clock, "b", seconds=60),
+            make_step(clock, "c", ["a"], seconds=60),
+            make_step(clock, "d", ["c"]),
+        ],
+    )
+
+    pattern_id = await engine.start_thinking(pattern)
+    await clock.sleep(5)
+    await engine.shutdown()
+
+    steps = {step.id: step for step in pattern.steps}
+    assert steps["a"].status == ThinkingStatus.COMPLETED
+    for step_id in ("b", "c", "d"):
+        assert steps[step_id].status == ThinkingStatus.PENDING
+    counts = engine.pattern_progress[pattern_id].status_counts
+    assert counts[ThinkingStatus.IN_PROGRESS] == 0
+    assert counts[ThinkingStatus.PENDING] == 3
+
+    # The journal agrees, so recovery reruns the interrupted steps
+    journal = CheckpointJournal(path, clock=clock)
+    try:
+        (record,) = journal.replay()
+        assert record["steps"]["a"]["status"] == "completed"
+        assert record["steps"]["b"]["status"] == "pending"
+        assert record["steps"]["c"]["status"] == "pending"
+    finally:
+        journal.close()
+
+
+def test_stage_handlers_must_be_async_unless_offloaded(engine):
+    def blocking(step: ThinkingStep) -> Dict[str, Any]:
+        return {}
+
+    with pytest.raises(ValueError, match="must be async"):
+        engine.register_stage_handler(ThinkingStage.ANALYSIS, blocking)
+    with pytest.raises(ValueError, match="Unknown offload mode"):
+        engine.register_stage_handler(ThinkingStage.ANALYSIS, blocking, offload="gpu")
+
+    executor = engine.register_stage_handler(
+        ThinkingStage.ANALYSIS, blocking, offload="thread"
+    )
+    assert engine.stage_executors[ThinkingStage.ANALYSIS] is executor
+
+
+async def test_stage_concurrency_is_bounded_per_stage(engine, clock, context):
+    running: List[str] = []
+    peak = 0
+
+    async def handler(step: ThinkingStep) -> Dict[str, Any]:
+        nonlocal peak
+        running.append(step.id)
+        peak = max(peak, len(running))
+        await clock.sleep(1)
+        running.remove(step.id)
+        return {}
+
+    engine.register_stage_handler(ThinkingStage.ANALYSIS, handler, max_concurrency=2)
+    pattern = make_pattern(context, [make_step(clock, f"s{i}") for i in range(5)])
+
+    start = clock.time()
+    await run_pattern(engine, pattern)
+
+    assert peak == 2
+    assert clock.time() - start == 3
+    assert all(step.status == ThinkingStatus.COMPLETED for step in pattern.steps)
+
+
+async def test_stage_timeout_fails_the_step(engine, recorder, clock, context):
+    engine.register_stage_handler(
+        ThinkingStage.ANALYSIS, recorder.run, timeout=timedelta(seconds=5)
+    )
+    pattern = make_pattern(context, [make_step(clock, "slow", seconds=60)])
+
+    await run_pattern(engine, pattern)
+
+    step = pattern.steps[0]
+    assert step.status == ThinkingStatus.FAILED
+    assert step.errors == ["analysis handler exceeded 5s timeout"]
+    assert step.actual_duration == timedelta(seconds=5)
+
+
+async def test_offloaded_handlers_run_in_the_thread_pool(engine, clock, context):
+    def blocking(step: ThinkingStep) -> Dict[str, Any]:
+        return {"thread": threading.current_thread().name}
+
+    engine.register_stage_handler(ThinkingStage.ANALYSIS, blocking, offload="thread")
+    pattern = make_pattern(context, [make_step(clock, "a")])
+
+    await run_pattern(engine, pattern)
+
+    assert pattern.steps[0].result["thread"].startswith("thinking-stage")
+
+
+def test_step_cache_expires_entries_after_their_ttl(clock):
+    cache = StepResultCache(ttl=timedelta(seconds=10), clock=clock)
+    cache.put("key", {"value": 1})
+
+    clock.advance(10)
+    assert cache.get("key") == (True, {"value": 1})
+    clock.advance(1)
+    assert cache.get("key") == (False, None)
+    assert cache.stats()["entries"] == 0
+
+
+def test_step_cache_evicts_the_least_recently_used_entry(clock):
+    cache = StepResultCache(max_entries=2, clock=clock)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.get("c") == (True, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_step_cache_keys_are_stable_across_processes():
+    inputs = "{'declared_inputs': ['x'], 'tags': {'vip', 'lapsed', 'gold'}, 'n': 3}"
+    script = (
+        "from mcp_sequential_thinking.thinking import StepResultCache;"
+        f"print(StepResultCache.make_key('step', '1', {inputs}))"
+    )
+    keys = {
+        subprocess.run(
+            [sys.executable, "-c", script],
+            capture_output=True,
+            text=True,
+            check=True,
+            env={**os.environ, "PYTHONHASHSEED": seed, "PYTHONPATH": SRC},
+        ).stdout.strip()
+        for seed in ("1", "2", "3")
+    }
+
+    assert len(keys) == 1
+
+
+def test_step_cache_rejects_tampered_files(clock, tmp_path):
+    StepResultCache(storage_path=str(tmp_path), clock=clock).put("key", [1, 2])
+    path = tmp_path / "key.pkl"
+
+    # A fresh process reads the signed file back
+    assert StepResultCache(storage_path=str(tmp_path), clock=clock).get("key") == (
+        True,
+        [1, 2],
+    )
+    assert (tmp_path / StepResultCache.SIGNING_KEY_FILE).stat().st_mode & 0o077 == 0
+
+    data = bytearray(path.read_bytes())
+    data[-2] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    assert StepResultCache(storage_path=str(tmp_path), clock=clock).get("key") == (
+        False,
+        None,
+    )
+    assert not path.exists()
+
+
+async def test_cache_hits_are_flagged_in_duration_statistics(
+    engine, recorder, clock, context
+):
+    for _ in range(2):
+        await run_pattern(
+            engine, make_pattern(context, [make_step(clock, "a", seconds=4)])
+        )
+
+    stats = engine.get_duration_statistics()["Test Pattern:a"]
+    # The hit did not count as a zero-second execution ...
+    assert stats["samples"] == 1
+    assert stats["cache_hit_rate"] == pytest.approx(0.2)
+    # ... but it does lower the expected time of the next run
+    assert stats["p50_seconds"] == pytest.approx(4 * 0.8)
+
+
+async def test_finished_patterns_are_archived_with_their_status(
+    engine, recorder, clock, context
+):
+    pattern_id = await run_pattern(
+        engine, make_pattern(context, [make_step(clock, "a"), make_step(clock, "b")])
+    )
+
+    assert pattern_id not in engine.active_patterns
+    assert pattern_id in engine.completed_patterns
+    status = await engine.get_pattern_status(pattern_id)
+    assert status["lifecycle"] == "completed"
+    assert status["completed_steps"] == 2
+    assert status["current_stage"] == "completed"
+
+
+async def test_archive_evicts_the_oldest_patterns_beyond_its_limits(clock, context):
+    engine = ThinkingEngine(
+        clock=clock, max_completed_patterns=2, completed_retention=timedelta(hours=1)
+    )
+    engine.register_stage_handler(ThinkingStage.ANALYSIS, StepRecorder(clock).run)
+    try:
+        pattern_ids = [
+            await run_pattern(
+                engine, make_pattern(context, [make_step(clock, f"s{index}")])
+            )
+            for index in range(3)
+        ]
+
+        assert list(engine.completed_patterns) == pattern_ids[1:]
+        assert await engine.get_pattern_status(pattern_ids[0]) == {
+            "error": "Pattern not found"
+        }
+        assert pattern_ids[0] not in engine.pattern_progress
+        assert engine.find_patterns(campaign_id=context.campaign_id) == sorted(
+            pattern_ids[1:]
+        )
+
+        # Past the retention window every archived pattern is dropped
+        clock.advance(3601)
+        assert engine.find_patterns(campaign_id=context.campaign_id) == []
+        assert not engine.completed_patterns
+    finally:
+        await engine.shutdown()
+
+
+def test_duration_estimator_learns_log_normal_quantiles():
+    estimator = DurationEstimator()
+    fallback = timedelta(minutes=5)
+    assert estimator.quantiles("step", fallback) == (300.0, 300.0)
+
+    for seconds in (10, 10, 10):
+        estimator.observe("step", timedelta(seconds=seconds))
+    p50, p90 = estimator.quantiles("step", fallback)
+    assert p50 == pytest.approx(10) and p90 == pytest.approx(10)
+
+    estimator.observe("step", timedelta(seconds=40))
+    p50, p90 = estimator.quantiles("step", fallback)
+    assert 10 < p50 < 40
+    assert p90 > p50
+
+
+async def test_eta_follows_the_remaining_critical_path(
+    engine, recorder, clock, context
+):
+    def diamond(thinking_context: ThinkingContext) -> ThinkingPattern:
+        steps = [
+            make_step(clock, "a", seconds=2),
+            make_step(clock, "b", ["a"], seconds=5),
+            make_step(clock, "c", ["a"], seconds=1),
+            make_step(clock, "d", ["b", "c"], seconds=1),
+        ]
+        for step, minutes in zip(steps, (1, 2, 10, 1)):
+            step.estimated_duration = timedelta(minutes=minutes)
+        return make_pattern(thinking_context, steps)
+
+    # Unseen steps fall back to their declared estimates: a -> c -> d
+    pattern_id = await engine.start_thinking(diamond(context))
+    status = await engine.get_pattern_status(pattern_id)
+    assert status["estimated_remaining_seconds"] == {"p50": 720.0, "p90": 720.0}
+    await engine.thinking_queue.join()
+
+    # Learned durations move the critical path to a -> b -> d
+    other = ThinkingContext(**{**asdict(context), "campaign_id": "campaign-other"})
+    pattern_id = await engine.start_thinking(diamond(other))
+    status = await engine.get_pattern_status(pattern_id)
+    assert status["estimated_remaining_seconds"]["p50"] == pytest.approx(8)
+    assert status["estimated_completion"] == clock.now() + timedelta(
+        seconds=status["estimated_remaining_seconds"]["p50"]
+    )
+
+
+def test_pattern_index_moves_patterns_between_buckets():
+    index = PatternIndex()
+    index.update("p1", "campaign-a", "analysis", "pending")
+    index.update("p2", "campaign-a", "planning", "in_progress")
+    index.update("p3", "campaign-b", "planning", "in_progress")
+
+    assert index.find(campaign_id="campaign-a") == {"p1", "p2"}
+    assert index.find(stage="planning", status="in_progress") == {"p2", "p3"}
+    assert index.find(campaign_id="campaign-b", stage="analysis") == set()
+    assert index.find() == {"p1", "p2", "p3"}
+
+    index.update("p1", "campaign-a", "planning", "in_progress")
+    assert index.find(stage="analysis") == set()
+    assert "analysis" not in index.by_stage
+
+    index.remove("p2")
+    assert index.find(campaign_id="campaign-a") == {"p1"}
+    assert index.summary()["by_status"] == {"in_progress": 2}
+
+
+async def test_engine_index_follows_step_transitions(engine, recorder, clock, context):
+    pattern = make_pattern(
+        context,
+        [
+            make_step(clock, "a"),
+            ThinkingStep(
+                id="b",
+                stage=ThinkingStage.PLANNING,
+                description="b",
+                inputs=[],
+                outputs=[],
+                dependencies=["a"],
+                timestamp=clock.now(),
+            ),
+        ],
+    )
+    pattern_id = await engine.start_thinking(pattern)
+    assert engine.find_patterns(stage=ThinkingStage.ANALYSIS, status="pending") == [
+        pattern_id
+    ]
+
+    await engine.thinking_queue.join()
+
+    assert engine.find_patterns(stage=ThinkingStage.ANALYSIS) == []
+    assert engine.find_patterns(
+        campaign_id=context.campaign_id, stage="completed", status="completed"
+    ) == [pattern_id]
+    assert engine.get_index_summary()["by_campaign"] == {context.campaign_id: 1}
+
+
+CAMPAIGN_TEMPLATE = WhatsAppCampaignThinking.PATTERN_NAME
+
+
+async def test_schedules_fire_on_their_cron_expression(
+    engine, recorder, clock, context
+):
+    await engine.schedule_pattern(CAMPAIGN_TEMPLATE, context, "*/5 * * * *")
+
+    await clock.sleep(11 * 60)
+
+    [schedule] = engine.list_schedules()
+    assert schedule["fire_count"] == 2
+    assert schedule["last_fired_at"] == START + timedelta(minutes=10)
+    assert schedule["next_fire_at"] == START + timedelta(minutes=15)
+    assert len(engine.find_patterns(campaign_id=context.campaign_id)) == 2
+
+
+async def test_readded_schedule_does_not_fire_its_stale_entry(
+    engine, recorder, clock, context
+):
+    schedule_id = await engine.schedule_pattern(
+        CAMPAIGN_TEMPLATE, context, "*/5 * * * *"
+    )
+    assert engine.unschedule_pattern(schedule_id)
+    await engine.schedule_pattern(CAMPAIGN_TEMPLATE, context, "*/5 * * * *")
+
+    await clock.sleep(6 * 60)
+
+    assert engine.list_schedules()[0]["fire_count"] == 1
+    assert len(engine.find_patterns(campaign_id=context.campaign_id)) == 1
+
+
+async def test_failed_fire_does_not_stop_the_scheduler(
+    engine, recorder, clock, context, monkeypatch
+):
+    fire = engine._fire_schedule
+    calls = 0
+
+    async def flaky_fire(schedule: Any) -> None:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("template broke")
+        await fire(schedule)
+
+    monkeypatch.setattr(engine, "_fire_schedule", flaky_fire)
+    await engine.schedule_pattern(CAMPAIGN_TEMPLATE, context, "*/5 * * * *")
+
+    await clock.sleep(11 * 60)
+
+    assert calls == 2
+    assert engine.list_schedules()[0]["fire_count"] == 1
+    assert not engine._scheduler_task.done()
+
+
+async def test_full_queue_skips_fires_instead_of_blocking(clock, context):
+    async def hang(step: ThinkingStep) -> Dict[str, Any]:
+        await asyncio.Event().wait()
+        return {}
+
+    engine = ThinkingEngine(
+        clock=clock,
+        max_concurrent_patterns=1,
+        max_queue_size=1,
+        queue_full_policy="wait",
+    )
+    for stage in ThinkingStage:
+        engine.register_stage_handler(stage, hang)
+    try:
+        # One pattern hangs in the only worker, the next one fills the queue
+        await engine.start_thinking(
+            WhatsAppCampaignThinking.create(context, clock.now())
+        )
+        await asyncio.sleep(0)
+        await engine.start_thinking(
+            WhatsAppCampaignThinking.create(context, clock.now())
+        )
+
+        for campaign_id in ("campaign-a", "campaign-b"):
+            await engine.schedule_pattern(
+                CAMPAIGN_TEMPLATE,
+                ThinkingContext(**{**asdict(context), "campaign_id": campaign_id}),
+                "*/5 * * * *",
+            )
+        await clock.sleep(6 * 60)
+
+        # Both fires were skipped and the loop moved on to the next fire time
+        for schedule in engine.list_schedules():
+            assert schedule["fire_count"] == 0
+            assert schedule["next_fire_at"] == START + timedelta(minutes=10)
+    finally:
+        await engine.shutdown()
+
+
+async def test_patterns_that_never_reach_the_queue_are_rolled_back(
+    clock, context, tmp_path
+):
+    async def hang(step: ThinkingStep) -> Dict[str, Any]:
+        await asyncio.Event().wait()
+        return {}
+
+    journal = CheckpointJournal(str(tmp_path / "journal.db"), clock=clock)
+    engine = ThinkingEngine(
+        clock=clock,
+        journal=journal,
+        max_concurrent_patterns=1,
+        max_queue_size=1,
+        queue_full_policy="wait",
+    )
+    for stage in ThinkingStage:
+        engine.register_stage_handler(stage, hang)
+    try:
+        # One pattern hangs in the only worker, the next one fills the queue
+        running = await engine.start_thinking(
+            WhatsAppCampaignThinking.create(context, clock.now())
+        )
+        await asyncio.sleep(0)
+        queued = await engine.start_thinking(
+            WhatsAppCampaignThinking.create(context, clock.now())
+        )
+
+        waiting = asyncio.create_task(
+            engine.start_thinking(WhatsAppCampaignThinking.create(context, clock.now()))
+        )
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        with pytest.raises(asyncio.QueueFull):
+            await engine.start_thinking(
+                WhatsAppCampaignThinking.create(context, clock.now()),
+                reject_when_full=True,
+            )
+
+        assert set(engine.active_patterns) == {running, queued}
+        assert sorted(engine.find_patterns(campaign_id="campaign-test")) == sorted(
+            [running, queued]
+        )
+        assert sorted(record["pattern_id"] for record in journal.replay()) == sorted(
+            [running, queued]
+        )
+    finally:
+        await engine.shutdown()
+        journal.close()
+
+
+async def test_subscription_streams_until_the_pattern_finishes(
+    engine, recorder, clock, context
+):
+    pattern = make_pattern(
+        context, [make_step(clock, "a"), make_step(clock, "b", ["a"])]
+    )
+    pattern_id = await engine.start_thinking(pattern)
+
+    events = [event async for event in engine.subscribe(pattern_id)]
+
+    assert [(event.step_id, event.status) for event in events] == [
+        ("a", "in_progress"),
+        ("a", "completed"),
+        ("b", "in_progress"),
+        ("b", "completed"),
+    ]
+    assert events[-1].pattern_finished
+    assert pattern_id not in engine._subscriptions
+
+
+async def test_late_subscriber_to_a_finished_pattern_returns(
+    engine, recorder, clock, context, monkeypatch
+):
+    # Every step is finished but the pattern is not archived yet, as while
+    # execute_pattern is still building its summary
+    monkeypatch.setattr(engine, "_archive_pattern", lambda pattern_id: None)
+    pattern_id = await run_pattern(
+        engine, make_pattern(context, [make_step(clock, "a")])
+    )
+    assert engine.pattern_progress[pattern_id].finished_at is None
+
+    async def collect() -> List[Any]:
+        return [event async for event in engine.subscribe(pattern_id)]
+
+    assert await asyncio.wait_for(collect(), timeout=1) == []
+
+
+async def test_unsubscribing_releases_the_subscription(
+    engine, recorder, clock, context
+):
+    pattern = make_pattern(
+        context, [make_step(clock, "a"), make_step(clock, "b", ["a"])]
+    )
+    pattern_id = await engine.start_thinking(pattern)
+
+    stream = engine.subscribe(pattern_id)
+    first = await stream.__anext__()
+    assert first.step_id == "a"
+    assert len(engine._subscriptions[pattern_id]) == 1
+
+    await stream.aclose()
+    assert pattern_id not in engine._subscriptions
+
+    # Execution carries on without the subscriber
+    await engine.thinking_queue.join()
+    assert all(step.status == ThinkingStatus.COMPLETED for step in pattern.steps)
+
+
+async def test_full_campaign_pattern_runs_on_the_virtual_clock(engine, clock, context):
+    pattern_id = await run_pattern(
+        engine, WhatsAppCampaignThinking.create(context, clock.now())
+    )
+
+    pattern = engine.get_pattern(pattern_id)
+    assert all(step.status == ThinkingStatus.COMPLETED for step in pattern.steps)
+    assert (await engine.get_pattern_status(pattern_id))["lifecycle"] == "completed"
+
+
+async def test_virtual_time_waits_for_offloaded_handlers(engine, clock, context):
+    def blocking(step: ThinkingStep) -> Dict[str, Any]:
+        time.sleep(0.2)
+        return {"step": step.id}
+
+    async def long_wait(step: ThinkingStep) -> Dict[str, Any]:
+        await clock.sleep(3600)
+        return {"step": step.id}
+
+    engine.register_stage_handler(
+        ThinkingStage.ANALYSIS, blocking, offload="thread", timeout=timedelta(minutes=1)
+    )
+    engine.register_stage_handler(ThinkingStage.PLANNING, long_wait)
+    planning = make_step(clock, "wait")
+    planning.stage = ThinkingStage.PLANNING
+    pattern = make_pattern(context, [make_step(clock, "thread"), planning])
+
+    await run_pattern(engine, pattern)
+
+    # The hour-long sleeper did not push virtual time past the thread's timeout
+    assert [step.status for step in pattern.steps] == [ThinkingStatus.COMPLETED] * 2
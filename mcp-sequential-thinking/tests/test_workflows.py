@@ -0,0 +1,346 @@
+"""Campaign workflow orchestration"""
+
+from datetime import timedelta
+import asyncio
+import time
+from typing import Any, Dict, List
+import numpy as np
+import pandas as pd
+import pytest
+
+from mcp_sequential_thinking.data_pipeline import clean_payment_history
+from mcp_sequential_thinking.segmentation_models import (
+    REACTIVATION_FEATURES,
+    LifetimeValueCache,
+    ReactivationModel,
+)
+from mcp_sequential_thinking.send_planning import ResponseHistograms
+from mcp_sequential_thinking.thinking import (
+    CompactSteps,
+    ThinkingEngine,
+    WhatsAppCampaignThinking,
+)
+from mcp_sequential_thinking.workflows import (
+    WORKFLOW_STAGES,
+    GoogleSheetsProcessor,
+    JobStatus,
+    MessageSchedulingOptimizer,
+    UserSegmentationEngine,
+    WorkflowContext,
+    WorkflowOrchestrator,
+    WorkflowType,
+)
+
+
+def campaign_config(campaign_id: str = "campaign-test") -> Dict[str, Any]:
+    return {
+        "campaign_id": campaign_id,
+        "target_audience_size": 650,
+        "roi_target": 2.0,
+        "budget_limit": 1000.0,
+        "time_constraints": {"max_duration_days": 7},
+        "data_sources": {},
+        "target_metrics": {},
+        "constraints": {},
+    }
+
+
+@pytest.fixture
+async def engine(clock):
+    engine = ThinkingEngine(clock=clock)
+    yield engine
+    await engine.shutdown()
+
+
+@pytest.fixture
+async def orchestrator(clock, engine):
+    orchestrator = WorkflowOrchestrator(clock=clock, thinking_engine=engine)
+    yield orchestrator
+    await orchestrator.shutdown()
+
+
+async def test_campaign_reuses_the_pattern_started_for_it(
+    orchestrator, engine, clock, context
+):
+    pattern = WhatsAppCampaignThinking.create(context, clock.now())
+    pattern_id = await engine.start_thinking(pattern)
+
+    job = await orchestrator.start_campaign_workflow(
+        campaign_config(), pattern_id=pattern_id
+    )
+
+    assert job.pattern_id == pattern_id
+    assert engine.find_patterns(campaign_id="campaign-test") == [pattern_id]
+
+
+async def test_campaign_without_a_pattern_starts_exactly_one(orchestrator, engine):
+    job = await orchestrator.start_campaign_workflow(campaign_config())
+
+    assert orchestrator.thinking_engine is engine
+    assert engine.find_patterns(campaign_id="campaign-test") == [job.pattern_id]
+    # Patterns started for campaigns keep their steps in the engine's compact store
+    pattern = engine.get_pattern(job.pattern_id)
+    assert pattern is not None and isinstance(pattern.steps, CompactSteps)
+    store = engine.state_store(WhatsAppCampaignThinking.compiled_plan())
+    assert store.active_slots == 1
+
+
+async def test_job_progress_covers_every_stage(orchestrator, clock):
+    job = await orchestrator.start_campaign_workflow(campaign_config())
+
+    await job.wait()
+
+    progress = job.progress()
+    assert job.status == JobStatus.MONITORING
+    assert progress["status"] == "monitoring"
+    assert list(progress["stage_durations"]) == list(WORKFLOW_STAGES)
+    assert progress["percent_complete"] == 100.0
+    assert progress["error"] is None
+    status = await orchestrator.get_workflow_status(job.workflow_id)
+    assert status["progress"] == progress
+    assert "current_metrics" in status
+
+
+async def test_stopping_running_and_queued_jobs_cancels_them(clock, engine):
+    orchestrator = WorkflowOrchestrator(
+        clock=clock, thinking_engine=engine, max_concurrent_workflows=1
+    )
+    try:
+        running = await orchestrator.start_campaign_workflow(
+            campaign_config("campaign-running")
+        )
+        queued = await orchestrator.start_campaign_workflow(
+            campaign_config("campaign-queued")
+        )
+        while running.stage is None:
+            await asyncio.sleep(0)
+
+        assert queued.status == JobStatus.QUEUED
+        assert await orchestrator.stop_workflow(queued.workflow_id)
+        assert queued.status == JobStatus.CANCELLED and queued.started_at is None
+        assert not running.done
+
+        stage = running.stage
+        assert await orchestrator.stop_workflow(running.workflow_id)
+        assert running.status == JobStatus.CANCELLED
+        assert running.stage == stage and stage not in running.stage_durations
+
+        assert not orchestrator.active_workflows
+        for job in (running, queued):
+            status = await orchestrator.get_workflow_status(job.workflow_id)
+            assert status["status"] == "cancelled"
+            assert status["finished_at"] is not None
+        assert not await orchestrator.stop_workflow(running.workflow_id)
+    finally:
+        await orchestrator.shutdown()
+
+
+@pytest.fixture
+def student_export(clock, tmp_path):
+    """Students last seen 0 to 99 days ago, one per day"""
+    path = tmp_path / "students.csv"
+    pd.DataFrame(
+        {
+            "student_id": [str(n) for n in range(100)],
+            "email": [f"student{n}@example.com" for n in range(100)],
+            "phone": None,
+            "last_access": [
+                (clock.now() - timedelta(days=n)).strftime("%Y-%m-%d")
+                for n in range(100)
+            ],
+        }
+    ).to_csv(path, index=False)
+    return str(path)
+
+
+def sheets_context(clock, export: str, streaming: bool) -> WorkflowContext:
+    return WorkflowContext(
+        workflow_id="workflow-test",
+        workflow_type=WorkflowType.GOOGLE_SHEETS_PROCESSING,
+        campaign_id="campaign-test",
+        data_sources={"students": export},
+        target_metrics={},
+        constraints={"streaming_ingestion": streaming},
+        created_at=clock.now(),
+    )
+
+
+async def test_inactive_students_are_counted_from_the_export(clock, student_export):
+    processor = GoogleSheetsProcessor(clock=clock, chunk_size=7)
+
+    batch, profiles = await processor.process_sheets_data_with_profiles(
+        sheets_context(clock, student_export, streaming=False)
+    )
+    streamed = await processor.process_sheets_data(
+        sheets_context(clock, student_export, streaming=True)
+    )
+
+    inactive = batch["processed_data"]["identify_inactive_students"]
+    assert batch["inactive_students"] == streamed["inactive_students"] == 70
+    assert inactive == streamed["processed_data"]["identify_inactive_students"]
+    assert {
+        name: segment["count"] for name, segment in inactive["segments"].items()
+    } == {
+        "recent": 30,
+        "moderate": 30,
+        "critical": 10,
+    }
+    # Accesses are at midnight and the clock at 9am, so days are 90.375 to 99.375
+    assert inactive["segments"]["critical"]["avg_last_access_days"] == 94.9
+    assert len(profiles) == 100
+    assert not processor.student_frames
+
+
+async def test_streamed_profiles_are_sampled_to_a_fixed_size(clock, student_export):
+    chunks = []
+    processor = GoogleSheetsProcessor(
+        clock=clock, chunk_size=7, profile_sample_size=10, chunk_sink=chunks.append
+    )
+
+    result, profiles = await processor.process_sheets_data_with_profiles(
+        sheets_context(clock, student_export, streaming=True)
+    )
+
+    cleaning = result["processed_data"]["clean_and_normalize"]
+    assert cleaning["cleaned_records"] == 100
+    assert sum(len(chunk) for chunk in chunks) == 100
+    assert len(profiles) == 10
+    assert profiles["student_id"].is_unique
+    assert not processor.profile_samples
+
+
+async def test_data_source_retries_back_off_on_the_processor_clock(
+    clock, student_export, monkeypatch
+):
+    processor = GoogleSheetsProcessor(clock=clock)
+    check = processor._check_data_sources
+    attempts = 0
+
+    async def flaky_check(context: WorkflowContext) -> Dict[str, Any]:
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise ConnectionError("sheets API unavailable")
+        return await check(context)
+
+    monkeypatch.setattr(processor, "_check_data_sources", flaky_check)
+    context = sheets_context(clock, student_export, streaming=False)
+    start, real_start = clock.time(), time.perf_counter()
+
+    result = await processor._validate_data_sources(context)
+
+    assert result["sources_validated"]
+    assert attempts == 3
+    # Two 4s back-offs and the 1s call, all in virtual time
+    assert clock.time() - start == 9
+    assert time.perf_counter() - real_start < 1
+
+
+async def test_segmentation_quality_is_measured_from_the_clusters(
+    clock, student_export
+):
+    processor = GoogleSheetsProcessor(clock=clock)
+    context = sheets_context(clock, student_export, streaming=False)
+    sheets, profiles = await processor.process_sheets_data_with_profiles(context)
+    engine = UserSegmentationEngine(clock=clock, n_clusters=3)
+
+    result = await engine.execute_segmentation(
+        context, sheets["processed_data"], profiles
+    )
+
+    quality = result["quality_metrics"]
+    assert 0.0 < quality["silhouette_score"] <= 1.0
+    assert quality["silhouette_score"] != 0.74
+    assert 0.0 < quality["business_relevance_score"] <= 1.0
+    assert not engine.student_profiles
+
+
+async def test_only_inactive_students_are_scored_for_reactivation(
+    clock, student_export
+):
+    processor = GoogleSheetsProcessor(clock=clock)
+    context = sheets_context(clock, student_export, streaming=False)
+    sheets, profiles = await processor.process_sheets_data_with_profiles(context)
+    # Every scored student comes back with probability 0.5
+    features = len(REACTIVATION_FEATURES)
+    model = ReactivationModel(
+        np.zeros(features), np.ones(features), np.zeros(features), 0.0
+    )
+    ltv_cache = LifetimeValueCache()
+    ltv_cache.add_payments(
+        clean_payment_history(
+            pd.DataFrame(
+                {
+                    "payment_id": ["p1"],
+                    "student_id": ["35"],
+                    "amount": ["49.90"],
+                    "paid_at": ["2025-11-01"],
+                    "plan_type": ["mensal"],
+                }
+            )
+        )
+    )
+    engine = UserSegmentationEngine(
+        clock=clock, reactivation_model=model, ltv_cache=ltv_cache
+    )
+
+    result = await engine.execute_segmentation(
+        context, sheets["processed_data"], profiles
+    )
+
+    sizes = {segment.name: segment.size for segment in result["segment_economics"]}
+    assert sum(sizes.values()) == 70
+    assert sizes["priority_3_price_sensitive"] == 70
+    assert result["segment_economics"][2].conversion_rate == 0.5
+    members = result["segment_members"]
+    assert len(members) == 70
+    assert (members["segment"] == "priority_3_price_sensitive").all()
+
+
+async def test_schedule_sends_each_member_in_their_best_slot(clock):
+    histograms = ResponseHistograms(min_replies=2)
+    histograms.add_replies(
+        pd.DataFrame(
+            {
+                "student_id": ["a", "a", "b", "b"],
+                # Tuesday 10:00 for a, Wednesday 15:00 for b
+                "replied_at": pd.to_datetime(
+                    [
+                        "2025-12-30 10:10",
+                        "2025-12-30 10:50",
+                        "2025-12-31 15:05",
+                        "2025-12-31 15:30",
+                    ]
+                ),
+            }
+        )
+    )
+    optimizer = MessageSchedulingOptimizer(clock=clock, response_histograms=histograms)
+    members = pd.DataFrame(
+        {
+            "student_id": ["b", "a", "c"],
+            "segment": ["priority_1_high_value"] * 3,
+            "reactivation_probability": [0.9, 0.8, 0.7],
+        }
+    )
+    segments = {"priority_1_high_value": {"students_reached": 2, "touches": 1}}
+    context = sheets_context(clock, "", streaming=False)
+
+    result = await optimizer.optimize_scheduling(context, segments, members)
+
+    def sent(count: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                "segment": "priority_1",
+                "count": count,
+                "message_type": "premium_welcome",
+            }
+        ]
+
+    assert result["master_schedule"] == {
+        "week_1": {
+            "tuesday 10:00-11:00": sent(1),
+            "wednesday 15:00-16:00": sent(1),
+        }
+    }
+    assert not optimizer.segment_members and not optimizer.send_plans